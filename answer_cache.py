@@ -0,0 +1,219 @@
+"""
+Semantic answer cache for the climate RAG pipeline.
+
+Answers are keyed on the query embedding, so reworded versions of the same
+question ("How hot will India get by 2050?" / "How will temperature change in
+India by 2050?") are served from disk instead of paying for retrieval plus a
+full llama3 generation. Each answer belongs to a variant (the response detail
+level), and a lookup only matches answers of its own variant.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Default cache settings
+CACHE_PATH = "answer_cache.sqlite3"
+SIMILARITY_THRESHOLD = 0.92     # cosine similarity needed for a hit
+MAX_ENTRIES = 500               # LRU eviction above this many answers
+TTL_SECONDS = 7 * 24 * 3600     # answers older than a week are dropped
+
+
+def index_fingerprint(index_dir):
+    # Cheap change detector for a saved index: file names, sizes and mtimes
+    digest = hashlib.sha256()
+    if os.path.isdir(index_dir):
+        for name in sorted(os.listdir(index_dir)):
+            path = os.path.join(index_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def text_fingerprint(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    def __init__(self, embed_model, path=CACHE_PATH, fingerprint="", threshold=SIMILARITY_THRESHOLD,
+                 max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS):
+        self.embed_model = embed_model
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        # Shared across Streamlit sessions, so the connection is used from several threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                generation_time REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                variant TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        # Cache files from before answer variants existed
+        if "variant" not in [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]:
+            with self._conn:
+                self._conn.execute("ALTER TABLE answers ADD COLUMN variant TEXT NOT NULL DEFAULT ''")
+        self._invalidate_if_stale(fingerprint)
+        self._load_embeddings()
+
+    # ---- bookkeeping -------------------------------------------------------
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _invalidate_if_stale(self, fingerprint):
+        # A new FAISS index or prompt template makes every stored answer suspect
+        if self._meta("fingerprint") != fingerprint:
+            with self._conn:
+                self._conn.execute("DELETE FROM answers")
+                self._set_meta("fingerprint", fingerprint)
+            print("Answer cache invalidated (index or prompt changed).")
+            return True
+        return False
+
+    def _load_embeddings(self):
+        rows = self._conn.execute("SELECT id, embedding, variant FROM answers").fetchall()
+        self._ids = [row[0] for row in rows]
+        self._variants = np.array([row[2] for row in rows], dtype=object)
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+
+    def _bump(self, key, amount):
+        self._set_meta(key, float(self._meta(key, 0)) + amount)
+
+    def _evict(self):
+        now = time.time()
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def _best_match(self, embedding, variant):
+        # (row id, similarity) of the closest stored answer of this variant above the threshold, or None
+        if self._matrix is None or not len(self._ids):
+            return None
+        scores = np.where(self._variants == variant, self._matrix @ _normalize(embedding), -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self._ids[best], float(scores[best])
+
+    # ---- public API --------------------------------------------------------
+
+    def embed(self, query):
+        return self.embed_model.embed_query(query)
+
+    def lookup(self, query, embedding=None, variant=""):
+        # Returns (entry or None, query embedding); the embedding can be reused for retrieval
+        embedding = self.embed(query) if embedding is None else embedding
+
+        with self._lock:
+            entry = None
+            match = self._best_match(embedding, variant)
+            if match:
+                row = self._conn.execute(
+                    "SELECT query, answer, sources, generation_time, created_at FROM answers WHERE id = ?",
+                    (match[0],),
+                ).fetchone()
+                if row and row[4] >= time.time() - self.ttl_seconds:
+                    entry = {
+                        "query": row[0],
+                        "answer": row[1],
+                        "sources": json.loads(row[2]),
+                        "generation_time": row[3],
+                        "similarity": match[1],
+                    }
+
+            with self._conn:
+                if entry:
+                    self._conn.execute(
+                        "UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?",
+                        (time.time(), match[0]),
+                    )
+                    self._bump("hits", 1)
+                    self._bump("saved_seconds", entry["generation_time"])
+                else:
+                    self._bump("misses", 1)
+
+        return entry, embedding
+
+    def store(self, query, answer, sources, generation_time, embedding=None, variant=""):
+        embedding = self.embed(query) if embedding is None else embedding
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO answers (query, embedding, answer, sources, generation_time, created_at, last_used, variant) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (query, _normalize(embedding).tobytes(), answer, json.dumps(sources), generation_time, now, now,
+                     variant),
+                )
+                self._evict()
+            self._load_embeddings()
+
+    def set_fingerprint(self, fingerprint):
+        # Index reloaded while running: same check as at startup
+        with self._lock:
+            if self._invalidate_if_stale(fingerprint):
+                self._load_embeddings()
+
+    def contains(self, embedding, variant=""):
+        # Whether lookup() would hit, without touching the hit/miss counters or LRU order
+        with self._lock:
+            match = self._best_match(embedding, variant)
+            if not match:
+                return False
+            row = self._conn.execute("SELECT created_at FROM answers WHERE id = ?", (match[0],)).fetchone()
+            return bool(row) and row[0] >= time.time() - self.ttl_seconds
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM answers")
+            self._load_embeddings()
+
+    def stats(self):
+        with self._lock:
+            hits = int(float(self._meta("hits", 0)))
+            misses = int(float(self._meta("misses", 0)))
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            saved = float(self._meta("saved_seconds", 0))
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_seconds": saved,
+        }
@@ -0,0 +1,123 @@
+"""
+Recall / latency / memory benchmark for the FAISS index types in faiss_index_factory.
+
+Uses the vectors of the saved index shards (default: every shard under
+faiss_index/shards/, or one shard directory) or a synthetic corpus, takes the
+exact flat search as ground truth and reports recall@k, query latency and
+serialized index size for every index type.
+
+    python benchmark_faiss_index.py --index-dir faiss_index
+    python benchmark_faiss_index.py --index-dir faiss_index/shards/climate-report-draft-oct-2024
+    python benchmark_faiss_index.py --synthetic 50000 --dim 1024
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import faiss
+import numpy as np
+
+from faiss_index_factory import INDEX_TYPES, create_index, index_memory_bytes
+from sharded_index import SHARDS_DIR
+
+
+def _stored_vectors(path):
+    index = faiss.read_index(path)
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        pass
+    # IVF indexes can only reconstruct through a direct map
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError as e:
+        raise SystemExit(f"Cannot read the vectors back from {path} ({e}). Use --synthetic instead.")
+
+
+def load_vectors(index_dir):
+    # All shards of a saved index, or a single index directory (e.g. one shard)
+    paths = sorted(glob.glob(os.path.join(index_dir, SHARDS_DIR, "*", "index.faiss")))
+    if not paths and os.path.exists(os.path.join(index_dir, "index.faiss")):
+        paths = [os.path.join(index_dir, "index.faiss")]
+    if not paths:
+        raise SystemExit(f"No saved index found under {index_dir}. Run ingest.py first or use --synthetic.")
+    print(f"Vectors from {len(paths)} index file(s) under {index_dir}")
+    return np.vstack([_stored_vectors(path) for path in paths])
+
+
+def synthetic_vectors(n, dim, seed=0):
+    # Clustered data behaves more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 100, 1), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def benchmark(vectors, queries, k, index_types):
+    dim = vectors.shape[1]
+    ground_truth = None
+    results = []
+    for kind in index_types:
+        start = time.perf_counter()
+        index = create_index(kind, dim, vectors)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - start)
+            found.append(ids[0])
+        found = np.array(found)
+        if ground_truth is None:
+            ground_truth = found  # "flat" always runs first
+
+        results.append({
+            "index": kind,
+            "recall": recall_at_k(found, ground_truth),
+            "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+            "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+            "memory_mb": index_memory_bytes(index) / 2 ** 20,
+            "build_s": build_seconds,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types against the flat baseline.")
+    parser.add_argument("--index-dir", default="faiss_index", help="saved index (all of its shards) or one shard directory to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of a saved index")
+    parser.add_argument("--dim", type=int, default=1024, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic, args.dim) if args.synthetic else load_vectors(args.index_dir)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    # Queries: perturbed copies of stored vectors
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    index_types = ["flat"] + [t for t in args.types.split(",") if t != "flat"]
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<8}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'memory MB':>12}{'build s':>10}")
+    for row in benchmark(vectors, queries, args.k, index_types):
+        print(f"{row['index']:<8}{row['recall']:>10.3f}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+              f"{row['memory_mb']:>12.2f}{row['build_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
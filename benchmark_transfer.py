@@ -0,0 +1,142 @@
+"""
+Bytes-on-wire / wall-time benchmark for the upload paths in file_transfer.
+
+Generates NetCDF-sized synthetic files (smooth float32 fields, like model
+output), uploads them to an in-process SFTP server and then re-uploads them
+after a "regeneration" that rewrites a slice of time steps and grows the
+header (shifting every later byte). Compares the old SCPClient.put with
+sync_folder's chunked SFTP, with and without SSH compression, and with delta
+sync.
+Bytes on wire are counted at the server socket, so they include SSH overhead.
+Loopback makes the wire nearly free, so the table also estimates each run on
+a real link: measured wall time plus bytes on wire at --link-mbps.
+
+    python benchmark_transfer.py --size-mb 64 --files 2
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from scp import SCPClient
+
+from file_transfer import connect, sync_folder
+from sftp_stub_server import StubSFTPServer
+
+HEADER_BYTES = 4096
+GRID = (180, 360)    # lat x lon cells per time step, float32
+
+
+def write_field(path, size_mb, seed):
+    # Header, then one smooth lat/lon field per time step with a little noise
+    rng = np.random.default_rng(seed)
+    lat, lon = np.meshgrid(np.linspace(-1, 1, GRID[0]), np.linspace(-1, 1, GRID[1]), indexing="ij")
+    steps = size_mb * 1024 * 1024 // (GRID[0] * GRID[1] * 4)
+    with open(path, "wb") as f:
+        f.write(rng.integers(0, 256, HEADER_BYTES, dtype=np.uint8).tobytes())
+        for t in range(steps):
+            field = 288 + 10 * np.sin(3 * lat + t / 12) * np.cos(2 * lon) + rng.normal(0, 0.05, GRID)
+            f.write(np.round(field, 2).astype(np.float32).tobytes())
+
+
+def regenerate(path, change_pct, seed):
+    # Rewrite change_pct % of the data in the middle and insert 64 bytes into the header
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    rng = np.random.default_rng(seed)
+    n = int(len(data) * change_pct / 100) // 4 * 4
+    start = len(data) // 2 // 4 * 4
+    field = np.frombuffer(bytes(data[start:start + n]), dtype=np.float32) + rng.normal(0, 0.5, n // 4)
+    data[start:start + n] = field.astype(np.float32).tobytes()
+    data[HEADER_BYTES // 2:HEADER_BYTES // 2] = b"history: regenerated".ljust(64, b" ")
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def scp_put(server, local, remote):
+    ssh = connect(**server)
+    scp = SCPClient(ssh.get_transport())
+    try:
+        for name in sorted(os.listdir(local)):
+            scp.put(os.path.join(local, name), remote_path=f"{remote}/{name}")
+    finally:
+        scp.close()
+        ssh.close()
+
+
+def measure(stub, action):
+    wire = stub.bytes_received + stub.bytes_sent
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start, stub.bytes_received + stub.bytes_sent - wire
+
+
+def tree_sha256(root):
+    return {name: hashlib.sha256(open(os.path.join(root, name), "rb").read()).hexdigest()
+            for name in sorted(os.listdir(root)) if not name.startswith(".")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scp, chunked SFTP and delta sync uploads.")
+    parser.add_argument("--size-mb", type=int, default=64, help="size of each synthetic file")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--change-pct", type=float, default=1.0, help="share of each file rewritten")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--link-mbps", type=float, default=100.0, help="link speed for the estimated time")
+    args = parser.parse_args()
+    # Server-side transports log every client disconnect as an error
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    work = tempfile.mkdtemp(prefix="transfer_bench_")
+    local = os.path.join(work, "local")
+    remote_root = os.path.join(work, "remote")
+    os.makedirs(local)
+    try:
+        for i in range(args.files):
+            write_field(os.path.join(local, f"tas_day_{i}.nc"), args.size_mb, seed=i)
+        total = sum(os.path.getsize(os.path.join(local, name)) for name in os.listdir(local))
+
+        stub = StubSFTPServer(remote_root, allow_exec=True).start()
+        server = {"host": stub.host, "port": stub.port, "username": stub.username, "password": stub.password}
+        for name in ("scp", "sftp", "compress", "delta"):
+            os.makedirs(os.path.join(remote_root, name))
+
+        def sync(name, **kwargs):
+            # Relative remote paths: the stub runs commands in its root directory
+            return lambda: sync_folder(local, name, server, workers=args.workers,
+                                       state_path=os.path.join(work, f"{name}.state.json"), **kwargs)
+
+        methods = [
+            ("scp put", "scp", lambda: scp_put(server, local, "scp")),
+            ("sftp chunks", "sftp", sync("sftp")),
+            ("sftp+compress", "compress", sync("compress", compress=True)),
+            ("sftp+delta", "delta", sync("delta", delta=True)),
+        ]
+        results = []
+        for phase in ("initial", "regenerated"):
+            if phase == "regenerated":
+                for i, name in enumerate(sorted(os.listdir(local))):
+                    regenerate(os.path.join(local, name), args.change_pct, seed=100 + i)
+            for label, directory, action in methods:
+                seconds, wire = measure(stub, action)
+                assert tree_sha256(os.path.join(remote_root, directory)) == tree_sha256(local), label
+                results.append((phase, label, seconds, wire))
+        stub.stop()
+
+        print(f"\n{args.files} files, {total / 1e6:.1f} MB, {args.change_pct}% rewritten + 64-byte header insert")
+        link = f"s @{args.link_mbps:g}Mbit"
+        print(f"{'phase':<13}{'method':<16}{'wall s':>9}{'MB on wire':>12}{'% of data':>11}{link:>15}")
+        for phase, label, seconds, wire in results:
+            estimate = seconds + wire * 8 / (args.link_mbps * 1e6)
+            print(f"{phase:<13}{label:<16}{seconds:>9.2f}{wire / 1e6:>12.2f}{100 * wire / total:>11.1f}{estimate:>15.1f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
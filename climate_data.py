@@ -0,0 +1,330 @@
+"""
+Climate projection data layer for the Climate Trends tab.
+
+Gridded model output (CMIP6-style NetCDF, one variable per file, as copied to
+India_netcdf by file_transfer.py) is opened lazily and read a block of time
+steps at a time. Annual India-wide and per-region aggregates (regions from
+region_masks.py) and per-region summary statistics are computed for every
+scenario and written to a small SQLite cache, which the Streamlit app reads
+instead of the grids. The cache is rebuilt only when the NetCDF files change.
+
+    python climate_data.py build --netcdf-dir India_netcdf
+    python climate_data.py fixture /tmp/India_netcdf     # small synthetic dataset
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from region_masks import grid_masks
+
+NETCDF_DIR = os.environ.get("CLIMATE_NETCDF_DIR", "India_netcdf")
+CACHE_PATH = "climate_cache.sqlite3"
+CACHE_VERSION = 3                 # bump when the cache layout changes
+TIME_CHUNK = 120                  # time steps read from a file at once (10 years of monthly data)
+
+# Scenario selector in pipeline2.py -> CMIP6 experiment
+SCENARIOS = {
+    "Conservative Change": "ssp126",
+    "Moderate Change": "ssp245",
+    "Extreme Change": "ssp585",
+}
+BASELINE_PERIOD = (1995, 2014)    # IPCC AR6 reference period, taken from the "historical" runs
+BASELINE_YEARS = 10               # without a historical run: first years of the scenario run
+
+# NetCDF variable -> chart column
+VARIABLES = {
+    "tas": "Temperature Rise (°C)",   # change of near-surface air temperature vs baseline
+    "pr": "Rainfall Change (%)",      # relative change of precipitation vs baseline
+}
+
+# Region statistics cached per scenario for the Regional Impact tab: stat -> (variable, years)
+REGION_STATS = {
+    "warming_2041_2060": ("tas", (2041, 2060)),
+    "warming_2081_2100": ("tas", (2081, 2100)),
+    "rainfall_change_2081_2100": ("pr", (2081, 2100)),
+    # Extremes: change of the hottest / wettest month of each year
+    "hottest_month_warming_2081_2100": ("tas_max_month", (2081, 2100)),
+    "wettest_month_change_2081_2100": ("pr_max_month", (2081, 2100)),
+}
+
+# tas_Amon_ACCESS-CM2_ssp245_r1i1p1f1_gn_201501-210012.nc
+FILE_PATTERN = re.compile(r"^(?P<variable>[a-z]+)_[A-Za-z]+_(?P<model>[^_]+)_(?P<experiment>historical|ssp\d{3})_")
+
+
+def netcdf_files(netcdf_dir):
+    paths = []
+    for root, _, files in os.walk(netcdf_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith((".nc", ".nc4")))
+    return sorted(paths)
+
+
+def files_fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def _coord_name(ds, *names):
+    for name in names:
+        if name in ds.coords or name in ds.dims:
+            return name
+    raise ValueError(f"No {names[0]} coordinate in dataset (looked for {', '.join(names)}).")
+
+
+def annual_region_stats(da, masks):
+    # da: lazily opened (time, lat, lon) variable. Returns {year: (means, maxima)}, one value per
+    # region each: the annual mean and the largest monthly value of the regional mean series.
+    # Only TIME_CHUNK time steps are in memory at once, and only each region's window is reduced.
+    years = da["time"].dt.year.values
+    sums = {}
+    counts = {}
+    maxima = {}
+    for start in range(0, da.sizes["time"], TIME_CHUNK):
+        block = np.asarray(da.isel(time=slice(start, start + TIME_CHUNK)).values, dtype=np.float64)
+        means = np.stack([mask.reduce(block) for mask in masks.values()], axis=1)   # (time, region)
+        for year, row in zip(years[start:start + len(block)], means):
+            sums[year] = sums.get(year, 0.0) + row
+            counts[year] = counts.get(year, 0) + 1
+            maxima[year] = np.fmax(maxima[year], row) if year in maxima else row
+    return {int(year): (sums[year] / counts[year], maxima[year]) for year in sorted(sums)}
+
+
+def read_file(path):
+    # Returns rows (model, experiment, variable, region, year, value) for every known variable in the file
+    rows = []
+    with xr.open_dataset(path, decode_times=True) as ds:
+        lat_name = _coord_name(ds, "lat", "latitude")
+        lon_name = _coord_name(ds, "lon", "longitude")
+        match = FILE_PATTERN.match(os.path.basename(path))
+        model = ds.attrs.get("source_id") or (match and match["model"]) or os.path.basename(path)
+        experiment = ds.attrs.get("experiment_id") or (match and match["experiment"])
+        if experiment is None:
+            print(f"Skipping {path}: scenario unknown (no experiment_id attribute or CMIP6 file name).")
+            return rows
+        masks = grid_masks(ds[lat_name].values, ds[lon_name].values)
+        for variable in VARIABLES:
+            if variable not in ds.data_vars:
+                continue
+            da = ds[variable].transpose("time", lat_name, lon_name)
+            for year, (means, maxima) in annual_region_stats(da, masks).items():
+                for region, mean, maximum in zip(masks, means, maxima):
+                    rows.append((model, experiment, variable, region, year, float(mean)))
+                    rows.append((model, experiment, f"{variable}_max_month", region, year, float(maximum)))
+    return rows
+
+
+def to_changes(raw):
+    # Per model: change vs its baseline (historical run if present, else first scenario years),
+    # then the ensemble mean over models. Also returns the baseline years used, as rows
+    # (experiment, model, first year, last year)
+    frames = []
+    baselines = set()
+    for (model, variable, region), group in raw.groupby(["model", "variable", "region"]):
+        historical = group[(group["experiment"] == "historical") & group["year"].between(*BASELINE_PERIOD)]
+        for experiment, runs in group.groupby("experiment"):
+            reference = historical if len(historical) else runs.nsmallest(BASELINE_YEARS, "year")
+            baseline = reference["value"].mean()
+            baselines.add((experiment, model, int(reference["year"].min()), int(reference["year"].max())))
+            if variable.startswith("tas"):
+                change = runs["value"] - baseline
+            else:
+                change = 100.0 * (runs["value"] / baseline - 1.0)
+            frames.append(runs.assign(value=change))
+    changes = pd.concat(frames)
+    changes = changes.groupby(["experiment", "region", "variable", "year"], as_index=False)["value"].mean()
+    return changes, sorted(baselines)
+
+
+def to_region_stats(changes):
+    rows = []
+    for stat, (variable, (first, last)) in REGION_STATS.items():
+        period = changes[(changes["variable"] == variable) & changes["year"].between(first, last)]
+        for (experiment, region), group in period.groupby(["experiment", "region"]):
+            rows.append((experiment, region, stat, float(group["value"].mean())))
+    return rows
+
+
+def build_cache(netcdf_dir=NETCDF_DIR, cache_path=CACHE_PATH):
+    paths = netcdf_files(netcdf_dir)
+    if not paths:
+        raise FileNotFoundError(f"No NetCDF files found in {netcdf_dir}.")
+    start = time.perf_counter()
+    rows = []
+    for path in paths:
+        rows.extend(read_file(path))
+    raw = pd.DataFrame(rows, columns=["model", "experiment", "variable", "region", "year", "value"])
+    changes, baselines = to_changes(raw)
+
+    tmp_path = cache_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    with conn:
+        conn.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE trends (
+                experiment TEXT NOT NULL, region TEXT NOT NULL, variable TEXT NOT NULL,
+                year INTEGER NOT NULL, value REAL NOT NULL,
+                PRIMARY KEY (experiment, region, variable, year)
+            );
+            CREATE TABLE region_stats (
+                experiment TEXT NOT NULL, region TEXT NOT NULL, stat TEXT NOT NULL, value REAL NOT NULL,
+                PRIMARY KEY (experiment, region, stat)
+            );
+            CREATE TABLE baselines (
+                experiment TEXT NOT NULL, model TEXT NOT NULL, first_year INTEGER NOT NULL, last_year INTEGER NOT NULL,
+                PRIMARY KEY (experiment, model)
+            );
+        """)
+        conn.executemany("INSERT INTO trends VALUES (?, ?, ?, ?, ?)", changes.itertuples(index=False, name=None))
+        conn.executemany("INSERT INTO region_stats VALUES (?, ?, ?, ?)", to_region_stats(changes))
+        conn.executemany("INSERT INTO baselines VALUES (?, ?, ?, ?)", baselines)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", str(CACHE_VERSION)),
+            ("fingerprint", files_fingerprint(paths)),
+            ("models", ",".join(sorted(raw["model"].unique()))),
+        ])
+    conn.close()
+    os.replace(tmp_path, cache_path)
+    print(f"Climate cache built from {len(paths)} NetCDF files in {time.perf_counter() - start:.1f}s.")
+
+
+def ensure_cache(netcdf_dir=NETCDF_DIR, cache_path=CACHE_PATH):
+    # True when a cache is available. Rebuilt when the NetCDF files changed; a cache shipped
+    # without the NetCDF directory is used as is.
+    paths = netcdf_files(netcdf_dir) if os.path.isdir(netcdf_dir) else []
+    if not paths:
+        return os.path.exists(cache_path)
+    if os.path.exists(cache_path):
+        with sqlite3.connect(cache_path) as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("version") == str(CACHE_VERSION) and meta.get("fingerprint") == files_fingerprint(paths):
+            return True
+    build_cache(netcdf_dir, cache_path)
+    return True
+
+
+def _baseline(conn, experiment):
+    # Baseline years behind one scenario's changes, e.g. "1995-2014"; listed per model when models
+    # without a historical run fell back to their first scenario years. None for caches built
+    # before the baselines were recorded.
+    try:
+        rows = conn.execute(
+            "SELECT model, first_year, last_year FROM baselines WHERE experiment = ? ORDER BY model", (experiment,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    periods = {}
+    for model, first, last in rows:
+        periods.setdefault(f"{first}-{last}", []).append(model)
+    if len(periods) <= 1:
+        return next(iter(periods), None)
+    return "; ".join(f"{period} ({', '.join(models)})" for period, models in periods.items())
+
+
+def load_trends(experiment, region="India", cache_path=CACHE_PATH):
+    # (DataFrame with one row per year and one column per variable (see VARIABLES), baseline years)
+    with sqlite3.connect(cache_path) as conn:
+        df = pd.read_sql_query(
+            f"SELECT year, variable, value FROM trends WHERE experiment = ? AND region = ? "
+            f"AND variable IN ({', '.join('?' * len(VARIABLES))}) ORDER BY year",
+            conn, params=(experiment, region, *VARIABLES),
+        )
+        baseline = _baseline(conn, experiment)
+    if df.empty:
+        return pd.DataFrame(columns=["Year", *VARIABLES.values()]), baseline
+    df = df.pivot(index="year", columns="variable", values="value").rename(columns=VARIABLES)
+    return df.rename_axis(columns=None).reset_index().rename(columns={"year": "Year"}), baseline
+
+
+def load_region_stats(experiment, cache_path=CACHE_PATH):
+    # ({region: {stat: value}} for one scenario (see REGION_STATS), baseline years)
+    with sqlite3.connect(cache_path) as conn:
+        rows = conn.execute("SELECT region, stat, value FROM region_stats WHERE experiment = ?", (experiment,)).fetchall()
+        baseline = _baseline(conn, experiment)
+    stats = {}
+    for region, stat, value in rows:
+        stats.setdefault(region, {})[stat] = value
+    return stats, baseline
+
+
+def region_summary(region, experiment, cache_path=CACHE_PATH):
+    # One-line projection for a region, e.g. to accompany an answer about "how will Rajasthan change"
+    with sqlite3.connect(cache_path) as conn:
+        stats = dict(conn.execute(
+            "SELECT stat, value FROM region_stats WHERE experiment = ? AND region = ?", (experiment, region)
+        ).fetchall())
+        baseline = _baseline(conn, experiment) or "each model's baseline"
+    if not stats:
+        return None
+    return (
+        f"{region} under {experiment.upper()}: {stats['warming_2041_2060']:+.1f}°C by 2041-2060 and "
+        f"{stats['warming_2081_2100']:+.1f}°C by 2081-2100 (hottest month {stats['hottest_month_warming_2081_2100']:+.1f}°C), "
+        f"rainfall {stats['rainfall_change_2081_2100']:+.0f}% (wettest month {stats['wettest_month_change_2081_2100']:+.0f}%), "
+        f"relative to {baseline}."
+    )
+
+
+def write_fixture(out_dir, models=("FIXTURE-ESM",), resolution=2.0, seed=0):
+    # Small synthetic monthly dataset with the layout of the real India_netcdf files: a historical
+    # run and the three scenarios, warming faster under higher emissions and in the north
+    rng = np.random.default_rng(seed)
+    lat = np.arange(6.0, 38.0, resolution) + resolution / 2
+    lon = np.arange(68.0, 98.0, resolution) + resolution / 2
+    warming_2100 = {"historical": 0.0, "ssp126": 1.5, "ssp245": 2.7, "ssp585": 4.8}
+    periods = {"historical": (1995, 2014), "ssp126": (2015, 2100), "ssp245": (2015, 2100), "ssp585": (2015, 2100)}
+    os.makedirs(out_dir, exist_ok=True)
+
+    lat3d = lat[None, :, None]
+    for model in models:
+        for experiment, (first, last) in periods.items():
+            times = pd.date_range(f"{first}-01-01", f"{last}-12-01", freq="MS")
+            t = (times.year.values + (times.month.values - 1) / 12.0)[:, None, None]
+            month = times.month.values[:, None, None]
+            trend = warming_2100[experiment] * np.clip((t - 2015) / 85.0, 0, None) * (0.8 + 0.4 * (lat3d - 6) / 32)
+            season = 5.0 * np.sin(2 * np.pi * (month - 4) / 12.0)
+            monsoon = np.clip(np.sin(np.pi * (month - 5) / 5.0), 0, None)
+            shape = (len(times), len(lat), len(lon))
+
+            tas = 300.0 - 0.4 * (lat3d - 6) + season + trend + rng.normal(0, 0.5, shape)
+            pr = 2e-5 * (0.2 + 3.0 * monsoon) * (1 + 0.07 * trend) * rng.lognormal(0, 0.3, shape)
+
+            for variable, values, units in (("tas", tas, "K"), ("pr", pr, "kg m-2 s-1")):
+                ds = xr.Dataset(
+                    {variable: (("time", "lat", "lon"), values.astype(np.float32), {"units": units})},
+                    coords={"time": times, "lat": lat, "lon": lon},
+                    attrs={"source_id": model, "experiment_id": experiment},
+                )
+                name = f"{variable}_Amon_{model}_{experiment}_r1i1p1f1_gn_{first}01-{last}12.nc"
+                ds.to_netcdf(os.path.join(out_dir, name), encoding={variable: {"zlib": True}})
+    print(f"Synthetic NetCDF fixture written to {out_dir}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the climate projection cache used by the Climate Trends tab.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="aggregate the NetCDF files into the cache")
+    build.add_argument("--netcdf-dir", default=NETCDF_DIR)
+    build.add_argument("--cache", default=CACHE_PATH)
+    fixture = commands.add_parser("fixture", help="write a small synthetic NetCDF dataset")
+    fixture.add_argument("out_dir")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_cache(args.netcdf_dir, args.cache)
+    else:
+        write_fixture(args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Context assembly between the retriever and the prompt.
+
+Retrieved chunks overlap (chunk_overlap=100) and often repeat each other, and
+the "stuff" layout pastes all of them into the prompt, so llama3 pays prefill
+for the same text several times. pack_context merges overlapping chunks from
+the same page, drops near-duplicates and keeps the most relevant chunks that
+fit a token budget. A top-ranked chunk that alone exceeds the budget is clipped
+to it rather than dropped, so the context is never empty.
+"""
+
+from langchain.schema import Document
+
+CONTEXT_TOKEN_BUDGET = 1000
+NEAR_DUPLICATE_THRESHOLD = 0.8   # Jaccard similarity of word 3-grams
+MIN_OVERLAP_CHARS = 20
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text with the llama3 tokenizer
+    return max(1, len(text) // 4)
+
+
+def _clip(text, token_budget):
+    # Cut at a word boundary to fit the budget (same ~4 characters per token estimate)
+    max_chars = token_budget * 4
+    return text[:max_chars].rsplit(" ", 1)[0] if len(text) > max_chars else text
+
+
+def _shingles(text, n=3):
+    words = text.lower().split()
+    return {tuple(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _suffix_prefix_overlap(a, b):
+    # Length of the longest suffix of `a` that is also a prefix of `b`
+    head = b[:MIN_OVERLAP_CHARS]
+    if len(head) < MIN_OVERLAP_CHARS:
+        return 0
+    start = a.find(head)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+def _merge_pair(a, b):
+    # Returns the merged text of two chunks from the same page, or None if they don't overlap
+    if b in a:
+        return a
+    if a in b:
+        return b
+    overlap = _suffix_prefix_overlap(a, b)
+    if overlap:
+        return a + b[overlap:]
+    overlap = _suffix_prefix_overlap(b, a)
+    if overlap:
+        return b + a[overlap:]
+    return None
+
+
+def merge_overlapping(docs):
+    # docs are in relevance order; a merged chunk takes the position of its most relevant part
+    merged = []
+    for doc in docs:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        text, metadata = doc.page_content, doc.metadata
+        position = len(merged)
+        found = True
+        while found:
+            # Repeat, since a longer merged text may now bridge two chunks that didn't touch before
+            found = False
+            for i, (other_key, other_text, other_metadata) in enumerate(merged):
+                combined = _merge_pair(other_text, text) if other_key == key else None
+                if combined is not None:
+                    text, metadata = combined, other_metadata
+                    position = min(position, i)
+                    del merged[i]
+                    found = True
+                    break
+        merged.insert(position, (key, text, metadata))
+    return [Document(page_content=text, metadata=metadata) for _, text, metadata in merged]
+
+
+def drop_near_duplicates(docs, threshold=NEAR_DUPLICATE_THRESHOLD):
+    kept = []
+    kept_shingles = []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_context(docs, token_budget=CONTEXT_TOKEN_BUDGET, stats=None):
+    stats = {} if stats is None else stats
+    original_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+
+    candidates = drop_near_duplicates(merge_overlapping(docs))
+
+    # Most relevant first; skip chunks that would overflow the budget but keep trying smaller ones
+    packed = []
+    used = 0
+    for i, doc in enumerate(candidates):
+        tokens = estimate_tokens(doc.page_content)
+        if i == 0 and tokens > token_budget:
+            doc = Document(page_content=_clip(doc.page_content, token_budget), metadata=doc.metadata)
+            tokens = estimate_tokens(doc.page_content)
+        if used + tokens > token_budget:
+            continue
+        packed.append(doc)
+        used += tokens
+
+    stats.update({
+        "retrieved_chunks": len(docs),
+        "packed_chunks": len(packed),
+        "original_tokens": original_tokens,
+        "packed_tokens": used,
+        "saved_tokens": original_tokens - used,
+    })
+    return packed
@@ -0,0 +1,149 @@
+"""
+Conversation memory for follow-up questions.
+
+Retrieval only sees the question, so a follow-up like "what about Kerala?"
+finds the wrong chunks. Before retrieval, follow-ups are rewritten into a
+standalone question from a compact view of the chat: the latest exchange
+verbatim (clipped) and a one-line summary of each earlier exchange, newest
+first until HISTORY_TOKEN_BUDGET is used up. The history stays within the
+budget however long the chat gets, and building it only reads the last few
+messages. Questions that already stand on their own skip the LLM call, and
+rewrites are kept in an LRU cache keyed by history and question, so reruns
+and repeated follow-ups cost nothing.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from context_packing import estimate_tokens
+from metrics import metrics
+
+HISTORY_TOKEN_BUDGET = 400
+RECENT_MESSAGES = 2            # the latest exchange is kept (nearly) verbatim
+MESSAGE_TOKEN_LIMIT = 150
+SUMMARY_LINE_TOKENS = 50
+CONDENSE_MAX_TOKENS = 64       # num_predict for the rewrite
+REWRITE_CACHE_SIZE = 512
+
+# Openers and pronouns that point back into the conversation
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|but|also|so|then|what about|how about|why|compared|same)\b"
+    r"|\b(it|its|they|them|their|this|that|these|those|there|here|the same)\b",
+    re.IGNORECASE,
+)
+SHORT_QUESTION_WORDS = 5
+
+CONDENSE_PROMPT = """Rewrite the follow-up question as one standalone question about India's climate, using the conversation for anything it refers to (places, years, scenarios, topics). Reply with the rewritten question only.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:"""
+
+
+def clip(text, max_tokens):
+    text = " ".join(text.split())
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " …"
+
+
+def _first_sentence(text):
+    match = re.match(r"(.+?[.!?])(\s|$)", " ".join(text.split()))
+    return match.group(1) if match else text
+
+
+def _exchanges(messages):
+    # (question, answer) pairs, newest first; the greeting and other unanswered assistant turns are skipped
+    question = None
+    pairs = []
+    for message in messages:
+        if message["role"] == "user":
+            if question is not None:
+                pairs.append((question, ""))
+            question = message["content"]
+        elif question is not None:
+            pairs.append((question, message["content"]))
+            question = None
+    if question is not None:
+        pairs.append((question, ""))
+    return pairs[::-1]
+
+
+def history_text(messages, token_budget=HISTORY_TOKEN_BUDGET):
+    # Latest exchange clipped, older ones one line each, within the token budget
+    lines = []
+    used = 0
+    # Only as many messages as can fit are looked at: every exchange costs at least a few tokens
+    recent = messages[-(token_budget // 4 + RECENT_MESSAGES):]
+    for i, (question, answer) in enumerate(_exchanges(recent)):
+        if i * 2 < RECENT_MESSAGES:
+            line = f"User: {clip(question, MESSAGE_TOKEN_LIMIT)}"
+            if answer:
+                line += f"\nAssistant: {clip(answer, MESSAGE_TOKEN_LIMIT)}"
+        else:
+            line = f"- Earlier, asked: {clip(question, SUMMARY_LINE_TOKENS // 2)}"
+            if answer:
+                line += f" Answer: {clip(_first_sentence(answer), SUMMARY_LINE_TOKENS // 2)}"
+        tokens = estimate_tokens(line)
+        if used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(reversed(lines))
+
+
+def needs_condensing(question):
+    return bool(FOLLOW_UP_PATTERN.search(question)) or len(question.split()) <= SHORT_QUESTION_WORDS
+
+
+def _clean_rewrite(text, question):
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    if not lines:
+        return question
+    rewrite = re.sub(r"^(standalone question:|question:)\s*", "", lines[0], flags=re.IGNORECASE).strip(" \"'")
+    # A rambling reply is not a usable query
+    if not rewrite or estimate_tokens(rewrite) > CONDENSE_MAX_TOKENS:
+        return question
+    return rewrite
+
+
+class QueryCondenser:
+    def __init__(self, llm, cache_size=REWRITE_CACHE_SIZE):
+        self.llm = llm
+        self.cache_size = cache_size
+        self.rewrites = 0
+        self.cache_hits = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def condense(self, question, messages, stages=None):
+        # Standalone version of `question` given the chat `messages` ({"role", "content"} dicts before it)
+        if not messages or not needs_condensing(question):
+            return question
+        history = history_text(messages)
+        if not history:
+            return question
+        key = hashlib.sha256(f"{history}\x00{question}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key]
+
+        with metrics.timer("condense", stages):
+            rewrite = _clean_rewrite(self.llm.invoke(CONDENSE_PROMPT.format(history=history, question=question)), question)
+        with self._lock:
+            self.rewrites += 1
+            self._cache[key] = rewrite
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rewrite
+
+    def stats(self):
+        return {"rewrites": self.rewrites, "cache_hits": self.cache_hits, "cached": len(self._cache)}
@@ -0,0 +1,246 @@
+"""
+rsync-style block delta for re-uploading regenerated files.
+
+The server runs a small Python helper (REMOTE_HELPER, passed with `python3 -c`
+over an exec channel). It first returns a signature of the remote copy: for
+every block, its adler32 (the weak checksum) and a 16-byte BLAKE2b (the
+strong one). The sender walks the new file. Where it still lines up with the
+remote copy, each block is confirmed with one adler32 and one BLAKE2b. After
+a miss, numpy computes the adler32 at every byte offset of the following span,
+and offsets whose weak checksum is in the signature are checked with the
+strong hash. The result is a list of "copy remote block" and "literal data"
+operations, zlib-compressed as they are produced and streamed to the helper's
+stdin. The helper rebuilds the file next to the old copy, checks its sha256
+and renames it into place. Neither side stages a compressed or delta copy.
+"""
+
+import hashlib
+import shlex
+import struct
+import zlib
+
+import numpy as np
+
+ADLER_MOD = 65521
+MIN_BLOCK = 2 * 1024
+MAX_BLOCK = 128 * 1024
+MIN_SPAN = 64 * 1024          # offsets scanned by the first numpy pass after a miss
+WINDOW = 4 * 1024 * 1024      # and the most scanned per pass
+MAX_LITERAL = 1024 * 1024     # literal runs are sent in pieces of at most this size
+COMPRESS_LEVEL = 1
+
+REMOTE_HELPER = r'''
+import hashlib, os, struct, sys, zlib
+mode, path, block = sys.argv[1], sys.argv[2], int(sys.argv[3])
+out = sys.stdout.buffer
+if mode == "sig":
+    size = os.path.getsize(path) if os.path.exists(path) else -1
+    out.write(struct.pack(">q", size))
+    if size > 0:
+        with open(path, "rb") as f:
+            for data in iter(lambda: f.read(block), b""):
+                out.write(struct.pack(">I", zlib.adler32(data)) + hashlib.blake2b(data, digest_size=16).digest())
+    sys.exit(0)
+part, expected = sys.argv[4], sys.argv[5]
+stdin, inflate = sys.stdin.buffer, zlib.decompressobj()
+buf, pos = bytearray(), 0
+def read(n):
+    global buf, pos
+    while len(buf) - pos < n:
+        data = stdin.read(1 << 16)
+        if not data:
+            raise EOFError("delta stream ended early")
+        buf = buf[pos:] + inflate.decompress(data)
+        pos = 0
+    pos += n
+    return bytes(buf[pos - n:pos])
+digest = hashlib.sha256()
+with open(path, "rb") as base, open(part, "wb") as dst:
+    while True:
+        op = read(1)
+        if op == b"C":
+            start, count = struct.unpack(">II", read(8))
+            base.seek(start * block)
+            for _ in range(count):
+                data = base.read(block)
+                dst.write(data)
+                digest.update(data)
+        elif op == b"D":
+            data = read(struct.unpack(">I", read(4))[0])
+            dst.write(data)
+            digest.update(data)
+        else:
+            break
+if digest.hexdigest() != expected:
+    os.remove(part)
+    out.write(b"checksum mismatch")
+    sys.exit(1)
+os.replace(part, path)
+out.write(b"ok")
+'''
+
+
+class RemoteHelperError(Exception):
+    pass
+
+
+def block_size_for(size):
+    # ~sqrt(file size), like rsync, rounded to 1 KB: 32 KB blocks for a 1 GB file
+    block = int(np.sqrt(max(size, 1))) // 1024 * 1024
+    return min(max(block, MIN_BLOCK), MAX_BLOCK)
+
+
+def rolling_adler32(data, block):
+    # adler32 of data[k:k + block] for every offset k, from prefix sums:
+    # A = 1 + sum(x), B = block + sum((block - i) * x_i) = block + sum of the window's running sums
+    s = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum(np.frombuffer(data, dtype=np.uint8), out=s[1:])
+    u = np.cumsum(s)
+    a = s[block:] - s[:-block]
+    b = u[block:] - u[:-block] - block * s[:-block]
+    return ((b + block) % ADLER_MOD) << 16 | (a + 1) % ADLER_MOD
+
+
+def parse_signature(raw, block):
+    # Remote file size and (adler32, blake2b digest) of each full block; a short final block
+    # is left out since it can never match a full-length window
+    size = struct.unpack(">q", raw[:8])[0]
+    blocks = []
+    for index in range(max(size, 0) // block):
+        offset = 8 + index * 20
+        blocks.append((struct.unpack(">I", raw[offset:offset + 4])[0], raw[offset + 4:offset + 20]))
+    return size, blocks
+
+
+def _strong(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def delta_ops(f, blocks, block):
+    # Yields ("copy", first block, count) and ("data", bytes) covering the whole file in order.
+    # Unchanged stretches are confirmed block by block (the next remote block, then any block at
+    # the same offset); only after a miss is the rolling checksum computed, over a span that
+    # doubles while nothing matches.
+    signature = {}                  # adler32 -> {blake2b digest: block index}
+    for index, (weak, strong) in enumerate(blocks):
+        signature.setdefault(weak, {}).setdefault(strong, index)
+    # Presence table on the low 24 bits of the weak checksum: one gather per offset rules out almost all of them
+    maybe = np.zeros(1 << 24, dtype=bool)
+    maybe[np.fromiter(signature, dtype=np.int64, count=len(signature)) & 0xFFFFFF] = True
+
+    f.seek(0, 2)
+    size = f.tell()
+    copy_run = None
+    literal_start = position = 0
+    span = MIN_SPAN
+    while position + block <= size:
+        f.seek(position)
+        data = f.read(block)
+        match = None
+        if copy_run and copy_run[0] + copy_run[1] < len(blocks):
+            expected = copy_run[0] + copy_run[1]
+            if zlib.adler32(data) == blocks[expected][0] and _strong(data) == blocks[expected][1]:
+                match = (position, expected)
+        if match is None and zlib.adler32(data) in signature:
+            index = signature[zlib.adler32(data)].get(_strong(data))
+            if index is not None:
+                match = (position, index)
+        if match is None:
+            data += f.read(span - 1)
+            weak = rolling_adler32(data, block)
+            for local in np.flatnonzero(maybe[weak & 0xFFFFFF]):
+                strong = signature.get(int(weak[local]))
+                index = strong and strong.get(_strong(data[local:local + block]))
+                if index is not None:
+                    match = (position + int(local), index)
+                    break
+            if match is None:
+                # No block starts in this span: it all becomes literal data
+                position += len(weak)
+                span = min(span * 2, WINDOW)
+                continue
+            span = MIN_SPAN
+
+        offset, index = match
+        if offset > literal_start:
+            if copy_run:
+                yield ("copy",) + copy_run
+                copy_run = None
+            yield from _literal(f, literal_start, offset)
+        if copy_run and copy_run[0] + copy_run[1] == index:
+            copy_run = (copy_run[0], copy_run[1] + 1)
+        else:
+            if copy_run:
+                yield ("copy",) + copy_run
+            copy_run = (index, 1)
+        position = literal_start = offset + block
+    if copy_run:
+        yield ("copy",) + copy_run
+    yield from _literal(f, literal_start, size)
+
+
+def _literal(f, start, stop):
+    f.seek(start)
+    while start < stop:
+        data = f.read(min(MAX_LITERAL, stop - start))
+        start += len(data)
+        yield ("data", data)
+
+
+def encode_ops(ops):
+    for op in ops:
+        if op[0] == "copy":
+            yield b"C" + struct.pack(">II", op[1], op[2])
+        else:
+            yield b"D" + struct.pack(">I", len(op[1])) + op[1]
+    yield b"E"
+
+
+def helper_command(mode, path, block, *args, python="python3"):
+    return " ".join([python, "-c", shlex.quote(REMOTE_HELPER), mode, shlex.quote(path), str(block)]
+                    + [shlex.quote(str(a)) for a in args])
+
+
+def remote_signature(ssh, path, block, timeout=None):
+    _, stdout, stderr = ssh.exec_command(helper_command("sig", path, block), timeout=timeout)
+    raw = stdout.read()
+    if stdout.channel.recv_exit_status() != 0 or len(raw) < 8:
+        raise RemoteHelperError(stderr.read().decode(errors="replace").strip() or "signature helper failed")
+    return raw
+
+
+def send_delta(ssh, local_path, remote_path, sha256, timeout=None):
+    # Rebuild remote_path from its old copy plus the delta of local_path; returns bytes sent and received.
+    # Raises RemoteHelperError when there is no old copy or the server cannot run the helper.
+    with open(local_path, "rb") as f:
+        f.seek(0, 2)
+        block = block_size_for(f.tell())
+        raw = remote_signature(ssh, remote_path, block, timeout)
+        size, blocks = parse_signature(raw, block)
+        if size < 0:
+            raise RemoteHelperError(f"no remote copy of {remote_path}")
+
+        stdin, stdout, stderr = ssh.exec_command(
+            helper_command("patch", remote_path, block, remote_path + ".part", sha256), timeout=timeout)
+        deflate = zlib.compressobj(COMPRESS_LEVEL)
+        sent = 0
+        pending = []
+        pending_bytes = 0
+        for piece in encode_ops(delta_ops(f, blocks, block)):
+            pending.append(piece)
+            pending_bytes += len(piece)
+            if pending_bytes >= MAX_LITERAL:
+                compressed = deflate.compress(b"".join(pending))
+                stdin.write(compressed)
+                sent += len(compressed)
+                pending, pending_bytes = [], 0
+        compressed = deflate.compress(b"".join(pending)) + deflate.flush()
+        stdin.write(compressed)
+        sent += len(compressed)
+        stdin.flush()
+        stdin.channel.shutdown_write()
+
+    result = stdout.read().decode(errors="replace")
+    if stdout.channel.recv_exit_status() != 0 or result != "ok":
+        raise RemoteHelperError(result or stderr.read().decode(errors="replace").strip() or "patch helper failed")
+    return {"bytes_sent": sent, "bytes_received": len(raw), "block_size": block}
@@ -0,0 +1,120 @@
+"""
+Persistent embedding cache shared by every index build path.
+
+Vectors are keyed by (model name, sha256 of the whitespace-normalized chunk
+text) and stored in SQLite as raw float32 or float16 arrays. Rebuilding an
+index over unchanged text with an unchanged model then needs no calls to the
+embedding backend at all.
+"""
+
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+CACHE_PATH = "embedding_cache.sqlite3"
+STORE_DTYPE = "float32"   # "float16" halves the cache size at a small precision cost
+LOOKUP_BATCH = 500        # keys per SELECT, below SQLite's variable limit
+
+
+def text_key(text):
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=CACHE_PATH, dtype=STORE_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Embedding workers run in a thread pool, so the connection is shared across threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+        """)
+
+    def get_many(self, model_name, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, vector FROM vectors WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                    [model_name, *batch],
+                ).fetchall()
+                for key, dtype, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+        return found
+
+    def put_many(self, model_name, keys, vectors):
+        rows = [
+            (model_name, key, self.dtype.name, np.asarray(vector, dtype=self.dtype).tobytes())
+            for key, vector in zip(keys, vectors)
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)", rows)
+
+    def get_or_compute(self, model_name, texts, compute):
+        # compute(list_of_texts) -> 2D array-like of vectors; only called for cache misses
+        keys = [text_key(text) for text in texts]
+        found = self.get_many(model_name, list(set(keys)))
+
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in missing:
+                missing[key] = text
+        # Several index builds share this cache from their own threads
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            vectors = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            self.put_many(model_name, list(missing), vectors)
+            found.update(zip(missing, vectors))
+
+        return np.vstack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    # LangChain Embeddings wrapper: documents go through the cache, queries go straight to the model
+    def __init__(self, embedder, model_name, cache=None):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts):
+        return self.cache.get_or_compute(self.model_name, texts, self.embedder.embed_documents).tolist()
+
+    def embed_query(self, text):
+        return self.embedder.embed_query(text)
+
+
+# Process-wide cache, opened on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(path=CACHE_PATH):
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(path)
+    return _cache
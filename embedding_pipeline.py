@@ -0,0 +1,164 @@
+"""
+Batched, parallel and resumable embedding stage for FAISS index builds.
+
+Chunks are embedded in fixed-size batches by a bounded pool of workers talking
+to the embedding backend. Every finished batch is checkpointed to disk under a
+name derived from its contents, so an interrupted build picks up where it
+stopped instead of re-embedding the whole report.
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+from faiss_index_factory import create_index, empty_vector_store
+
+# Default ingestion settings
+BATCH_SIZE = 32
+MAX_WORKERS = 4       # concurrent requests against the embedding backend (Ollama)
+MAX_RETRIES = 3
+RETRY_DELAY = 2       # seconds
+
+
+class HashEmbeddings(Embeddings):
+    # Deterministic local stand-in for OllamaEmbeddings: hashes character trigrams into a
+    # fixed-size vector. Similar texts get similar vectors, and no model server is needed.
+    def __init__(self, dim=256, delay=0.0):
+        self.dim = dim
+        self.delay = delay
+        self.model = f"hash-{dim}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = " ".join(text.lower().split())
+        for i in range(max(len(text) - 2, 1)):
+            bucket = int.from_bytes(hashlib.md5(text[i:i + 3].encode("utf-8")).digest()[:4], "little")
+            vector[bucket % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.delay:
+            time.sleep(self.delay * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _model_name(embedder):
+    # CachedEmbeddings has model_name; OllamaEmbeddings and HashEmbeddings have model
+    return getattr(embedder, "model_name", None) or getattr(embedder, "model", None) or type(embedder).__name__
+
+
+def _embedding_dim(embedder):
+    dim = getattr(embedder, "dim", None)
+    return dim if dim else len(embedder.embed_query("dimension"))
+
+
+def _batch_key(model_name, texts):
+    # Checkpoints of another embedding model never match, even for the same texts
+    digest = hashlib.sha256(model_name.encode("utf-8") + b"\x00")
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _embed_batch(embedder, texts):
+    for attempt in range(MAX_RETRIES):
+        try:
+            return np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            print(f"Embedding batch failed ({e}), retrying in {RETRY_DELAY} seconds...")
+            time.sleep(RETRY_DELAY)
+
+
+def embed_texts(texts, embedder, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, checkpoint_dir=None, stats=None):
+    stats = {} if stats is None else stats
+    start = time.perf_counter()
+    if not texts:
+        # Same width as real output, so FAISS callers can use vectors.shape[1]
+        return np.zeros((0, _embedding_dim(embedder)), dtype=np.float32)
+    model_name = _model_name(embedder)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = [None] * len(batches)
+    paths = [None] * len(batches)
+
+    # Resume: batches already checkpointed by an earlier (interrupted) run are loaded from disk
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        for i, batch in enumerate(batches):
+            paths[i] = os.path.join(checkpoint_dir, f"batch-{_batch_key(model_name, batch)}.npy")
+            if os.path.exists(paths[i]):
+                result = np.load(paths[i])
+                # A checkpoint that does not fit its batch is embedded again
+                if result.ndim == 2 and len(result) == len(batch):
+                    results[i] = result
+    resumed = sum(len(batches[i]) for i, result in enumerate(results) if result is not None)
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_embed_batch, embedder, batches[i]): i for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if paths[i]:
+                tmp_path = paths[i] + ".tmp.npy"
+                np.save(tmp_path, results[i])
+                os.replace(tmp_path, paths[i])
+            done += len(batches[i])
+            elapsed = time.perf_counter() - start
+            print(f"Embedded {done + resumed}/{len(texts)} chunks ({done / elapsed:.1f} chunks/s)")
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "chunks": len(texts),
+        "embedded": done,
+        "resumed": resumed,
+        "seconds": elapsed,
+        "chunks_per_second": done / elapsed if elapsed else 0.0,
+    })
+    if len({result.shape[1] for result in results}) > 1:
+        raise ValueError("Embedded batches have different dimensions; clear the checkpoint directory and rebuild.")
+    return np.vstack(results)
+
+
+def clear_checkpoints(checkpoint_dir):
+    if checkpoint_dir and os.path.isdir(checkpoint_dir):
+        shutil.rmtree(checkpoint_dir)
+
+
+def build_faiss_from_documents(docs, embed_model, ids=None, checkpoint_dir=None, index_type="flat",
+                               index_params=None, **kwargs):
+    # Drop-in replacement for FAISS.from_documents that goes through the batched embedder
+    # and can build any of the index types from faiss_index_factory
+    texts = [doc.page_content for doc in docs]
+    vectors = embed_texts(texts, embed_model, checkpoint_dir=checkpoint_dir, **kwargs)
+    index = create_index(index_type, vectors.shape[1], vectors, **(index_params or {}))
+    vector_db = empty_vector_store(embed_model, index)
+    vector_db.add_embeddings(
+        list(zip(texts, vectors.tolist())),
+        metadatas=[doc.metadata for doc in docs],
+        ids=ids,
+    )
+    return vector_db
+
+
+def add_documents_batched(vector_db, docs, ids=None, checkpoint_dir=None, **kwargs):
+    if not docs:
+        return []
+    texts = [doc.page_content for doc in docs]
+    vectors = embed_texts(texts, vector_db.embedding_function, checkpoint_dir=checkpoint_dir, **kwargs)
+    return vector_db.add_embeddings(
+        list(zip(texts, vectors.tolist())),
+        metadatas=[doc.metadata for doc in docs],
+        ids=ids,
+    )
@@ -0,0 +1,247 @@
+"""
+Offline evaluation runner for the answer relevance, context relevance and
+groundedness feedbacks.
+
+Questions are answered by a pool of worker threads while the judge model scores
+finished answers in padded batches, so the RAG stages and judging overlap.
+Judge outputs are cached by a hash of (judge model, prompt): re-evaluating an
+unchanged answer costs no generation at all.
+
+    python evaluate_offline.py questions.txt --output eval_results.jsonl
+    python evaluate_offline.py questions.jsonl --answers answers.jsonl --tiny-judge   # dry run, scores mean nothing
+    python evaluate_offline.py questions.txt --judge-backend ollama --judge-model llama3
+
+`questions` is a text file with one question per line or a JSONL file with a
+"question" field. `--answers` takes JSONL with "question", "answer" and
+"contexts" and skips the RAG pipeline entirely.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+
+import numpy as np
+
+from judge_models import JUDGE_BACKEND, JUDGE_BACKENDS, get_judge
+
+ANSWER_WORKERS = 4
+JUDGE_BATCH_SIZE = 8
+JUDGE_FLUSH_SECONDS = 0.5     # score a partial batch if no new prompt arrives in this time
+JUDGE_CACHE_PATH = "judge_cache.sqlite3"
+STUB_JUDGE_MODEL = "sshleifer/tiny-gpt2"   # tiny CPU stand-in for the Llama judge (--tiny-judge)
+JUDGE_MAX_NEW_TOKENS = 8                   # only a score is needed
+
+ANSWER_RELEVANCE_PROMPT = (
+    "Evaluate the relevance of the response: {response} to the query: {query}.\n"
+    "Rate the relevance from 0 to 10.\nScore:"
+)
+CONTEXT_RELEVANCE_PROMPT = (
+    "Evaluate the relevance of the context: {context} to the query: {query}.\n"
+    "Rate the relevance from 0 to 10.\nScore:"
+)
+GROUNDEDNESS_PROMPT = (
+    "Source: {context}\n\nStatement: {response}\n\n"
+    "Rate from 0 to 10 how well the statement is supported by the source.\nScore:"
+)
+
+
+def load_questions(path):
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            questions.append(json.loads(line)["question"] if line.startswith("{") else line)
+    return questions
+
+
+def load_answers(path):
+    answers = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                answers[row["question"]] = (row["answer"], row.get("contexts", []))
+    return answers
+
+
+def parse_score(text):
+    # First number in the judge output, scaled from 0-10 to 0-1
+    match = re.search(r"\d+(?:\.\d+)?", text)
+    if not match:
+        return None
+    return min(max(float(match.group()) / 10.0, 0.0), 1.0)
+
+
+def judge_prompts(question, answer, contexts):
+    prompts = [("answer_relevance", ANSWER_RELEVANCE_PROMPT.format(response=answer, query=question))]
+    for context in contexts:
+        prompts.append(("context_relevance", CONTEXT_RELEVANCE_PROMPT.format(context=context, query=question)))
+    if contexts:
+        prompts.append(("groundedness", GROUNDEDNESS_PROMPT.format(context="\n\n".join(contexts), response=answer)))
+    return prompts
+
+
+class JudgeCache:
+    def __init__(self, path=JUDGE_CACHE_PATH):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS judgements (key TEXT PRIMARY KEY, output TEXT NOT NULL)")
+
+    @staticmethod
+    def key(model_name, prompt):
+        return hashlib.sha256(f"{model_name}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        rows = self._conn.execute(
+            f"SELECT key, output FROM judgements WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall()
+        return dict(rows)
+
+    def put_many(self, items):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO judgements VALUES (?, ?)", items)
+
+
+def rag_answer_fn():
+    from rag_pipeline import get_pipeline
+
+    rag = get_pipeline()
+
+    def answer(question):
+        # Fresh retrieval and generation every time: the semantic answer cache could return the answer
+        # to a similar question, and evaluation answers must not end up in the production cache
+        info = {"use_cache": False}
+        embedding = rag.embed_queries([question])[0]
+        result = "".join(rag.generate_answer(question, embedding, info))
+        return result, [doc.page_content for doc in info["source_documents"]]
+
+    return answer
+
+
+def run_evaluation(questions, answer_fn, judge, cache, answer_workers=ANSWER_WORKERS,
+                   batch_size=JUDGE_BATCH_SIZE, flush_seconds=JUDGE_FLUSH_SECONDS):
+    start = time.perf_counter()
+    results = [{"question": q, "scores": {}} for q in questions]
+    prompts = Queue()
+    counters = {"judge_prompts": 0, "judge_cache_hits": 0, "judge_batches": 0}
+
+    def answer_one(i):
+        try:
+            answer, contexts = answer_fn(results[i]["question"])
+        except Exception as e:
+            results[i]["error"] = str(e)
+            return
+        results[i]["answer"] = answer
+        results[i]["contexts"] = contexts
+        for metric, prompt in judge_prompts(results[i]["question"], answer, contexts):
+            prompts.put((i, metric, prompt))
+
+    def produce():
+        with ThreadPoolExecutor(max_workers=answer_workers) as executor:
+            list(executor.map(answer_one, range(len(questions))))
+        prompts.put(None)
+
+    def flush(batch):
+        keys = [cache.key(judge.model_name, prompt) for _, _, prompt in batch]
+        outputs = cache.get_many(list(set(keys)))
+        missing = list(dict.fromkeys(key for key in keys if key not in outputs))
+        if missing:
+            prompt_by_key = {key: prompt for key, (_, _, prompt) in zip(keys, batch)}
+            generated = judge.generate_batch([prompt_by_key[key] for key in missing])
+            outputs.update(zip(missing, generated))
+            cache.put_many(list(zip(missing, generated)))
+            counters["judge_batches"] += 1
+        counters["judge_prompts"] += len(batch)
+        counters["judge_cache_hits"] += len(batch) - len(missing)
+        for key, (i, metric, _) in zip(keys, batch):
+            results[i]["scores"].setdefault(metric, []).append(parse_score(outputs[key]))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    # Judge on this thread while answers are still being produced
+    batch = []
+    while True:
+        try:
+            item = prompts.get(timeout=flush_seconds)
+        except Empty:
+            if batch:
+                flush(batch)
+                batch = []
+            continue
+        if item is None:
+            break
+        batch.append(item)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    producer.join()
+
+    # Aggregate like the TruLens feedbacks: context relevance is the mean over contexts
+    for result in results:
+        result["scores"] = {
+            metric: float(np.mean(valid)) if (valid := [s for s in scores if s is not None]) else None
+            for metric, scores in result["scores"].items()
+        }
+    summary = {
+        metric: float(np.mean(values))
+        for metric in ("answer_relevance", "context_relevance", "groundedness")
+        if (values := [r["scores"][metric] for r in results if r["scores"].get(metric) is not None])
+    }
+    summary.update(counters, questions=len(questions), seconds=time.perf_counter() - start)
+    return results, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline offline with a local judge model.")
+    parser.add_argument("questions", help="text file (one question per line) or JSONL with a 'question' field")
+    parser.add_argument("--output", default="eval_results.jsonl")
+    parser.add_argument("--answers", help="JSONL of precomputed answers/contexts instead of running the pipeline")
+    parser.add_argument("--judge-backend", choices=sorted(JUDGE_BACKENDS),
+                        help=f"judge backend (default: $JUDGE_BACKEND, currently {JUDGE_BACKEND})")
+    parser.add_argument("--judge-model", help="judge model (default: the backend's configured model, see judge_models.py)")
+    parser.add_argument("--tiny-judge", action="store_true",
+                        help=f"score with {STUB_JUDGE_MODEL} on CPU, to dry-run the pipeline (the scores mean nothing)")
+    parser.add_argument("--answer-workers", type=int, default=ANSWER_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=JUDGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if args.answers:
+        answers = load_answers(args.answers)
+        answer_fn = lambda question: answers[question]
+    else:
+        answer_fn = rag_answer_fn()
+
+    if args.tiny_judge:
+        judge = get_judge("transformers", model_name=STUB_JUDGE_MODEL, max_new_tokens=JUDGE_MAX_NEW_TOKENS, device="cpu")
+    elif (args.judge_backend or JUDGE_BACKEND) == "stub":
+        judge = get_judge("stub")
+    else:
+        # Same judge as utils.py unless overridden; only the score is generated
+        kwargs = {"max_new_tokens": JUDGE_MAX_NEW_TOKENS}
+        if args.judge_model:
+            kwargs["model_name"] = args.judge_model
+        judge = get_judge(args.judge_backend, **kwargs)
+
+    results, summary = run_evaluation(
+        questions, answer_fn, judge, JudgeCache(),
+        answer_workers=args.answer_workers, batch_size=args.batch_size,
+    )
+    with open(args.output, "w") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Factory for the FAISS index types we can deploy with.
+
+    flat   exact search, scans every vector (the LangChain default)
+    ivf    inverted lists over k-means cells, searches `nprobe` cells
+    hnsw   graph-based search, no training needed
+    pq     product-quantized codes, smallest memory footprint
+    ivfpq  inverted lists with product-quantized codes
+
+Trained state (IVF centroids, PQ codebooks, the HNSW graph) is part of the
+index itself, so it is persisted by `faiss.write_index` / `FAISS.save_local`
+and comes back with `FAISS.load_local`.
+"""
+
+import math
+
+import faiss
+import numpy as np
+from langchain.vectorstores import FAISS
+from langchain.docstore.in_memory import InMemoryDocstore
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+
+# Default parameters per index type; search-time ones are re-applied after loading
+DEFAULT_PARAMS = {
+    "nlist": None,      # IVF cells, defaults to ~4 * sqrt(n)
+    "nprobe": 8,        # IVF cells visited per query
+    "pq_m": 64,         # PQ sub-quantizers (lowered to a divisor of the dimension)
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+}
+
+
+def _pq_m(dim, requested):
+    m = min(requested, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _nlist(n, requested):
+    if requested:
+        return requested
+    return max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+
+
+def create_index(kind, dim, training_vectors=None, **params):
+    params = {**DEFAULT_PARAMS, **params}
+    n = 0 if training_vectors is None else len(training_vectors)
+
+    # PQ codebooks need 2**nbits points per sub-quantizer; fall back to exact search on tiny corpora
+    if kind in ("pq", "ivfpq") and n < 2 ** params["pq_nbits"]:
+        print(f"Only {n} vectors, too few to train a {kind} index. Using a flat index instead.")
+        kind = "flat"
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif kind == "pq":
+        index = faiss.IndexPQ(dim, _pq_m(dim, params["pq_m"]), params["pq_nbits"])
+    elif kind == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, _nlist(n, params["nlist"]))
+    elif kind == "ivfpq":
+        index = faiss.IndexIVFPQ(
+            faiss.IndexFlatL2(dim), dim, _nlist(n, params["nlist"]), _pq_m(dim, params["pq_m"]), params["pq_nbits"]
+        )
+    else:
+        raise ValueError(f"Unknown FAISS index type '{kind}'. Choose from {', '.join(INDEX_TYPES)}.")
+
+    if not index.is_trained:
+        if training_vectors is None:
+            raise ValueError(f"A {kind} index needs training vectors.")
+        index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+
+    configure_search(index, **params)
+    return index
+
+
+def configure_search(index, **params):
+    # Search-time knobs are not always persisted, so they are set again after every load
+    params = {**DEFAULT_PARAMS, **params}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = params["nprobe"]
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params["ef_search"]
+    return index
+
+
+def empty_vector_store(embed_model, index):
+    return FAISS(embed_model, index, InMemoryDocstore(), {})
+
+
+def index_memory_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
@@ -1,10 +1,39 @@
+"""
+Upload of model and NetCDF directories to the lab server.
+
+`upload_folder` is the original single-channel recursive scp. `sync_folder` is
+the transfer engine used for the multi-GB directories: it walks the local tree,
+skips files whose size and sha256 match the remote manifest, and uploads the
+rest over several parallel SFTP connections. Files are sent in fixed-size
+chunks written at their offsets into `<file>.part`; finished chunks are
+recorded in a local state file, so a dropped connection resumes where it
+stopped. Each file is verified against its sha256 before the .part file is
+renamed into place. With delta=True, files that already have an outdated
+remote copy are sent as rsync-style block deltas instead (see delta_sync).
+"""
+
 import paramiko
-from secrets import remote_host,remote_user,remote_password
-from scp import SCPClient
 import os
+try:
+    from secrets import remote_host,remote_user,remote_password
+except ImportError:
+    # No local secrets.py (the stdlib module is found instead): take the server from the environment
+    remote_host = os.environ.get("TRANSFER_HOST")
+    remote_user = os.environ.get("TRANSFER_USER")
+    remote_password = os.environ.get("TRANSFER_PASSWORD")
+from scp import SCPClient
+import hashlib
+import json
+import posixpath
+import queue
+import shlex
+import threading
 import time
 from paramiko.ssh_exception import SSHException
 
+from delta_sync import RemoteHelperError, send_delta
+from index_manifest import source_state
+
 # Define connection details    
 local_folder = "/home/ajai-krishna/Downloads/extracted_models-20250130T045853Z-001" 
 remote_folder = "/home/cccs/Documents/Anjishnu/India_Climate_Report/data/India_netcdf" 
@@ -14,6 +43,13 @@ MAX_RETRIES = 3
 RETRY_DELAY = 5  # seconds
 TIMEOUT = 30     # seconds
 
+# Transfer engine settings
+PARALLEL_CONNECTIONS = 4
+CHUNK_SIZE = 16 * 1024 * 1024               # unit of upload and of resume
+BLOCK_SIZE = 1024 * 1024
+REMOTE_MANIFEST = ".transfer_manifest.json"  # in the remote root: relpath -> size, sha256
+STATE_PATH = ".transfer_state.json"          # local: file hashes and chunks already uploaded
+
 def create_scp_client():
     for attempt in range(MAX_RETRIES):
         try:
@@ -68,6 +104,341 @@ def upload_folder(local_path, remote_path):
             except Exception as e:
                 print(f"Error closing connections: {str(e)}")
 
+def connect(host=None, port=22, username=None, password=None, compress=False):
+    # SSH connection with the create_scp_client retry policy; raises once the retries are used up
+    for attempt in range(MAX_RETRIES):
+        try:
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh.connect(
+                host or remote_host,
+                port=port,
+                username=username or remote_user,
+                password=password or remote_password,
+                timeout=TIMEOUT,
+                banner_timeout=TIMEOUT,
+                compress=compress     # zlib on the SSH transport, for the SFTP chunks
+            )
+            ssh.get_transport().set_keepalive(30)
+            return ssh
+        except (paramiko.SSHException, OSError) as e:
+            print(f"Connection attempt {attempt + 1} failed: {str(e)}")
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(RETRY_DELAY)
+
+def local_manifest(local_path, previous=None):
+    # relpath -> {sha256, size, mtime_ns, path}; hashes are reused while size and mtime are unchanged
+    paths = []
+    for root, dirs, files in os.walk(local_path):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+    state = source_state(paths, previous)
+    return {
+        os.path.relpath(path, local_path).replace(os.sep, "/"): {**entry, "path": path}
+        for path, entry in state.items()
+    }
+
+def read_remote_manifest(sftp, remote_path):
+    try:
+        with sftp.open(posixpath.join(remote_path, REMOTE_MANIFEST), "r") as f:
+            return json.loads(f.read()).get("files", {})
+    except (IOError, ValueError):
+        return {}
+
+def write_remote_manifest(sftp, remote_path, files):
+    path = posixpath.join(remote_path, REMOTE_MANIFEST)
+    with sftp.open(path + ".part", "w") as f:
+        f.write(json.dumps({"files": files}, indent=1, sort_keys=True))
+    sftp.posix_rename(path + ".part", path)
+
+def remote_stat(sftp, path):
+    try:
+        return sftp.stat(path)
+    except IOError:
+        return None
+
+def remote_sha256(ssh, path):
+    # sha256sum on the server; None when the server does not run commands (e.g. SFTP-only accounts)
+    try:
+        _, stdout, _ = ssh.exec_command(f"sha256sum -- {shlex.quote(path)}", timeout=TIMEOUT)
+        output = stdout.read().decode().split()
+        if stdout.channel.recv_exit_status() == 0 and output:
+            return output[0]
+    except (SSHException, OSError):
+        pass
+    return None
+
+def read_back_sha256(sftp, path):
+    digest = hashlib.sha256()
+    with sftp.open(path, "rb") as f:
+        f.prefetch()
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_remote_dirs(sftp, path, existing):
+    if path in existing or path in ("", "/"):
+        return
+    make_remote_dirs(sftp, posixpath.dirname(path), existing)
+    if remote_stat(sftp, path) is None:
+        sftp.mkdir(path)
+    existing.add(path)
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+class FolderSync:
+    # One sync_folder run: chunk queue, per-file progress and the worker connections
+    def __init__(self, server, state, state_path, workers, chunk_size):
+        self.server = server
+        self.state = state
+        self.state_path = state_path
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.tasks = queue.Queue()
+        self.uploads = state.setdefault("uploads", {})
+        self.verified = state.setdefault("verified", {})   # host:path -> sha256 of files confirmed on the server
+        self.finished = {}           # relpath -> remote manifest entry
+        self.bytes_sent = 0
+        self._saved_at = 0.0
+
+    def save_state(self, force=False):
+        # Called with the lock held; throttled so thousands of small files do not rewrite it per chunk
+        now = time.monotonic()
+        if force or now - self._saved_at > 1.0:
+            tmp = self.state_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_path)
+            self._saved_at = now
+
+    def plan(self, sftp, item):
+        # Queue the chunks of one file, resuming a .part left by an interrupted run
+        key = f"{self.server['host']}:{item['remote']}"
+        if item.get("delta"):
+            item.update(key=key, failed=False)
+            self.tasks.put((item, None))
+            return
+        n_chunks = max(1, -(-item["size"] // self.chunk_size))
+        upload = self.uploads.get(key)
+        part = remote_stat(sftp, item["part"])
+        if not (upload and upload["sha256"] == item["sha256"] and upload["chunk_size"] == self.chunk_size and part):
+            upload = {"sha256": item["sha256"], "chunk_size": self.chunk_size, "done": []}
+            sftp.open(item["part"], "w").close()
+        self.uploads[key] = upload
+        item.update(key=key, upload=upload, pending=n_chunks - len(upload["done"]), failed=False)
+        if upload["done"]:
+            print(f"Resuming '{item['rel']}': {len(upload['done'])}/{n_chunks} chunks already uploaded")
+        if item["pending"] == 0:
+            self.tasks.put((item, None))
+        for index in range(n_chunks):
+            if index not in upload["done"]:
+                self.tasks.put((item, index))
+
+    def upload_chunk(self, sftp, item, index):
+        offset = index * self.chunk_size
+        remaining = min(self.chunk_size, item["size"] - offset)
+        with open(item["path"], "rb") as src, sftp.open(item["part"], "r+b") as dst:
+            dst.set_pipelined(True)
+            src.seek(offset)
+            dst.seek(offset)
+            while remaining > 0:
+                block = src.read(min(BLOCK_SIZE, remaining))
+                dst.write(block)
+                remaining -= len(block)
+        # Leaving the with block waits for the server to acknowledge every write
+        return min(self.chunk_size, item["size"] - offset)
+
+    def finalize(self, ssh, sftp, item):
+        sha256 = remote_sha256(ssh, item["part"]) or read_back_sha256(sftp, item["part"])
+        with self.lock:
+            if sha256 != item["sha256"]:
+                # Corrupt .part: forget its chunks so the next run sends the file again
+                item["upload"]["done"] = []
+                self.save_state(force=True)
+                print(f"Checksum mismatch for '{item['rel']}', it will be re-sent on the next run")
+                return
+        sftp.posix_rename(item["part"], item["remote"])
+        self.done(item)
+        print(f"Uploaded '{item['rel']}' ({item['size'] / 1e6:.1f} MB)")
+
+    def done(self, item):
+        with self.lock:
+            self.finished[item["rel"]] = {"sha256": item["sha256"], "size": item["size"]}
+            self.verified[item["key"]] = item["sha256"]
+            self.uploads.pop(item["key"], None)
+            self.save_state()
+
+    def delta(self, ssh, sftp, item):
+        # Send only the blocks that differ from the remote copy; whole-file chunks when the server can't do it
+        try:
+            result = send_delta(ssh, item["path"], item["remote"], item["sha256"], timeout=TIMEOUT)
+        except (RemoteHelperError, SSHException) as e:
+            if not ssh.get_transport().is_active():
+                raise
+            # No python3 or no commands allowed on the server
+            print(f"No delta sync for '{item['rel']}' ({str(e)}), sending the whole file")
+            item["delta"] = False
+            try:
+                with self.lock:
+                    self.plan(sftp, item)
+            except (SSHException, OSError):
+                item["delta"] = True     # the retry tries the delta again
+                raise
+            return
+        with self.lock:
+            self.bytes_sent += result["bytes_sent"] + result["bytes_received"]
+        self.done(item)
+        print(f"Delta-synced '{item['rel']}' ({item['size'] / 1e6:.1f} MB, "
+              f"{(result['bytes_sent'] + result['bytes_received']) / 1e6:.2f} MB transferred)")
+
+    def worker(self):
+        ssh = sftp = None
+        while True:
+            try:
+                item, index = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if item["failed"]:
+                continue
+            for attempt in range(MAX_RETRIES):
+                try:
+                    if ssh is None:
+                        ssh = connect(**self.server)
+                        sftp = ssh.open_sftp()
+                    if item.get("delta"):
+                        self.delta(ssh, sftp, item)
+                        break
+                    if index is not None:
+                        sent = self.upload_chunk(sftp, item, index)
+                        with self.lock:
+                            self.bytes_sent += sent
+                            item["upload"]["done"].append(index)
+                            item["pending"] -= 1
+                            last = item["pending"] == 0
+                            self.save_state()
+                        index = None     # a retry after this point only repeats the verification
+                        if not last:
+                            break
+                    self.finalize(ssh, sftp, item)
+                    break
+                except (paramiko.SSHException, OSError, EOFError) as e:
+                    print(f"Transfer of '{item['rel']}' interrupted ({str(e) or type(e).__name__}), reconnecting...")
+                    if ssh is not None:
+                        ssh.close()
+                    ssh = sftp = None
+                    if attempt == MAX_RETRIES - 1:
+                        item["failed"] = True
+        if ssh is not None:
+            ssh.close()
+
+    def run(self):
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+def sync_folder(local_path, remote_path, server=None, workers=PARALLEL_CONNECTIONS,
+                chunk_size=CHUNK_SIZE, state_path=STATE_PATH, delta=False, compress=False):
+    # Upload only what changed, over parallel SFTP connections; returns the transfer stats.
+    # server: dict of connect() arguments (host, port, username, password), defaults to secrets.py.
+    # delta: files with an outdated remote copy send only their changed blocks (see delta_sync);
+    # compress: zlib-compress the SSH stream carrying the SFTP chunks.
+    if not os.path.exists(local_path):
+        print(f"Error: Local path '{local_path}' does not exist")
+        return None
+    server = {"host": remote_host, "port": 22, "username": remote_user, "password": remote_password,
+              "compress": compress, **(server or {})}
+    state = load_state(state_path)
+    start = time.perf_counter()
+
+    print(f"Hashing files in '{local_path}'...")
+    files = local_manifest(local_path, state)
+    state["sources"] = {entry["path"]: {k: entry[k] for k in ("sha256", "size", "mtime_ns")} for entry in files.values()}
+
+    ssh = connect(**server)
+    sftp = ssh.open_sftp()
+    sync = FolderSync(server, state, state_path, workers, chunk_size)
+    skipped = 0
+    to_send = []
+    try:
+        remote_files = read_remote_manifest(sftp, remote_path)
+        existing_dirs = set()
+        make_remote_dirs(sftp, remote_path, existing_dirs)
+        for rel, entry in files.items():
+            remote = posixpath.join(remote_path, rel)
+            stat = remote_stat(sftp, remote)
+            if stat is not None and stat.st_size == entry["size"]:
+                known = remote_files.get(rel, {}).get("sha256") or sync.verified.get(f"{server['host']}:{remote}")
+                if known is None:
+                    # Uploaded before the manifest existed (e.g. by upload_folder): ask the server
+                    known = remote_sha256(ssh, remote)
+                if known == entry["sha256"]:
+                    remote_files[rel] = {"sha256": known, "size": entry["size"]}
+                    skipped += 1
+                    continue
+            make_remote_dirs(sftp, posixpath.dirname(remote), existing_dirs)
+            to_send.append({**entry, "rel": rel, "remote": remote, "part": remote + ".part",
+                            "delta": delta and stat is not None and entry["size"] > 0})
+
+        total_bytes = sum(item["size"] for item in to_send)
+        print(f"{skipped} unchanged files skipped; sending {len(to_send)} files ({total_bytes / 1e6:.1f} MB) "
+              f"over {workers} connections...")
+        for item in to_send:
+            sync.plan(sftp, item)
+        sync.run()
+
+        remote_files.update(sync.finished)
+        write_remote_manifest(sftp, remote_path, remote_files)
+    except (paramiko.SSHException, OSError, EOFError) as e:
+        # Lost the connection: what was uploaded is in the state file and resumes on the next run
+        print(f"Transfer interrupted: {str(e) or type(e).__name__}")
+    finally:
+        with sync.lock:
+            sync.save_state(force=True)
+        ssh.close()
+
+    elapsed = time.perf_counter() - start
+    content = sum(entry["size"] for entry in sync.finished.values())
+    stats = {
+        "files_sent": len(sync.finished),
+        "files_skipped": skipped,
+        "files_failed": sorted(item["rel"] for item in to_send if item["rel"] not in sync.finished),
+        "files_delta": sum(1 for item in to_send if item.get("delta") and item["rel"] in sync.finished),
+        "bytes_sent": sync.bytes_sent,       # payload actually transferred (deltas, not whole files)
+        "seconds": elapsed,
+        "mb_per_second": content / 1e6 / elapsed if elapsed > 0 else 0.0,
+    }
+    print(f"Sent {stats['files_sent']} files ({stats['files_delta']} as deltas) in {elapsed:.1f}s: "
+          f"{content / 1e6:.1f} MB of files for {sync.bytes_sent / 1e6:.1f} MB transferred, "
+          f"{stats['mb_per_second']:.1f} MB/s; {skipped} skipped, {len(stats['files_failed'])} failed")
+    if stats["files_failed"]:
+        print("Run again to resume the failed files: " + ", ".join(stats["files_failed"]))
+    return stats
+
 # Run the upload
 if __name__ == "__main__":
-    upload_folder(local_folder, remote_folder)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Upload a model/data folder to the lab server.")
+    parser.add_argument("local", nargs="?", default=local_folder)
+    parser.add_argument("remote", nargs="?", default=remote_folder)
+    parser.add_argument("--workers", type=int, default=PARALLEL_CONNECTIONS, help="parallel SFTP connections")
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_SIZE // (1024 * 1024))
+    parser.add_argument("--port", type=int, default=22)
+    parser.add_argument("--delta", action="store_true", help="send only changed blocks of files already on the server")
+    parser.add_argument("--compress", action="store_true", help="compress the SSH stream")
+    parser.add_argument("--scp", action="store_true", help="single recursive scp (the old upload_folder)")
+    args = parser.parse_args()
+    if args.scp:
+        upload_folder(args.local, args.remote)
+    else:
+        sync_folder(args.local, args.remote, server={"port": args.port}, workers=args.workers,
+                    chunk_size=args.chunk_mb * 1024 * 1024, delta=args.delta, compress=args.compress)
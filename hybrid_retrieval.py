@@ -0,0 +1,155 @@
+"""
+Hybrid lexical + dense retrieval over the FAISS index.
+
+A BM25 inverted index over the same chunks is built at ingest time and saved
+next to the FAISS files. Queries run against both, and the two rankings are
+merged with reciprocal rank fusion, so exact terms such as "RCP4.5",
+"Godavari" or "2080s" are found even when the dense ranking misses them.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from langchain.schema import BaseRetriever
+
+from metrics import metrics
+from retrieval_depth import l2_to_cosine
+
+LEXICAL_INDEX_NAME = "bm25.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60          # damping constant from the reciprocal rank fusion paper
+FETCH_K = 20        # candidates taken from each ranking before fusion
+
+# Keeps tokens like "rcp4.5", "2080s" and "semi-arid" intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, postings=None, doc_lengths=None):
+        self.postings = postings or {}        # term -> {doc_id: term frequency}
+        self.doc_lengths = doc_lengths or {}  # doc_id -> number of tokens
+        self._refresh()
+
+    def _refresh(self):
+        self.avg_length = sum(self.doc_lengths.values()) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        n = len(self.doc_lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def add(self, doc_id, text):
+        # Call _refresh() (or save and load) before searching after adding documents
+        tokens = tokenize(text)
+        self.doc_lengths[doc_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    @classmethod
+    def from_texts(cls, texts_by_id):
+        lexical_index = cls()
+        for doc_id, text in texts_by_id.items():
+            lexical_index.add(doc_id, text)
+        lexical_index._refresh()
+        return lexical_index
+
+    @classmethod
+    def from_vector_store(cls, vector_db):
+        docstore = vector_db.docstore
+        return cls.from_texts({
+            doc_id: docstore.search(doc_id).page_content
+            for doc_id in vector_db.index_to_docstore_id.values()
+        })
+
+    def search(self, query, k=FETCH_K):
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, index_dir):
+        tmp_path = os.path.join(index_dir, LEXICAL_INDEX_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"postings": self.postings, "doc_lengths": self.doc_lengths}, f)
+        os.replace(tmp_path, os.path.join(index_dir, LEXICAL_INDEX_NAME))
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, LEXICAL_INDEX_NAME)) as f:
+            data = json.load(f)
+        return cls(data["postings"], data["doc_lengths"])
+
+
+def load_or_build_lexical_index(vector_db, index_dir):
+    try:
+        return BM25Index.load(index_dir)
+    except (OSError, ValueError, KeyError):
+        print("Lexical index not found. Building it from the FAISS docstore...")
+        lexical_index = BM25Index.from_vector_store(vector_db)
+        lexical_index.save(index_dir)
+        return lexical_index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    # rankings: lists of doc ids, best first. Returns [(doc_id, fused score)], best first.
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def dense_search_with_scores(vector_db, query_embedding, k=FETCH_K):
+    # [(doc_id, cosine similarity)], best first
+    vector = np.asarray([query_embedding], dtype=np.float32)
+    distances, indices = vector_db.index.search(vector, k)
+    return [(vector_db.index_to_docstore_id[i], l2_to_cosine(d)) for d, i in zip(distances[0], indices[0]) if i != -1]
+
+
+def dense_search(vector_db, query_embedding, k=FETCH_K):
+    return [doc_id for doc_id, _ in dense_search_with_scores(vector_db, query_embedding, k)]
+
+
+class HybridRetriever(BaseRetriever):
+    vector_db: object
+    lexical_index: object
+    k: int = 5
+    fetch_k: int = FETCH_K
+
+    def search_with_scores(self, query, query_embedding=None, k=None):
+        # [(doc, score)] in fused (RRF) order. RRF scores only reflect rank within this index, so the
+        # score given is the cosine similarity of the dense result at the same rank: it keeps the
+        # fused order and can be compared across indexes (see sharded_index.py)
+        if query_embedding is None:
+            query_embedding = self.vector_db.embedding_function.embed_query(query)
+        with metrics.timer("search_dense"):
+            dense = dense_search_with_scores(self.vector_db, query_embedding, self.fetch_k)
+        with metrics.timer("search_lexical"):
+            lexical = [doc_id for doc_id, _ in self.lexical_index.search(query, self.fetch_k)]
+        fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in dense], lexical])[:k or self.k]
+        similarities = [score for _, score in dense] or [0.0]
+        return [
+            (self.vector_db.docstore.search(doc_id), similarities[min(rank, len(similarities) - 1)])
+            for rank, (doc_id, _) in enumerate(fused)
+        ]
+
+    def search(self, query, query_embedding=None):
+        return [doc for doc, _ in self.search_with_scores(query, query_embedding)]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search(query)
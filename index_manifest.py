@@ -0,0 +1,88 @@
+"""
+Content-addressed manifest for the saved FAISS index.
+
+The manifest lives in the index directory and records what the index was built
+from: source file hashes, the ids of every chunk (a hash of its text and
+source), the splitter parameters and the embedding model. Comparing it with the
+current corpus tells the pipeline whether the index can be used as is, updated
+incrementally or has to be rebuilt from scratch.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_state(paths, previous=None):
+    # Hash each source file, reusing the previous hash when size and mtime are unchanged
+    previous_sources = (previous or {}).get("sources", {})
+    state = {}
+    for path in paths:
+        stat = os.stat(path)
+        old = previous_sources.get(path)
+        if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            sha256 = old["sha256"]
+        else:
+            sha256 = file_sha256(path)
+        state[path] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return state
+
+
+def sources_unchanged(manifest, sources):
+    old = manifest.get("sources", {})
+    return old.keys() == sources.keys() and all(old[p]["sha256"] == sources[p]["sha256"] for p in sources)
+
+
+def iter_chunk_ids(docs):
+    # Chunk id = hash of source + text, so page renumbering alone does not force re-embedding.
+    # Repeated identical chunks get an occurrence suffix to keep ids unique.
+    # Yields (chunk id, doc), so chunks can be streamed.
+    seen = {}
+    for doc in docs:
+        source = str(doc.metadata.get("source", ""))
+        digest = hashlib.sha256(f"{source}\x00{doc.page_content}".encode("utf-8")).hexdigest()
+        count = seen.get(digest, 0)
+        seen[digest] = count + 1
+        yield (digest if count == 0 else f"{digest}-{count}"), doc
+
+
+def chunk_ids(docs):
+    return [doc_id for doc_id, _ in iter_chunk_ids(docs)]
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(index_dir, params, sources, ids):
+    manifest = {"version": MANIFEST_VERSION, "params": params, "sources": sources, "chunks": list(ids)}
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_path = os.path.join(index_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_NAME))
+    return manifest
+
+
+def diff_chunks(manifest, ids):
+    old = set(manifest.get("chunks", []))
+    new = set(ids)
+    return new - old, old - new
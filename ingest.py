@@ -0,0 +1,259 @@
+"""
+Streaming ingestion of a directory of PDF reports into the FAISS index shards.
+
+    python ingest.py /home/ml_user/data/chat_bot/reports --workers 4
+
+Pages are extracted by a process pool a few pages at a time and flow through
+the splitter and the batched embedder as generators. Every embedded batch is
+added to the FAISS index and written straight to the SQLite docstore, so the
+chunk text is never held in memory. What does stay in memory grows with the
+size of the shard, not with its text: the vectors, the chunk ids and the BM25
+postings (term -> chunk id -> count), which are written to bm25.json when the
+shard is finished. Each PDF gets its own shard directory (index.faiss, docstore.sqlite3,
+bm25.json, manifest.json; see sharded_index.py) that rag_pipeline.py opens
+without parsing anything.
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+from embedding_pipeline import BATCH_SIZE, MAX_WORKERS, clear_checkpoints, embed_texts
+from faiss_index_factory import create_index
+from hybrid_retrieval import BM25Index
+from index_manifest import iter_chunk_ids, save_manifest
+from mmap_index_store import DOCSTORE_FILE, INDEX_FILE, create_docstore
+
+PAGES_PER_TASK = 8                        # pages extracted per process pool task
+EXTRACT_WORKERS = os.cpu_count() or 1
+CHUNKS_PER_BATCH = BATCH_SIZE * MAX_WORKERS * 2   # chunks handed to the embedder at once
+TRAINING_SAMPLE = 4096                    # vectors buffered to train ivf/pq indexes
+
+# Numbered headings ("3.2 Changes in the monsoon") and short all-caps lines ("EXECUTIVE SUMMARY")
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(\d+(?:\.\d+)*\.?[ \t]+[A-Z][^\n]{2,80}|[A-Z][A-Z0-9 ,&:\-]{4,80})[ \t]*$", re.MULTILINE
+)
+
+
+def find_pdfs(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def _page_count(path):
+    return len(PdfReader(path).pages)
+
+
+def _extract_pages(path, start, stop):
+    # Runs in a worker process; each task opens the file itself so nothing large is pickled
+    reader = PdfReader(path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def iter_pages(paths, max_workers=EXTRACT_WORKERS, pages_per_task=PAGES_PER_TASK):
+    # Yields one Document per page, in order, with the same metadata PyPDFLoader sets.
+    # At most 2 tasks per worker are in flight, so extracted text never piles up.
+    tasks = ((path, start, min(start + pages_per_task, n))
+             for path in paths
+             for n in [_page_count(path)]
+             for start in range(0, n, pages_per_task))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for path, start, stop in tasks:
+            in_flight.append((path, executor.submit(_extract_pages, path, start, stop)))
+            if len(in_flight) >= 2 * max_workers:
+                yield from _page_documents(*in_flight.popleft())
+        while in_flight:
+            yield from _page_documents(*in_flight.popleft())
+
+
+def _page_documents(path, future):
+    for page, text in future.result():
+        yield Document(page_content=text, metadata={"source": path, "page": page})
+
+
+def iter_chunks(pages, chunk_size, chunk_overlap):
+    # Each chunk also gets the section heading it falls under, carried across pages of a source
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+    source = section = None
+    for page in pages:
+        if page.metadata["source"] != source:
+            source, section = page.metadata["source"], ""
+        headings = [(m.start(), m.group(1).strip()) for m in HEADING_PATTERN.finditer(page.page_content)]
+        for chunk in splitter.split_documents([page]):
+            # A heading counts for the chunk if it starts before the chunk's midpoint
+            middle = chunk.metadata.pop("start_index") + len(chunk.page_content) // 2
+            while headings and headings[0][0] <= middle:
+                section = headings.pop(0)[1]
+            chunk.metadata["section"] = section
+            yield chunk
+
+
+def batched(iterable, n):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
+
+
+class StreamingIndexWriter:
+    # Builds index.faiss, docstore.sqlite3 and bm25.json batch by batch. Files are written
+    # next to the live ones and swapped in by finish(), so a failed run leaves the old index.
+    def __init__(self, path, index_type="flat", index_params=None):
+        self.path = path
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        os.makedirs(path, exist_ok=True)
+        self.conn = create_docstore(os.path.join(path, DOCSTORE_FILE + ".tmp"))
+        # In memory until finish(): the postings and ids grow with the shard's chunk count
+        self.lexical_index = BM25Index()
+        self.index = None
+        self.ids = []
+        self._pending = []   # (ids, docs, vectors) held back until a trained index exists
+
+    def add(self, ids, docs, vectors):
+        if self.index is None and self.index_type in ("flat", "hnsw"):
+            self.index = create_index(self.index_type, vectors.shape[1], **self.index_params)
+        if self.index is None:
+            self._pending.append((ids, docs, vectors))
+            if sum(len(v) for _, _, v in self._pending) >= TRAINING_SAMPLE:
+                self._train_and_flush()
+            return
+        self._write(ids, docs, vectors)
+
+    def _train_and_flush(self):
+        training_vectors = np.vstack([vectors for _, _, vectors in self._pending])
+        self.index = create_index(self.index_type, training_vectors.shape[1], training_vectors, **self.index_params)
+        pending, self._pending = self._pending, []
+        for ids, docs, vectors in pending:
+            self._write(ids, docs, vectors)
+
+    def _write(self, ids, docs, vectors):
+        start = self.index.ntotal
+        self.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO positions VALUES (?, ?)", [(start + i, doc_id) for i, doc_id in enumerate(ids)]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO docs VALUES (?, ?, ?)",
+                [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in zip(ids, docs)],
+            )
+        for doc_id, doc in zip(ids, docs):
+            self.lexical_index.add(doc_id, doc.page_content)
+        self.ids.extend(ids)
+
+    def finish(self, params, sources):
+        if self._pending:
+            self._train_and_flush()
+        if self.index is None:
+            raise ValueError("No text could be extracted from the PDFs, nothing to index.")
+        self.conn.close()
+        faiss.write_index(self.index, os.path.join(self.path, INDEX_FILE + ".tmp"))
+        os.replace(os.path.join(self.path, INDEX_FILE + ".tmp"), os.path.join(self.path, INDEX_FILE))
+        os.replace(os.path.join(self.path, DOCSTORE_FILE + ".tmp"), os.path.join(self.path, DOCSTORE_FILE))
+        if os.path.exists(os.path.join(self.path, "index.pkl")):
+            os.remove(os.path.join(self.path, "index.pkl"))
+        self.lexical_index.save(self.path)
+        save_manifest(self.path, params, sources, self.ids)
+
+
+def ingest_pdfs(paths, embed_model, index_dir, params, sources, chunk_size, chunk_overlap, index_type="flat",
+                index_params=None, max_workers=EXTRACT_WORKERS, checkpoint_dir=None, stats=None):
+    stats = {} if stats is None else stats
+    start = time.perf_counter()
+    pages = 0
+
+    def counted(page_iter):
+        nonlocal pages
+        for page in page_iter:
+            pages += 1
+            yield page
+
+    writer = StreamingIndexWriter(index_dir, index_type, index_params)
+    chunks = iter_chunk_ids(iter_chunks(counted(iter_pages(paths, max_workers)), chunk_size, chunk_overlap))
+    for batch in batched(chunks, CHUNKS_PER_BATCH):
+        ids = [doc_id for doc_id, _ in batch]
+        docs = [doc for _, doc in batch]
+        vectors = embed_texts([doc.page_content for doc in docs], embed_model, checkpoint_dir=checkpoint_dir)
+        writer.add(ids, docs, vectors)
+    writer.finish(params, sources)
+    clear_checkpoints(checkpoint_dir)
+
+    stats.update({
+        "files": len(paths),
+        "pages": pages,
+        "chunks": len(writer.ids),
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+    return stats
+
+
+def main():
+    # Imported here: rag_pipeline itself uses this module to build its index
+    import rag_pipeline
+    from embedding_cache import CachedEmbeddings
+    from embedding_pipeline import HashEmbeddings
+    from index_manifest import load_manifest, source_state, sources_unchanged
+    from langchain_ollama import OllamaEmbeddings
+    from sharded_index import shard_dir, shard_name
+
+    parser = argparse.ArgumentParser(description="Index every PDF in a directory, one index shard per PDF.")
+    parser.add_argument("directory", help="directory with the PDF reports (searched recursively)")
+    parser.add_argument("--index-dir", default=rag_pipeline.index_dir)
+    parser.add_argument("--index-type", default=rag_pipeline.index_type)
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="page extraction processes")
+    parser.add_argument("--hash-embeddings", action="store_true", help="use HashEmbeddings instead of Ollama (dry runs)")
+    args = parser.parse_args()
+
+    paths = find_pdfs(args.directory)
+    if not paths:
+        parser.error(f"No PDF files found in {args.directory}")
+    print(f"Ingesting {len(paths)} PDFs into {args.index_dir}...")
+
+    if args.hash_embeddings:
+        embed_model = HashEmbeddings()
+    else:
+        embed_model = CachedEmbeddings(OllamaEmbeddings(model=rag_pipeline.embed_model_name), rag_pipeline.embed_model_name)
+    params = {**rag_pipeline.index_params(), "index_type": args.index_type}
+    if args.hash_embeddings:
+        params["embed_model"] = embed_model.model
+
+    # Shards of unchanged reports are left alone; a new or changed report only rebuilds its own shard
+    for path in paths:
+        name = shard_name(path, args.directory)
+        path_dir = shard_dir(args.index_dir, name)
+        manifest = load_manifest(path_dir)
+        sources = source_state([path], manifest)
+        if manifest is not None and manifest["params"] == params and sources_unchanged(manifest, sources):
+            print(f"{name}: up to date.")
+            continue
+        stats = ingest_pdfs(
+            [path], embed_model, path_dir, params, sources,
+            chunk_size=rag_pipeline.chunk_size,
+            chunk_overlap=rag_pipeline.chunk_overlap,
+            index_type=args.index_type,
+            index_params=rag_pipeline.index_search_params,
+            max_workers=args.workers,
+            checkpoint_dir=path_dir + ".checkpoints",
+        )
+        print(f"{name}: indexed {stats['chunks']} chunks from {stats['pages']} pages "
+              f"in {stats['seconds']:.1f}s (peak memory {stats['peak_rss_mb']:.0f} MB).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Local judge models for the evaluation feedbacks, loaded on first use.
+
+    transformers   Hugging Face causal LM (the local Llama weights by default)
+    ollama         a model served by the local Ollama server
+    stub           no model at all; returns a fixed score, for tests and dry runs
+
+Every backend takes a list of prompts: the transformers backend generates them
+as one left-padded batch, the Ollama backend sends them concurrently.
+"""
+
+import os
+import threading
+
+JUDGE_BACKEND = os.environ.get("JUDGE_BACKEND", "transformers")
+JUDGE_MAX_NEW_TOKENS = 256
+
+# Local LLaMA judge
+#model_path = r"/home/ajai-krishna/Documents/llama_model/model"  # Update this path
+model_path = r"/home/ajai-krishna/data/models"
+model_name = "meta-llama/Llama-3.3-70B-Instruct"
+ollama_judge_model = "llama3"
+
+
+class TransformersJudge:
+    def __init__(self, model_name=model_name, weights_path=None, max_new_tokens=JUDGE_MAX_NEW_TOKENS, device=None):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        if device:
+            self.model = AutoModelForCausalLM.from_pretrained(weights_path or model_name).to(device)
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(
+                weights_path or model_name, torch_dtype=torch.bfloat16, device_map="auto"
+            )
+        self.model.eval()
+
+    def generate_batch(self, prompts):
+        import torch
+
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=2048)
+        inputs = inputs.to(self.model.device)
+        with torch.no_grad():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+        # Only the continuation, not the echoed prompt
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+
+class OllamaJudge:
+    def __init__(self, model_name=ollama_judge_model, max_new_tokens=JUDGE_MAX_NEW_TOKENS, max_concurrency=4):
+        from langchain_ollama import OllamaLLM
+
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.llm = OllamaLLM(model=model_name, temperature=0, num_predict=max_new_tokens)
+
+    def generate_batch(self, prompts):
+        return self.llm.batch(prompts, config={"max_concurrency": self.max_concurrency})
+
+
+class StubJudge:
+    def __init__(self, model_name="stub", score="5"):
+        self.model_name = model_name
+        self.score = score
+
+    def generate_batch(self, prompts):
+        return [f" {self.score}" for _ in prompts]
+
+
+JUDGE_BACKENDS = {"transformers": TransformersJudge, "ollama": OllamaJudge, "stub": StubJudge}
+
+_judges = {}
+_judges_lock = threading.Lock()
+
+
+def get_judge(backend=None, **kwargs):
+    # One judge per backend and settings, created the first time it is asked for
+    backend = backend or JUDGE_BACKEND
+    if backend not in JUDGE_BACKENDS:
+        raise ValueError(f"Unknown judge backend '{backend}'. Choose from {', '.join(JUDGE_BACKENDS)}.")
+    if backend == "transformers" and "model_name" not in kwargs:
+        # The configured local Llama weights unless another model is asked for
+        kwargs = {"model_name": model_name, "weights_path": model_path, **kwargs}
+
+    key = (backend, tuple(sorted(kwargs.items())))
+    judge = _judges.get(key)
+    if judge is None:
+        with _judges_lock:
+            judge = _judges.get(key)
+            if judge is None:
+                judge = _judges[key] = JUDGE_BACKENDS[backend](**kwargs)
+    return judge
@@ -0,0 +1,95 @@
+"""
+Load generator for rag_server.py.
+
+    python rag_server.py --fake --port 8000 &
+    python load_test_server.py --url http://localhost:8000 --users 50 --requests 500
+
+Reports latency and time-to-first-token percentiles plus how many requests
+were rejected (503) or ran past their deadline.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+QUESTIONS = [
+    "How will temperature change in India by 2050?",
+    "Which regions are most vulnerable to climate change?",
+    "What are adaptation strategies for agriculture?",
+    "How will the monsoon change?",
+    "What happens to Himalayan glaciers?",
+]
+
+
+async def one_request(client, url, query, timeout, results):
+    start = time.perf_counter()
+    first_token = None
+    try:
+        async with client.stream("POST", f"{url}/query", json={"query": query, "timeout": timeout}) as response:
+            if response.status_code != 200:
+                results.append({"status": response.status_code})
+                return
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "token" in event and first_token is None:
+                    first_token = time.perf_counter() - start
+                if "error" in event:
+                    results.append({"status": "deadline" if "Deadline" in event["error"] else "error"})
+                    return
+        results.append({"status": 200, "latency": time.perf_counter() - start, "ttft": first_token})
+    except httpx.HTTPError:
+        results.append({"status": "connection"})
+
+
+async def user(client, url, queue, timeout, results, unique):
+    while True:
+        try:
+            i = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        query = QUESTIONS[i % len(QUESTIONS)]
+        if unique:
+            query = f"{query} (request {i})"  # defeat the answer cache
+        await one_request(client, url, query, timeout, results)
+
+
+async def run(args):
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+    results = []
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=None) as client:
+        await asyncio.gather(*(user(client, args.url, queue, args.timeout, results, args.unique) for _ in range(args.users)))
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["status"] == 200]
+    print(f"{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.1f} req/s), {args.users} users")
+    for status in sorted({str(r["status"]) for r in results}):
+        print(f"  status {status}: {sum(str(r['status']) == status for r in results)}")
+    if ok:
+        for name in ("latency", "ttft"):
+            values = [r[name] for r in ok if r[name] is not None]
+            if values:
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                print(f"  {name:<8} p50 {p50:.3f}s  p95 {p95:.3f}s  p99 {p99:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RAG HTTP service.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request deadline sent to the server")
+    parser.add_argument("--unique", action="store_true", help="make every query unique so nothing is cached")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
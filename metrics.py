@@ -0,0 +1,128 @@
+"""
+Per-stage latency metrics for the RAG hot path.
+
+Stages time themselves with `metrics.timer("search")` or report a value with
+`metrics.observe("ttft", seconds)`. Every stage is kept as a histogram with
+fixed buckets (for Prometheus) plus a window of recent samples (for p50/p95).
+The process-wide `metrics` registry is shown in the Streamlit sidebar and served
+by rag_server.py at /metrics. Running totals (e.g. prompt tokens saved by
+context packing) are kept with `metrics.count(name, amount)` and shown in the
+same places. Per-query records are written as JSON lines to the "rag.metrics"
+logger, and to METRICS_LOG_PATH when that is set.
+
+Stages: embed, cache_lookup, search_dense, search_lexical, search, rerank,
+context_build, ttft, generation, tokens_per_second, total.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+RECENT_SAMPLES = 1000
+
+query_log = logging.getLogger("rag.metrics")
+if os.environ.get("METRICS_LOG_PATH"):
+    _handler = logging.FileHandler(os.environ["METRICS_LOG_PATH"])
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    query_log.addHandler(_handler)
+    query_log.setLevel(logging.INFO)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(int(q / 100 * len(values)), len(values) - 1)]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": max(self.recent) if self.recent else None,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                buckets = RATE_BUCKETS if name.endswith("_per_second") else LATENCY_BUCKETS
+                histogram = self._histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, record=None):
+        # Optionally also stores the duration in `record` (e.g. a per-query info dict)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed)
+            if record is not None:
+                record[name] = elapsed
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+    def prometheus_text(self, prefix="rag"):
+        lines = []
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                metric = f"{prefix}_{name}" if name.endswith("_per_second") else f"{prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.total}")
+                lines.append(f"{metric}_count {histogram.count}")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def log_query(self, record):
+        query_log.info(json.dumps({"ts": time.time(), **record}, default=str))
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,157 @@
+"""
+Compact on-disk format for the FAISS vector store.
+
+    index.faiss        FAISS index, opened memory-mapped where the index type supports it
+    docstore.sqlite3   chunk text + metadata and the FAISS position -> chunk id map
+
+LangChain's `save_local` pickles every Document into index.pkl, which each
+process has to unpickle in full on start. Here nothing but the index header is
+read up front: chunk text is fetched from SQLite only for the hits a query
+returns, and several worker processes share the same page cache for both files.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+import faiss
+from langchain.vectorstores import FAISS
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite3"
+
+# Read-only memory mapping; IO_FLAG_MMAP_IFC extends it to flat indexes on newer faiss builds
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def _connect(path, read_only):
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    # Documents are loaded on demand, one row per search() call
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute("SELECT text, metadata FROM docs WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?, ?)",
+                    [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()],
+                )
+
+    def delete(self, ids):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("DELETE FROM docs WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+
+class SQLiteIndexMap(MutableMapping):
+    # Lazy stand-in for FAISS.index_to_docstore_id (FAISS position -> chunk id)
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __getitem__(self, position):
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM positions WHERE position = ?", (int(position),)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __setitem__(self, position, doc_id):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO positions VALUES (?, ?)", (int(position), doc_id))
+
+    def __delitem__(self, position):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM positions WHERE position = ?", (int(position),))
+
+    def __iter__(self):
+        with self._lock:
+            positions = [row[0] for row in self._conn.execute("SELECT position FROM positions ORDER BY position")]
+        return iter(positions)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+
+def create_docstore(db_path):
+    # Fresh docstore database (replaces a leftover file from an interrupted write)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executescript("""
+            CREATE TABLE docs (id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL);
+        """)
+    return conn
+
+
+def save_vector_store(vector_db, path):
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(vector_db.index, os.path.join(path, INDEX_FILE + ".tmp"))
+
+    tmp_db = os.path.join(path, DOCSTORE_FILE + ".tmp")
+    conn = create_docstore(tmp_db)
+    with conn:
+        for position, doc_id in vector_db.index_to_docstore_id.items():
+            doc = vector_db.docstore.search(doc_id)
+            conn.execute("INSERT INTO positions VALUES (?, ?)", (int(position), doc_id))
+            conn.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", (doc_id, doc.page_content, json.dumps(doc.metadata)))
+    conn.close()
+
+    os.replace(os.path.join(path, INDEX_FILE + ".tmp"), os.path.join(path, INDEX_FILE))
+    os.replace(tmp_db, os.path.join(path, DOCSTORE_FILE))
+    # The pickled docstore of the old format is superseded
+    if os.path.exists(os.path.join(path, "index.pkl")):
+        os.remove(os.path.join(path, "index.pkl"))
+
+
+def load_vector_store(path, embeddings, lazy=True):
+    # Drop-in for FAISS.load_local. lazy=True memory-maps the index and reads chunks on demand
+    # (serving); lazy=False loads everything into memory so the store can be modified and re-saved.
+    db_path = os.path.join(path, DOCSTORE_FILE)
+    if not os.path.exists(db_path):
+        # Old LangChain format (index.faiss + index.pkl)
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+    index_path = os.path.join(path, INDEX_FILE)
+    if lazy:
+        try:
+            index = faiss.read_index(index_path, MMAP_FLAGS)
+        except RuntimeError:
+            index = faiss.read_index(index_path)
+        conn = _connect(db_path, read_only=True)
+        lock = threading.Lock()
+        return FAISS(embeddings, index, SQLiteDocstore(conn, lock), SQLiteIndexMap(conn, lock))
+
+    index = faiss.read_index(index_path)
+    conn = _connect(db_path, read_only=True)
+    docs = {
+        doc_id: Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+        for doc_id, text, metadata in conn.execute("SELECT id, text, metadata FROM docs")
+    }
+    index_to_docstore_id = dict(conn.execute("SELECT position, id FROM positions"))
+    conn.close()
+    return FAISS(embeddings, index, InMemoryDocstore(docs), index_to_docstore_id)
@@ -1,4 +1,5 @@
 import streamlit as st
+import os
 import sys
 from datetime import datetime
 import plotly.express as px
@@ -6,8 +7,12 @@ import pandas as pd
 
 # Ensure Python can find rag_pipeline.py
 sys.path.append('/home/ml_user/data/chat_bot')  
-# Import the RAG pipeline
-from rag_pipeline import qa_chain  
+# Import the RAG pipeline factory (nothing is loaded until first use)
+from rag_pipeline import get_pipeline  
+from climate_data import SCENARIOS, ensure_cache, load_region_stats, load_trends, region_summary
+from region_masks import REGION_GROUPS, REGION_SHAPES, centroid, match_region
+from retrieval_depth import DEFAULT_DETAIL
+from warmup import FAQ_QUESTIONS, SUGGESTED_QUESTIONS, Warmup
 
 # Streamlit Page Configuration
 st.set_page_config(
@@ -16,6 +21,50 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# One pipeline per process, shared by every session and rerun. With RAG_SERVER_URL set,
+# the app is a client of rag_server.py instead of running the models itself (the server does the warm-up).
+@st.cache_resource(show_spinner="Loading the climate knowledge base...")
+def load_pipeline():
+    if os.environ.get("RAG_SERVER_URL"):
+        from rag_client import RemoteRagPipeline
+        return RemoteRagPipeline(os.environ["RAG_SERVER_URL"])
+    pipeline = get_pipeline()
+    # Loads the models and answers the suggested/FAQ questions in the background (warmup.py)
+    Warmup(pipeline).start()
+    return pipeline
+
+rag = load_pipeline()
+
+# Projection aggregates are precomputed from the NetCDF model output into a small cache
+# (climate_data.py); the grids themselves are never loaded by the app
+@st.cache_resource(show_spinner="Preparing climate projections...")
+def climate_cache_ready():
+    try:
+        return ensure_cache()
+    except Exception as e:
+        print(f"Climate projection cache unavailable ({e}).")
+        return False
+
+# Both return the data with the baseline years it is relative to
+@st.cache_data
+def load_projection_data(experiment, region="India"):
+    return load_trends(experiment, region)
+
+# Per-region warming, rainfall and extremes, precomputed with the region masks (region_masks.py)
+@st.cache_data
+def load_regional_stats(experiment):
+    return load_region_stats(experiment) if climate_cache_ready() else ({}, None)
+
+def baseline_note(baseline):
+    return f"relative to {baseline}" if baseline else "relative to each model's baseline"
+
+@st.cache_data
+def regional_projection_note(question, experiment):
+    region = match_region(question)
+    if region is None or not climate_cache_ready():
+        return None
+    return region_summary(region, experiment)
+
 # Custom CSS for better styling
 st.markdown("""
     <style>
@@ -157,13 +206,8 @@ sample_climate_data = {
 
 climate_df = pd.DataFrame(sample_climate_data)
 
-# Climate impact regions in India
-impact_regions = {
-    "Coastal": ["Mumbai", "Chennai", "Kolkata", "Kerala"],
-    "Himalayan": ["Shimla", "Darjeeling", "Srinagar", "Gangtok"],
-    "Semi-Arid": ["Rajasthan", "Gujarat", "Telangana", "Maharashtra"],
-    "River Basins": ["Gangetic Plains", "Brahmaputra Valley", "Narmada Basin", "Godavari Basin"]
-}
+# Climate impact regions in India (outlines and grid masks in region_masks.py)
+impact_regions = REGION_GROUPS
 
 # Initialize session state variables
 if "messages" not in st.session_state:
@@ -209,6 +253,10 @@ def change_language():
 def update_climate_scenario():
     st.toast(f"Climate scenario updated to {st.session_state.climate_scenario}", icon="🌡️")
 
+def ask_question(question):
+    # Suggested-question and FAQ buttons: answered in the chat on this rerun
+    st.session_state.pending_question = question
+
 def add_to_search_history(query):
     if query not in st.session_state.search_history:
         st.session_state.search_history.append(query)
@@ -249,7 +297,9 @@ with st.sidebar:
     
     # Advanced options
     with st.expander("⚙️ Advanced Options", expanded=False):
-        st.slider("Response Detail Level", min_value=1, max_value=5, value=3, help="Adjust how detailed the AI responses should be")
+        # Sets how many report chunks are retrieved, the context size and the answer length (retrieval_depth.py)
+        st.slider("Response Detail Level", min_value=1, max_value=5, value=DEFAULT_DETAIL, key="detail_level",
+                  help="Adjust how detailed the AI responses should be")
         st.checkbox("Include Scientific Citations", value=True, help="Include references to scientific sources")
         st.checkbox("Show Confidence Scores", value=False, help="Display AI confidence in answers")
     
@@ -261,6 +311,33 @@ with st.sidebar:
     st.markdown(f"Questions Asked: **{st.session_state.questions_asked}**")
     st.markdown(f"Current Time: **{datetime.now().strftime('%H:%M:%S')}**")
     st.progress(min(st.session_state.questions_asked / 10, 1.0), "Chat Progress")
+    
+    # Answer cache effectiveness across all users
+    cache_stats = rag.answer_cache.stats()
+    st.markdown(f"Answer Cache Hit Rate: **{cache_stats['hit_rate']:.0%}** ({cache_stats['hits']} of {cache_stats['hits'] + cache_stats['misses']})")
+    st.markdown(f"LLM Time Saved: **{cache_stats['saved_seconds']:.0f}s**")
+
+    # Per-stage latency of the RAG pipeline (recent queries)
+    with st.expander("⏱️ Performance", expanded=False):
+        latency = rag.latency_snapshot()
+        if latency:
+            rows = []
+            for stage, summary in latency.items():
+                scale, unit = (1, "tok/s") if stage.endswith("_per_second") else (1000, "ms")
+                rows.append({
+                    "Stage": stage,
+                    "p50": f"{summary['p50'] * scale:.0f} {unit}",
+                    "p95": f"{summary['p95'] * scale:.0f} {unit}",
+                    "Count": summary["count"],
+                })
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        else:
+            st.write("No queries timed yet.")
+        # Context packing: retrieved chunk tokens that never reached the prompt
+        context = rag.context_stats()
+        if context["retrieved_tokens"]:
+            st.markdown(f"Prompt Tokens Saved: **{context['saved_tokens']:,}** "
+                        f"({context['saved_tokens'] / context['retrieved_tokens']:.0%} of retrieved context)")
 
 # Main interface with tabs
 tabs = st.tabs(["💬 Chat", "📈 Climate Trends", "🗺️ Regional Impact", "❓ FAQs"])
@@ -270,20 +347,37 @@ with tabs[0]:
     st.title("🌍 Climate AI Chatbot")
     st.markdown("#### Explore India's climate future with AI assistance 🌱")
     
-    # Suggested questions
+    # Suggested questions (answers precomputed at startup, see warmup.py)
     question_cols = st.columns(3)
-    with question_cols[0]:
-        st.button("How will temperature change in India by 2050?", use_container_width=True)
-    with question_cols[1]:
-        st.button("Which regions are most vulnerable to climate change?", use_container_width=True)
-    with question_cols[2]:
-        st.button("What are adaptation strategies for agriculture?", use_container_width=True)
+    for col, question in zip(question_cols, SUGGESTED_QUESTIONS):
+        with col:
+            st.button(question, use_container_width=True, on_click=ask_question, args=(question,))
     
     # Display chat history with feedback buttons
     for idx, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
             
+            # Rewritten follow-up question the answer was retrieved for
+            if message.get("standalone"):
+                st.caption(f"Searched for: {message['standalone']}")
+            
+            # Pages of the report the answer was grounded on
+            if message.get("sources"):
+                pages = sorted({page + 1 for page in message["sources"] if page is not None})
+                st.caption("Sources: report pages " + ", ".join(str(page) for page in pages))
+            
+            # Model projection for a region named in the question
+            if message.get("projection"):
+                st.info(message["projection"], icon="🗺️")
+            
+            # How the answer was produced: from the cache, or time to first token and total time
+            if message.get("cached"):
+                st.caption("Answered from cache")
+            elif message.get("time_to_first_token") is not None and message.get("total_time") is not None:
+                st.caption(f"First token after {message['time_to_first_token']:.2f}s · total {message['total_time']:.2f}s"
+                           + (f" · {message['chunks']} report chunks" if message.get("chunks") else ""))
+            
             # Add feedback buttons for assistant messages
             if message["role"] == "assistant" and idx > 0:
                 cols = st.columns([0.9, 0.05, 0.05])
@@ -294,7 +388,7 @@ with tabs[0]:
     
     # User input with enhanced styling
     st.write("")  # Space before input
-    user_input = st.chat_input("Ask about India's climate future...", key="chat_input")
+    user_input = st.chat_input("Ask about India's climate future...", key="chat_input") or st.session_state.pop("pending_question", None)
     
     if user_input:
         # Track question count
@@ -306,18 +400,27 @@ with tabs[0]:
         with st.chat_message("user"):
             st.markdown(user_input)
         
-        # Show typing indicator
+        # Stream the answer into the assistant bubble as llama3 generates it. The earlier messages
+        # let the pipeline turn follow-ups ("what about Kerala?") into standalone queries.
+        history = [{"role": m["role"], "content": m["content"]} for m in st.session_state.messages[:-1]]
+        answer_info = {"history": history, "detail": st.session_state.get("detail_level", DEFAULT_DETAIL)}
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                # Get response from RAG pipeline
-                try:
-                    response = qa_chain.invoke({"query": user_input})
-                    bot_response = response["result"]
-                except Exception as e:
-                    bot_response = f"I apologize, but I encountered an issue while processing your question. Could you try rephrasing it? (Error: {str(e)})"
-        
-        # Add assistant response to session state
-        st.session_state.messages.append({"role": "assistant", "content": bot_response})
+            try:
+                bot_response = st.write_stream(rag.stream_answer(user_input, answer_info))
+            except Exception as e:
+                bot_response = f"I apologize, but I encountered an issue while processing your question. Could you try rephrasing it? (Error: {str(e)})"
+        
+        # Add assistant response (and the chunks it was based on) to session state, with its timings
+        # so the history loop shows them after the rerun
+        sources = [doc.metadata.get("page") for doc in answer_info.get("source_documents", [])]
+        standalone = answer_info.get("standalone_query") or user_input
+        projection = regional_projection_note(standalone, SCENARIOS[st.session_state.climate_scenario])
+        st.session_state.messages.append({"role": "assistant", "content": bot_response, "sources": sources, "projection": projection,
+                                          "standalone": standalone if standalone != user_input else None,
+                                          "cached": answer_info.get("cached", False),
+                                          "time_to_first_token": answer_info.get("time_to_first_token"),
+                                          "total_time": answer_info.get("total_time"),
+                                          "chunks": (answer_info.get("retrieval") or {}).get("k")})
         
         # Rerun to display the updated chat
         st.rerun()
@@ -334,18 +437,27 @@ with tabs[1]:
         key="chart_selector"
     )
     
+    # Annual projections for the selected scenario; the sample series when no NetCDF data is available
+    experiment = SCENARIOS[st.session_state.climate_scenario]
+    trends_df = climate_df
+    if chart_type != "Sea Level Rise" and climate_cache_ready():
+        projection_df, trends_baseline = load_projection_data(experiment)
+        if not projection_df.empty:
+            trends_df = projection_df
+    
     # Date range slider
+    first_year, last_year = int(trends_df["Year"].min()), int(trends_df["Year"].max())
     years = st.slider(
         "Year Range", 
-        min_value=2020, 
-        max_value=2100, 
-        value=(2020, 2100),
-        step=10,
+        min_value=first_year, 
+        max_value=last_year, 
+        value=(first_year, last_year),
+        step=5 if trends_df is not climate_df else 10,
         key="year_slider"
     )
     
     # Filter data based on selections
-    filtered_df = climate_df[(climate_df["Year"] >= years[0]) & (climate_df["Year"] <= years[1])]
+    filtered_df = trends_df[(trends_df["Year"] >= years[0]) & (trends_df["Year"] <= years[1])]
     
     # Create appropriate chart based on selection
     if chart_type == "Temperature Rise":
@@ -354,7 +466,7 @@ with tabs[1]:
             x="Year", 
             y="Temperature Rise (°C)",
             markers=True,
-            title="Projected Temperature Rise in India",
+            title=f"Projected Temperature Rise in India ({st.session_state.climate_scenario}, {experiment.upper()})",
             labels={"Temperature Rise (°C)": "Temperature Increase (°C)"}
         )
         fig.update_layout(
@@ -389,7 +501,7 @@ with tabs[1]:
             filtered_df, 
             x="Year", 
             y="Rainfall Change (%)",
-            title="Projected Changes in Rainfall Patterns",
+            title=f"Projected Changes in Rainfall Patterns ({st.session_state.climate_scenario}, {experiment.upper()})",
             labels={"Rainfall Change (%)": "Change in Rainfall (%)"}
         )
         fig.update_layout(
@@ -402,7 +514,10 @@ with tabs[1]:
         st.success("Monsoon patterns are expected to become more erratic, with some regions experiencing up to 25% increase in rainfall intensity while others may face prolonged droughts.")
     
     # Data source note
-    st.caption("Note: These projections are based on climate models from the 'Navigating India's Climate Future' report.")
+    if trends_df is climate_df:
+        st.caption("Note: These projections are based on climate models from the 'Navigating India's Climate Future' report.")
+    else:
+        st.caption(f"Note: Annual India-wide means of the gridded model output, {baseline_note(trends_baseline)}.")
 
 # Regional Impact Tab  
 with tabs[2]:
@@ -417,11 +532,24 @@ with tabs[2]:
         key="region_selector"
     )
     
+    # Projected changes per region for the selected scenario (empty without NetCDF data)
+    experiment = SCENARIOS[st.session_state.climate_scenario]
+    regional_stats, regional_baseline = load_regional_stats(experiment)
+    
     # Create columns for region cards
     region_cols = st.columns(2)
     
     # Display region cards
     for i, region in enumerate(impact_regions[region_type]):
+        stats = regional_stats.get(region)
+        projections = ""
+        if stats:
+            projections = f"""
+                <p>Projected by 2081-2100 ({experiment.upper()}):</p>
+                <ul>
+                    <li>Warming: <b>{stats['warming_2081_2100']:+.1f}°C</b> (hottest month {stats['hottest_month_warming_2081_2100']:+.1f}°C)</li>
+                    <li>Rainfall: <b>{stats['rainfall_change_2081_2100']:+.0f}%</b> (wettest month {stats['wettest_month_change_2081_2100']:+.0f}%)</li>
+                </ul>"""
         with region_cols[i % 2]:
             st.markdown(f"""
             <div class="card">
@@ -431,14 +559,33 @@ with tabs[2]:
                 <ul>
                     <li>{"Sea level rise & flooding" if region_type == "Coastal" else "Glacial retreat & water scarcity" if region_type == "Himalayan" else "Drought & heat waves" if region_type == "Semi-Arid" else "Flooding & agricultural impacts"}</li>
                     <li>{"Saltwater intrusion" if region_type == "Coastal" else "Landslides & biodiversity loss" if region_type == "Himalayan" else "Groundwater depletion" if region_type == "Semi-Arid" else "Water quality issues"}</li>
-                </ul>
+                </ul>{projections}
             </div>
             """, unsafe_allow_html=True)
     
-    # Add interactive map (placeholder)
+    # Map of projected warming per region
     st.subheader("Vulnerability Hotspots")
-    st.image("https://via.placeholder.com/800x400?text=Interactive+Climate+Impact+Map+(Placeholder)", use_column_width=True)
-    st.caption("Note: This is a placeholder for an interactive map that would show climate vulnerability hotspots across India.")
+    places = [name for members in impact_regions.values() for name in members if name in regional_stats]
+    if places:
+        map_df = pd.DataFrame({
+            "Region": places,
+            "lon": [centroid(REGION_SHAPES[name])[0] for name in places],
+            "lat": [centroid(REGION_SHAPES[name])[1] for name in places],
+            "Warming 2081-2100 (°C)": [regional_stats[name]["warming_2081_2100"] for name in places],
+            "Rainfall Change (%)": [regional_stats[name]["rainfall_change_2081_2100"] for name in places],
+        })
+        fig = px.scatter_geo(
+            map_df, lat="lat", lon="lon", color="Warming 2081-2100 (°C)", hover_name="Region",
+            hover_data={"Rainfall Change (%)": ":+.0f", "lat": False, "lon": False},
+            color_continuous_scale="OrRd", scope="asia", title=f"Projected Warming by Region ({experiment.upper()})"
+        )
+        fig.update_traces(marker=dict(size=14))
+        fig.update_geos(lataxis_range=[5, 38], lonaxis_range=[66, 99], showcountries=True)
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Note: Area-weighted means of the gridded model output over each region, {baseline_note(regional_baseline)}.")
+    else:
+        st.image("https://via.placeholder.com/800x400?text=Interactive+Climate+Impact+Map+(Placeholder)", use_column_width=True)
+        st.caption("Note: This is a placeholder for an interactive map that would show climate vulnerability hotspots across India.")
 
 # FAQ Tab
 with tabs[3]:
@@ -446,7 +593,7 @@ with tabs[3]:
     st.write("Find answers to common questions about climate change in India.")
     
     # FAQ accordion
-    with st.expander("What are the main climate change threats facing India?", expanded=True):
+    with st.expander(FAQ_QUESTIONS[0], expanded=True):
         st.write("""
         India faces several major climate threats:
         
@@ -458,8 +605,9 @@ with tabs[3]:
         
         These threats pose significant risks to agriculture, public health, infrastructure, and economic stability.
         """)
+        st.button("💬 Ask in the chat", key="faq_ask_0", on_click=ask_question, args=(FAQ_QUESTIONS[0],))
     
-    with st.expander("How will climate change affect agriculture in India?"):
+    with st.expander(FAQ_QUESTIONS[1]):
         st.write("""
         Climate change is projected to significantly impact Indian agriculture through:
         
@@ -471,8 +619,9 @@ with tabs[3]:
         
         Studies suggest rice yields could decline 10-40% by 2100 without adaptation measures.
         """)
+        st.button("💬 Ask in the chat", key="faq_ask_1", on_click=ask_question, args=(FAQ_QUESTIONS[1],))
     
-    with st.expander("What adaptation strategies are being implemented?"):
+    with st.expander(FAQ_QUESTIONS[2]):
         st.write("""
         India is implementing various climate adaptation strategies:
         
@@ -486,8 +635,9 @@ with tabs[3]:
         
         The National Action Plan on Climate Change (NAPCC) coordinates many of these efforts.
         """)
+        st.button("💬 Ask in the chat", key="faq_ask_2", on_click=ask_question, args=(FAQ_QUESTIONS[2],))
     
-    with st.expander("How will climate change affect India's water resources?"):
+    with st.expander(FAQ_QUESTIONS[3]):
         st.write("""
         Climate change is expected to severely impact India's water resources:
         
@@ -499,8 +649,9 @@ with tabs[3]:
         
         By 2050, per capita water availability could fall below scarcity levels in many regions.
         """)
+        st.button("💬 Ask in the chat", key="faq_ask_3", on_click=ask_question, args=(FAQ_QUESTIONS[3],))
     
-    with st.expander("What can individuals do to help address climate change?"):
+    with st.expander(FAQ_QUESTIONS[4]):
         st.write("""
         Individuals can contribute to climate action through:
         
@@ -513,6 +664,7 @@ with tabs[3]:
         
         Collective action by individuals can create significant positive impact.
         """)
+        st.button("💬 Ask in the chat", key="faq_ask_4", on_click=ask_question, args=(FAQ_QUESTIONS[4],))
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,71 @@
+"""
+Client for rag_server.py with the same interface the Streamlit app uses on the
+local pipeline (stream_answer(query, info), answer_cache.stats(),
+latency_snapshot() and context_stats()).
+"""
+
+import json
+
+import requests
+from langchain.schema import Document
+
+REQUEST_TIMEOUT = 90  # seconds; the server enforces its own per-request deadline
+
+
+def _get_stats(base_url):
+    response = requests.get(f"{base_url}/stats", timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+class _RemoteCacheStats:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def stats(self):
+        return _get_stats(self.base_url)["answer_cache"]
+
+
+class RemoteRagPipeline:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.answer_cache = _RemoteCacheStats(self.base_url)
+
+    def latency_snapshot(self):
+        return _get_stats(self.base_url)["latency"]
+
+    def context_stats(self):
+        return _get_stats(self.base_url)["context_packing"]
+
+    def stream_answer(self, query, info=None):
+        info = {} if info is None else info
+        payload = {
+            "query": query,
+            "stream": True,
+            "sources": info.get("sources"),
+            "source_weights": info.get("source_weights"),
+            "history": info.get("history"),
+            "detail": info.get("detail"),
+        }
+        with requests.post(f"{self.base_url}/query", json=payload, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code == 503:
+                raise RuntimeError("The assistant is busy right now, please try again in a moment.")
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                if "token" in event:
+                    yield event["token"]
+                elif event.get("done"):
+                    info.update(
+                        result=event["result"],
+                        cached=event["cached"],
+                        source_documents=[Document(**source) for source in event["sources"]],
+                        time_to_first_token=event["time_to_first_token"],
+                        total_time=event["total_time"],
+                        standalone_query=event.get("standalone_query"),
+                        retrieval=event.get("retrieval"),
+                    )
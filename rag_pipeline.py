@@ -5,60 +5,65 @@ Created on Thu Mar  6 15:59:49 2025
 """
 
 # %%
+import os
+import threading
+import time
 from langchain_ollama import OllamaLLM, OllamaEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+from answer_cache import CACHE_PATH, AnswerCache, index_fingerprint, text_fingerprint
+from context_packing import pack_context
+from conversation_memory import CONDENSE_MAX_TOKENS, QueryCondenser
+from embedding_cache import CachedEmbeddings
+from embedding_pipeline import add_documents_batched, clear_checkpoints
+from faiss_index_factory import configure_search
+from hybrid_retrieval import BM25Index, HybridRetriever, load_or_build_lexical_index
+from ingest import find_pdfs, ingest_pdfs, iter_chunks, iter_pages
+from metrics import metrics
+from mmap_index_store import load_vector_store, save_vector_store
+from retrieval_depth import DETAIL_LEVELS, detail_level, detail_variant
+from sharded_index import ShardedRetriever, shard_dir, shard_name
+from index_manifest import chunk_ids, diff_chunks, load_manifest, save_manifest, source_state, sources_unchanged
 # %%
 # %%
 
-# Load PDF
+# Source report and index settings
 #pdf_path = "/home/ajai-krishna/Downloads/combinepdf-1.pdf"  # Update with your file path
 pdf_path="/home/ml_user/data/chat_bot/Climate report draft Oct 2024.pdf"
-loader = PyPDFLoader(pdf_path)
-documents = loader.load()
+# Directory with the full report set (APU report, IPCC technical summary, FAQs); see ingest.py.
+# When set, every PDF in it is indexed instead of pdf_path alone.
+pdf_dir = os.environ.get("CLIMATE_PDF_DIR")
+index_dir = "faiss_index"
+chunk_size = 500
+chunk_overlap = 100
+embed_model_name = "mxbai-embed-large"
+llm_model_name = "llama3"
+# Ollama unloads idle models after 5 minutes by default; keep both loaded between queries (seconds)
+model_keep_alive = 24 * 3600
+# Upper bound on the chunks per query, the same k=10 as the original dense-only retrieval. Each query
+# uses fewer when the similarity scores fall off (retrieval_depth.choose_k), and the Response Detail Level
+# (info["detail"], 1-5) sets its own bound, context budget and answer length (retrieval_depth.py).
+retrieval_k = 10
+# FAISS index type (flat, ivf, hnsw, pq, ivfpq), chosen per deployment; see benchmark_faiss_index.py
+index_type = os.environ.get("FAISS_INDEX_TYPE", "flat")
+index_search_params = {}
+# Embedded batches are checkpointed here during a build so an interrupted build can resume
+# (<shard dir>.checkpoints, one per shard like ingest.py, so a shard never resumes from another's batches)
+checkpoint_suffix = ".checkpoints"
+# Each source PDF is indexed in its own shard under index_dir/shards/ (see sharded_index.py).
+# Relative weight of each shard's results, by shard name, e.g. {"climate-report-draft-oct-2024": 1.5}
+source_weights = {}
 
-# %%
-# %%
-# Split into Chunks
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-docs = splitter.split_documents(documents)
-
-# %%
-# %%
-try:
-    import faiss  # Ensure FAISS is available
-    embed_model = OllamaEmbeddings(model="mxbai-embed-large")
-
-    # If FAISS index exists, load it instead of recomputing
-    try:
-        vector_db = FAISS.load_local("faiss_index", embed_model)
-        print("FAISS index loaded from storage.")
-    except:
-        print("FAISS index not found. Creating a new one...")
-        vector_db = FAISS.from_documents(docs, embed_model)
-        vector_db.save_local("faiss_index")  # Save for future use
+# Building the pipeline from a saved index should stay within this many seconds
+COLD_START_BUDGET = 5.0
 
-except ImportError:
-    raise ImportError("FAISS is not installed. Please install using `pip install faiss-cpu` or `faiss-gpu`.")
-
-
-# %%
-# %%
-# Step 4: Initialize LLM
-llm = OllamaLLM(model="llama3")
-
-# Step 5: Set Up Retrieval
-retriever = vector_db.as_retriever(search_kwargs={"k": 10})
 # %%
 # Custom Prompt
 prompt_template = """You are an intelligent and friendly Climate AI assistant, specializing in India's future climate.  
 Your responses must be **strictly based** on the climate report *"Navigating India's Climate Future"*, published by Azim Premji University.  
 
 - **Be informative but engaging**—explain concepts clearly and concisely.  
-- **Keep responses at a medium length**—detailed enough to be useful but not overly technical.  
+- {length_instruction}  
 - **Use a conversational tone**—as if explaining to an interested but non-expert audience.  
 - **If relevant data is unavailable**, acknowledge it politely instead of speculating.  
 
@@ -71,30 +76,353 @@ Try to make your responses **easy to understand, engaging, and insightful** whil
 **Answer:**
 """
 
-prompt = PromptTemplate(template=prompt_template, input_variables=["question", "context"])
+prompt = PromptTemplate(template=prompt_template, input_variables=["question", "context", "length_instruction"])
 
 # %%
-# %%
-# Build RAG Chain
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=retriever,
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": prompt},
-)
-
-# Query Example
-#query = "tell me about azim premji university"
-#response = qa_chain.invoke({"query": query})
-
-# Output Response
-#print(response["result"])
+def source_paths():
+    return find_pdfs(pdf_dir) if pdf_dir else [pdf_path]
 
-# %%
+
+# Load PDFs and split into chunks. Only needed when the index has to be updated.
+def load_chunks(paths=None):
+    return list(iter_chunks(iter_pages(paths or source_paths()), chunk_size, chunk_overlap))
+
+
+# Everything that changes the chunks or their vectors; a change here forces a full rebuild
+def index_params():
+    return {
+        "splitter": "RecursiveCharacterTextSplitter",
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embed_model": embed_model_name,
+        "index_type": index_type,
+        "store": "faiss+sqlite",
+    }
+
+
+def build_index(embed_model, sources, path=index_dir):
+    # Pages stream from the PDFs into the saved index; the result is then opened like any saved index
+    print("Building FAISS index from scratch...")
+    ingest_pdfs(
+        list(sources), embed_model, path, index_params(), sources,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        index_type=index_type,
+        index_params=index_search_params,
+        checkpoint_dir=path + checkpoint_suffix,
+    )
+    vector_db = load_vector_store(path, embed_model)
+    configure_search(vector_db.index, **index_search_params)
+    return vector_db
+
+
+def update_index(vector_db, docs, ids, manifest, sources, path=index_dir):
+    # Embed only new chunks, drop deleted ones and refresh metadata (e.g. page numbers) of the rest
+    stored = set(vector_db.index_to_docstore_id.values())
+    if stored != set(manifest.get("chunks", [])):
+        # e.g. a crash between saving the store and saving the manifest; the diff would be wrong
+        raise ValueError(f"saved index has {len(stored)} chunks, manifest lists {len(manifest.get('chunks', []))}")
+    added, removed = diff_chunks(manifest, ids)
+    if removed:
+        vector_db.delete(list(removed))
+    if added:
+        new_docs = [doc for doc, doc_id in zip(docs, ids) if doc_id in added]
+        add_documents_batched(vector_db, new_docs, ids=[doc_id for doc_id in ids if doc_id in added], checkpoint_dir=path + checkpoint_suffix)
+    for doc, doc_id in zip(docs, ids):
+        if doc_id not in added:
+            vector_db.docstore.search(doc_id).metadata = doc.metadata
+    print(f"FAISS index updated: {len(added)} chunks embedded, {len(removed)} removed.")
+    save_vector_store(vector_db, path)
+    BM25Index.from_vector_store(vector_db).save(path)
+    save_manifest(path, index_params(), sources, ids)
+    clear_checkpoints(path + checkpoint_suffix)
+    return vector_db
+
+
+def load_or_build_index(embed_model, path=index_dir, paths=None):
+    try:
+        import faiss  # Ensure FAISS is available
+    except ImportError:
+        raise ImportError("FAISS is not installed. Please install using `pip install faiss-cpu` or `faiss-gpu`.")
+
+    manifest = load_manifest(path)
+    sources = source_state(paths or source_paths(), manifest)
+    params_match = manifest is not None and manifest["params"] == index_params()
+
+    unchanged = params_match and sources_unchanged(manifest, sources)
+
+    vector_db = None
+    if params_match:
+        try:
+            # Serving an unchanged index: memory-map it and read chunks on demand.
+            # Otherwise load it fully so it can be updated and re-saved.
+            vector_db = load_vector_store(path, embed_model, lazy=unchanged)
+            configure_search(vector_db.index, **index_search_params)
+        except Exception as e:
+            print(f"Could not load FAISS index ({e}).")
+
+    # Saved index matches the corpus: nothing to parse or embed
+    if vector_db is not None and unchanged:
+        print("FAISS index loaded from storage.")
+        return vector_db
+
+    if vector_db is not None:
+        docs = load_chunks(list(sources))
+        ids = chunk_ids(docs)
+        try:
+            return update_index(vector_db, docs, ids, manifest, sources, path)
+        except (RuntimeError, ValueError) as e:
+            # e.g. HNSW indexes cannot remove vectors, or the store and manifest are out of sync
+            print(f"Incremental update not possible ({e}).")
+    return build_index(embed_model, sources, path)
+
+
+def load_or_build_shards(embed_model, paths=None):
+    # One independently built and updated index per source PDF
+    shards = {}
+    for path in paths or source_paths():
+        name = shard_name(path, pdf_dir)
+        print(f"Shard '{name}':")
+        shards[name] = load_or_build_index(embed_model, shard_dir(index_dir, name), [path])
+    return shards
+
+
+def shards_fingerprint(names):
+    # Changes whenever a shard directory is rebuilt or updated (e.g. by `python ingest.py`)
+    return text_fingerprint(*(index_fingerprint(shard_dir(index_dir, name)) for name in sorted(names)))
 
 # %%
+class RagPipeline:
+    # Backends can be injected (e.g. HashEmbeddings and a fake LLM for offline load tests);
+    # by default the Ollama models and the saved index are used.
+    def __init__(self, embed_model=None, llm=None, vector_db=None, cache_path=CACHE_PATH):
+        start = time.perf_counter()
+
+        # Query embeddings skip the chunk embedding cache; repeated queries are handled by the answer cache
+        self.query_embed_model = embed_model or OllamaEmbeddings(model=embed_model_name, keep_alive=model_keep_alive)
+        # Chunk embeddings go through the persistent cache, so rebuilds only embed new text
+        self.embed_model = CachedEmbeddings(self.query_embed_model, getattr(self.query_embed_model, "model", embed_model_name))
+        # Precomputed embeddings of the suggested and FAQ questions (filled by warmup.py)
+        self.query_embeddings = {}
+
+        self.injected_index = vector_db is not None
+        if vector_db is None:
+            self._load_index()
+        else:
+            self.vector_dbs = {"default": vector_db}
+            retrievers = {"default": HybridRetriever(vector_db=vector_db, lexical_index=BM25Index.from_vector_store(vector_db), k=retrieval_k)}
+            self.retriever = ShardedRetriever(shards=retrievers, k=retrieval_k, default_weights=source_weights)
+            self.index_fingerprint = str(id(vector_db))
+
+        self.llm = llm or OllamaLLM(model=llm_model_name, keep_alive=model_keep_alive)
+        # One copy per detail level with its num_predict cap; they share the client and the loaded model
+        self.detail_llms = {
+            level: self.llm.model_copy(update={"num_predict": settings["num_predict"]})
+            if hasattr(self.llm, "num_predict") else self.llm
+            for level, settings in DETAIL_LEVELS.items()
+        }
+        # Follow-up rewriting: same model (Ollama keeps one copy loaded), deterministic and short
+        self.condenser = QueryCondenser(llm or OllamaLLM(
+            model=llm_model_name, temperature=0, num_predict=CONDENSE_MAX_TOKENS, keep_alive=model_keep_alive
+        ))
+
+        # Semantic answer cache, invalidated whenever the index, prompt or models change
+        self.answer_cache = AnswerCache(self.embed_model, path=cache_path, fingerprint=self._cache_fingerprint())
+
+        self.cold_start_seconds = time.perf_counter() - start
+        if self.cold_start_seconds > COLD_START_BUDGET:
+            print(f"Pipeline cold start took {self.cold_start_seconds:.2f}s (budget {COLD_START_BUDGET:.1f}s).")
+
+    def _load_index(self):
+        self.vector_dbs = load_or_build_shards(self.embed_model)
+        retrievers = {
+            name: HybridRetriever(
+                vector_db=db, lexical_index=load_or_build_lexical_index(db, shard_dir(index_dir, name)), k=retrieval_k
+            )
+            for name, db in self.vector_dbs.items()
+        }
+        # Requests already running keep the retriever they started with
+        self.retriever = ShardedRetriever(shards=retrievers, k=retrieval_k, default_weights=source_weights)
+        self.index_fingerprint = shards_fingerprint(self.vector_dbs)
+
+    def _cache_fingerprint(self):
+        return text_fingerprint(self.index_fingerprint, prompt_template, llm_model_name, embed_model_name)
+
+    def index_changed(self):
+        # The saved shards differ from the ones being served (re-ingested or a report added)
+        if self.injected_index:
+            return False
+        return shards_fingerprint(shard_name(path, pdf_dir) for path in source_paths()) != self.index_fingerprint
+
+    def reload_index(self):
+        # Serve the shards as they are now on disk; cached answers from the old index are dropped
+        self._load_index()
+        self.answer_cache.set_fingerprint(self._cache_fingerprint())
+
+    def embed_queries(self, queries):
+        # Several queries in one call to the embedding backend (used by the HTTP service's micro-batcher)
+        with metrics.timer("embed"):
+            return self.query_embed_model.embed_documents(queries)
+
+    def latency_snapshot(self):
+        return metrics.snapshot()
+
+    def context_stats(self):
+        # Prompt tokens retrieved vs. sent to llama3 since startup (context_packing.py)
+        counters = metrics.counters()
+        retrieved = counters.get("context_tokens_retrieved", 0)
+        packed = counters.get("context_tokens_packed", 0)
+        return {"retrieved_tokens": retrieved, "packed_tokens": packed, "saved_tokens": retrieved - packed}
+
+    def source_names(self):
+        return sorted(self.vector_dbs)
+
+    # Follow-up questions ("what about Kerala?") are rewritten into standalone queries from
+    # info["history"], the chat messages before this question; the rest of the pipeline
+    # (answer cache, retrieval, prompt) works on the standalone query.
+    def standalone_query(self, query, info=None):
+        info = {} if info is None else info
+        info.setdefault("started_at", time.perf_counter())
+        standalone = self.condenser.condense(query, info.get("history"), info.setdefault("stages", {}))
+        info["standalone_query"] = standalone
+        return standalone
+
+    # Answer cache step. Reworded repeats of an earlier question (at the same detail level) are answered
+    # from the cache. Returns (cached answer or None, query embedding); fills `info` on a hit.
+    # Queries restricted or weighted with info["sources"] / info["source_weights"] bypass the cache.
+    def cached_answer(self, query, info=None, query_embedding=None):
+        info = {} if info is None else info
+        start = info.setdefault("started_at", time.perf_counter())
+        stages = info.setdefault("stages", {})
+
+        if query_embedding is None:
+            query_embedding = self.query_embeddings.get(query)
+        if query_embedding is None:
+            with metrics.timer("embed", stages):
+                query_embedding = self.query_embed_model.embed_query(query)
+        if info.get("sources") or info.get("source_weights"):
+            info["cached"] = False
+            return None, query_embedding
+        with metrics.timer("cache_lookup", stages):
+            cached, query_embedding = self.answer_cache.lookup(
+                query, embedding=query_embedding, variant=detail_variant(detail_level(info.get("detail")))
+            )
+        info["cached"] = bool(cached)
+        if cached:
+            info["source_documents"] = [Document(**source) for source in cached["sources"]]
+            info["time_to_first_token"] = time.perf_counter() - start
+            info["result"] = cached["answer"]
+            info["total_time"] = info["time_to_first_token"]
+            metrics.observe("total", info["total_time"])
+            metrics.log_query({"query": query, "cached": True, "total": info["total_time"], **stages})
+        return cached, query_embedding
+
+    # Retrieval + generation step: stream llama3 tokens and store the answer in the cache
+    # (not with info["use_cache"] = False, e.g. for offline evaluation)
+    def generate_answer(self, query, query_embedding, info=None):
+        info = {} if info is None else info
+        start = info.setdefault("started_at", time.perf_counter())
+        stages = info.setdefault("stages", {})
+        level = detail_level(info.get("detail"))
+        settings = DETAIL_LEVELS[level]
+
+        # The query embedding from the cache lookup is reused for the dense half of the hybrid search.
+        # Only the selected source shards are searched, and k is chosen from the similarity scores.
+        with metrics.timer("search", stages):
+            source_documents = self.retriever.search(
+                query, query_embedding, sources=info.get("sources"), weights=info.get("source_weights"),
+                max_k=settings["max_k"], stats=info.setdefault("retrieval", {}),
+            )
+        info["source_documents"] = source_documents
+        info["retrieval_time"] = time.perf_counter() - start
+
+        # Merge overlapping chunks, drop near-duplicates and fit the detail level's context token budget,
+        # then use the layout of the "stuff" chain: page contents joined by blank lines
+        with metrics.timer("context_build", stages):
+            context_docs = pack_context(
+                source_documents, token_budget=settings["context_tokens"], stats=info.setdefault("context", {})
+            )
+            context = "\n\n".join(doc.page_content for doc in context_docs)
+            metrics.count("context_tokens_retrieved", info["context"]["original_tokens"])
+            metrics.count("context_tokens_packed", info["context"]["packed_tokens"])
+            prompt_text = prompt.format(question=query, context=context, length_instruction=settings["instruction"])
+
+        answer = ""
+        tokens = 0
+        generation_start = time.perf_counter()
+        for token in self.detail_llms[level].stream(prompt_text):
+            if "time_to_first_token" not in info:
+                info["time_to_first_token"] = time.perf_counter() - start
+                metrics.observe("ttft", info["time_to_first_token"])
+            answer += token
+            tokens += 1
+            yield token
+
+        info["result"] = answer
+        info["total_time"] = time.perf_counter() - start
+        generation_time = time.perf_counter() - generation_start
+        stages["generation"] = generation_time
+        stages["tokens_per_second"] = tokens / generation_time if generation_time else 0.0
+        metrics.observe("generation", generation_time)
+        metrics.observe("tokens_per_second", stages["tokens_per_second"])
+        metrics.observe("total", info["total_time"])
+        metrics.log_query({
+            "query": query,
+            "cached": False,
+            "total": info["total_time"],
+            "ttft": info.get("time_to_first_token"),
+            "tokens": tokens,
+            "detail": level,
+            "k": info["retrieval"].get("k"),
+            "prompt_tokens_saved": info["context"].get("saved_tokens"),
+            **stages,
+        })
+
+        if info.get("use_cache", True) and not (info.get("sources") or info.get("source_weights")):
+            sources = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in source_documents]
+            self.answer_cache.store(
+                query, answer, sources, info["total_time"], embedding=query_embedding, variant=detail_variant(level)
+            )
+
+    # Streaming answer path: cache lookup, then retrieval and token-by-token generation.
+    # `info` is filled with the source documents, the full answer and timings so callers
+    # (e.g. the Streamlit chat) can show them once the stream is exhausted.
+    def stream_answer(self, query, info=None, query_embedding=None):
+        info = {} if info is None else info
+        if info.get("history"):
+            query = self.standalone_query(query, info)
+        cached, query_embedding = self.cached_answer(query, info, query_embedding)
+        if cached:
+            yield cached["answer"]
+            return
+        yield from self.generate_answer(query, query_embedding, info)
+
+    # Blocking call with the same input/output shape as the old RetrievalQA qa_chain
+    def invoke(self, inputs):
+        info = {}
+        for _ in self.stream_answer(inputs["query"], info):
+            pass
+        return {"query": inputs["query"], "result": info["result"], "source_documents": info["source_documents"]}
 
 # %%
+# Process-wide pipeline, built on first use and shared by every caller
+# (Streamlit sessions and reruns included)
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
 
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = RagPipeline()
+    return _pipeline
 
+# %%
+# Query Example / cold-start measurement
+if __name__ == "__main__":
+    rag = get_pipeline()
+    print(f"Cold start: {rag.cold_start_seconds:.2f}s (budget {COLD_START_BUDGET:.1f}s)")
+    #response = rag.invoke({"query": "tell me about azim premji university"})
+    #print(response["result"])
@@ -0,0 +1,360 @@
+"""
+Async HTTP service in front of the RAG pipeline.
+
+    POST /query   {"query": "...", "stream": true, "timeout": 30, "sources": [...], "source_weights": {...},
+                   "history": [{"role": "user", "content": "..."}, ...], "detail": 3}
+                  streams NDJSON events ({"token": ...} then {"done": true, ...}),
+                  or returns one JSON answer when "stream" is false
+    GET  /stats   answer cache, service counters, prompt tokens saved and per-stage latency summaries
+    GET  /metrics per-stage latency histograms (Prometheus text format)
+    GET  /health
+
+Query embeddings from concurrent requests are micro-batched into one call to
+the embedding backend, in-flight llama3 generations are capped, every request
+has a deadline, and requests beyond the admission limit are rejected with 503
+instead of piling up on the Ollama server. At startup both models are loaded
+and the suggested/FAQ questions are answered into the cache in the background
+(warmup.py); GET /stats shows the warm-up state.
+
+    python rag_server.py --port 8000
+    python rag_server.py --fake        # hash embeddings + fake streaming LLM, no Ollama needed
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from metrics import metrics
+from warmup import Warmup
+
+MAX_CONCURRENT_GENERATIONS = 2   # llama3 generations allowed on the Ollama server at once
+MAX_PENDING_REQUESTS = 32        # admitted requests (queued + running); more get 503
+DEFAULT_DEADLINE = 60.0          # seconds
+EMBED_BATCH_SIZE = 16
+EMBED_BATCH_WAIT = 0.01          # seconds to collect queries for one embedding call
+
+
+class QueryRequest(BaseModel):
+    query: str
+    stream: bool = True
+    timeout: float | None = None
+    sources: list[str] | None = None              # restrict the search to these source shards
+    source_weights: dict[str, float] | None = None
+    history: list[dict] | None = None             # earlier chat messages, for follow-up questions
+    detail: int | None = None                     # response detail level 1-5 (retrieval_depth.DETAIL_LEVELS)
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    # Frees the admission slot however the response ends, including a client that disconnects
+    # before the body generator is ever started
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+class EmbeddingBatcher:
+    # Collects query embeddings from concurrent requests into one embed_documents call
+    def __init__(self, embed_batch, executor, batch_size=EMBED_BATCH_SIZE, max_wait=EMBED_BATCH_WAIT):
+        self.embed_batch = embed_batch
+        self.executor = executor
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def embed(self, query):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, future))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if len(self._pending) < self.batch_size:
+                await asyncio.sleep(self.max_wait)
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                batch = [(query, future) for query, future in batch if not future.done()]
+                if not batch:
+                    continue
+                try:
+                    vectors = await loop.run_in_executor(self.executor, self.embed_batch, [q for q, _ in batch])
+                    for (_, future), vector in zip(batch, vectors):
+                        if not future.done():
+                            future.set_result(vector)
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                self.batches += 1
+
+
+class RagService:
+    def __init__(self, rag, max_generations=MAX_CONCURRENT_GENERATIONS, max_pending=MAX_PENDING_REQUESTS):
+        self.rag = rag
+        self.max_pending = max_pending
+        # Generations stream from worker threads; lookups and embeddings get a few extra threads
+        self.executor = ThreadPoolExecutor(max_workers=max_generations + 4, thread_name_prefix="rag")
+        self.generation_slots = asyncio.Semaphore(max_generations)
+        self.batcher = EmbeddingBatcher(rag.embed_queries, self.executor)
+        self.in_flight = 0
+        self.counters = {"requests": 0, "rejected": 0, "timeouts": 0, "errors": 0, "cache_hits": 0}
+        self.warmup = None
+
+    def admit(self):
+        # Backpressure: refuse work early rather than queueing it behind a saturated LLM
+        if self.in_flight >= self.max_pending:
+            self.counters["rejected"] += 1
+            return False
+        self.in_flight += 1
+        self.counters["requests"] += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    async def answer_events(self, query, deadline, sources=None, source_weights=None, history=None, detail=None):
+        loop = asyncio.get_running_loop()
+
+        def remaining():
+            left = deadline - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError
+            return left
+
+        info = {"started_at": time.perf_counter(), "sources": sources, "source_weights": source_weights, "history": history,
+                "detail": detail}
+        if history:
+            query = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, lambda: self.rag.standalone_query(query, info)), remaining()
+            )
+        embedding = await asyncio.wait_for(self.batcher.embed(query), remaining())
+        cached, _ = await loop.run_in_executor(
+            self.executor, lambda: self.rag.cached_answer(query, info, query_embedding=embedding)
+        )
+        if cached:
+            self.counters["cache_hits"] += 1
+            yield {"token": cached["answer"]}
+            yield self._final_event(info)
+            return
+
+        # Only cache misses need one of the limited generation slots
+        await asyncio.wait_for(self.generation_slots.acquire(), remaining())
+        events = asyncio.Queue()
+        stop = threading.Event()
+
+        def generate():
+            try:
+                for token in self.rag.generate_answer(query, embedding, info):
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(events.put_nowait, ("token", token))
+                loop.call_soon_threadsafe(events.put_nowait, ("done", None))
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, ("error", e))
+
+        # The slot is freed when the worker thread finishes, not when the client stops listening,
+        # so Ollama never runs more than max_generations at once
+        worker = loop.run_in_executor(self.executor, generate)
+        worker.add_done_callback(lambda _: self.generation_slots.release())
+        try:
+            while True:
+                kind, value = await asyncio.wait_for(events.get(), remaining())
+                if kind == "token":
+                    yield {"token": value}
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+        finally:
+            # Deadline hit or client gone: tell the worker to stop pulling tokens
+            stop.set()
+
+        yield self._final_event(info)
+
+    @staticmethod
+    def _final_event(info):
+        return {
+            "done": True,
+            "result": info.get("result", ""),
+            "cached": info.get("cached", False),
+            "sources": [{"page_content": d.page_content, "metadata": d.metadata} for d in info.get("source_documents", [])],
+            "time_to_first_token": info.get("time_to_first_token"),
+            "total_time": info.get("total_time"),
+            "standalone_query": info.get("standalone_query"),
+            "retrieval": info.get("retrieval"),
+        }
+
+    def stats(self):
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "embedding_batches": self.batcher.batches,
+            "answer_cache": self.rag.answer_cache.stats(),
+            "query_rewrites": self.rag.condenser.stats(),
+            "warmup": self.warmup.status if self.warmup else None,
+            "context_packing": self.rag.context_stats(),
+            "latency": metrics.snapshot(),
+        }
+
+
+def make_fake_pipeline(token_delay=0.02):
+    # Offline stand-in: hash embeddings over a tiny corpus and an LLM that streams canned answers
+    from langchain_core.language_models.fake import FakeStreamingListLLM
+    from langchain.schema import Document
+    from embedding_pipeline import HashEmbeddings, build_faiss_from_documents
+    from rag_pipeline import RagPipeline
+
+    corpus = [
+        "Annual mean temperature over India is projected to rise by 1.5 to 2.5 degrees by 2050.",
+        "Coastal regions such as Mumbai, Chennai and Kolkata face sea level rise and storm surges.",
+        "Semi-arid regions including Rajasthan and Gujarat will see more frequent heat waves and droughts.",
+        "Monsoon rainfall is expected to become more erratic, with more intense extreme rainfall events.",
+        "Himalayan glaciers are retreating, affecting river flows in the Ganga and Brahmaputra basins.",
+    ]
+    docs = [Document(page_content=text, metadata={"source": "fake", "page": i}) for i, text in enumerate(corpus)]
+    embed_model = HashEmbeddings()
+    vector_db = build_faiss_from_documents(docs, embed_model)
+    llm = FakeStreamingListLLM(
+        responses=["This is a fake answer streamed token by token for load testing the service."],
+        sleep=token_delay,
+    )
+    return RagPipeline(embed_model=embed_model, llm=llm, vector_db=vector_db, cache_path=":memory:")
+
+
+def create_app(pipeline_factory, max_generations=MAX_CONCURRENT_GENERATIONS, max_pending=MAX_PENDING_REQUESTS,
+               warmup=True):
+    state = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        rag = await asyncio.get_running_loop().run_in_executor(None, pipeline_factory)
+        service = state["service"] = RagService(rag, max_generations, max_pending)
+        service.batcher.start()
+        if warmup:
+            # Requests are served meanwhile; they just miss the cache until it is done
+            service.warmup = Warmup(rag).start()
+        yield
+        if service.warmup:
+            service.warmup.stop()
+        await service.batcher.stop()
+        service.executor.shutdown(wait=False)
+
+    app = FastAPI(title="Climate Insight Bot API", lifespan=lifespan)
+
+    @app.post("/query")
+    async def query(request: QueryRequest):
+        service = state["service"]
+        # Checked before admission so the client gets a 400, not a 500 or an error mid-stream
+        available = service.rag.source_names()
+        unknown = sorted(set(request.sources or ()) - set(available))
+        if unknown:
+            raise HTTPException(status_code=400, detail={
+                "error": f"Unknown sources: {', '.join(unknown)}.", "available_sources": available,
+            })
+        if not service.admit():
+            raise HTTPException(status_code=503, detail="Server busy, try again shortly.", headers={"Retry-After": "1"})
+        deadline = asyncio.get_running_loop().time() + (request.timeout or DEFAULT_DEADLINE)
+        events = service.answer_events(
+            request.query, deadline, request.sources, request.source_weights, request.history, request.detail
+        )
+
+        if not request.stream:
+            try:
+                async for event in events:
+                    if event.get("done"):
+                        return JSONResponse(event)
+            except asyncio.TimeoutError:
+                service.counters["timeouts"] += 1
+                raise HTTPException(status_code=504, detail="Deadline exceeded.")
+            except ValueError as e:
+                # e.g. sources that no longer exist after an index reload
+                raise HTTPException(status_code=400, detail={"error": str(e), "available_sources": service.rag.source_names()})
+            except Exception as e:
+                service.counters["errors"] += 1
+                raise HTTPException(status_code=500, detail=str(e))
+            finally:
+                await events.aclose()
+                service.release()
+
+        async def ndjson():
+            try:
+                async for event in events:
+                    yield json.dumps(event) + "\n"
+            except asyncio.TimeoutError:
+                service.counters["timeouts"] += 1
+                yield json.dumps({"error": "Deadline exceeded."}) + "\n"
+            except Exception as e:
+                service.counters["errors"] += 1
+                yield json.dumps({"error": str(e)}) + "\n"
+            finally:
+                await events.aclose()
+
+        return ReleasingStreamingResponse(ndjson(), service.release, media_type="application/x-ndjson")
+
+    @app.get("/stats")
+    async def stats():
+        return state["service"].stats()
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        # Per-stage latency histograms in the Prometheus text format
+        return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the climate RAG pipeline over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fake", action="store_true", help="use fake embedder/LLM backends (no Ollama)")
+    parser.add_argument("--max-generations", type=int, default=MAX_CONCURRENT_GENERATIONS)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_REQUESTS)
+    parser.add_argument("--no-warmup", action="store_true", help="skip model loading and answer precomputation at start")
+    args = parser.parse_args()
+
+    if args.fake:
+        factory = make_fake_pipeline
+    else:
+        from rag_pipeline import get_pipeline
+        factory = get_pipeline
+
+    app = create_app(factory, args.max_generations, args.max_pending, warmup=not args.no_warmup)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Region definitions for the Regional Impact tab, turned into grid-cell masks.
+
+Every region (the places in the tab's region cards, their groups and India as
+a whole) is a coarse polygon or bounding box in lon/lat. For a projection grid,
+a GridIndex finds each region's window of grid cells with a binary search on
+the sorted coordinates, and only the cells in that window are tested against
+the polygon. The masks (window slices plus cos(latitude) weights)
+are computed once per grid and make a regional mean one small weighted sum
+per region instead of a scan of the full grid.
+"""
+
+import hashlib
+import re
+
+import numpy as np
+
+# Coarse outlines, (lon, lat) vertices; cities are small boxes (lon_min, lat_min, lon_max, lat_max)
+REGION_SHAPES = {
+    "India": [
+        (68.1, 23.7), (69.6, 22.4), (70.4, 20.8), (72.6, 21.1), (72.8, 19.0), (73.4, 16.0), (74.5, 12.8),
+        (76.2, 9.5), (77.5, 8.0), (78.2, 8.9), (79.3, 10.3), (80.3, 13.0), (80.2, 15.8), (82.3, 16.6),
+        (84.8, 19.2), (86.9, 20.8), (88.7, 21.6), (88.9, 26.3), (89.8, 26.3), (92.0, 26.8), (95.2, 26.6),
+        (97.3, 27.9), (96.1, 29.4), (94.6, 29.3), (92.0, 27.8), (88.9, 27.3), (88.1, 27.9), (84.0, 28.3),
+        (80.9, 30.2), (79.0, 31.5), (78.8, 32.6), (79.5, 34.0), (77.8, 35.5), (75.6, 36.8), (74.0, 36.8),
+        (73.8, 34.3), (74.5, 33.0), (74.6, 31.0), (73.4, 29.9), (72.0, 28.0), (70.2, 27.9), (69.5, 26.7),
+        (70.3, 25.7), (71.0, 24.4), (68.8, 24.3),
+    ],
+    # Coastal
+    "Mumbai": (72.75, 18.85, 73.15, 19.30),
+    "Chennai": (80.05, 12.80, 80.35, 13.25),
+    "Kolkata": (88.20, 22.40, 88.55, 22.70),
+    "Kerala": [
+        (74.9, 12.8), (75.6, 11.8), (76.2, 10.2), (76.6, 8.9), (77.1, 8.2), (77.5, 8.3), (77.2, 9.5),
+        (77.3, 10.5), (76.9, 11.3), (76.4, 11.9), (75.8, 12.3), (75.2, 12.9),
+    ],
+    # Himalayan
+    "Shimla": (77.00, 31.00, 77.30, 31.20),
+    "Darjeeling": (88.10, 26.90, 88.40, 27.20),
+    "Srinagar": (74.70, 34.00, 74.95, 34.20),
+    "Gangtok": (88.50, 27.25, 88.70, 27.40),
+    # Semi-Arid
+    "Rajasthan": [
+        (69.5, 26.7), (70.2, 27.9), (72.0, 28.0), (73.4, 29.9), (74.5, 29.9), (75.3, 28.6), (76.9, 28.2),
+        (77.5, 27.6), (78.2, 26.9), (77.3, 25.2), (76.8, 24.0), (75.0, 23.1), (74.3, 23.9), (73.2, 24.4),
+        (71.0, 24.4), (70.3, 25.7),
+    ],
+    "Gujarat": [
+        (68.1, 23.7), (69.6, 22.4), (70.4, 20.8), (72.6, 21.1), (72.9, 20.1), (73.8, 21.2), (74.3, 22.4),
+        (74.3, 23.9), (73.2, 24.4), (71.0, 24.4), (68.8, 24.3),
+    ],
+    "Telangana": [
+        (77.3, 17.5), (77.6, 18.6), (78.2, 19.4), (79.3, 19.6), (80.2, 18.9), (81.3, 17.8), (80.3, 17.0),
+        (79.9, 16.3), (78.6, 16.0), (77.6, 16.3),
+    ],
+    "Maharashtra": [
+        (72.7, 20.2), (73.9, 21.5), (74.6, 21.9), (76.2, 21.4), (77.3, 21.7), (78.6, 21.6), (80.5, 21.6),
+        (80.9, 20.0), (80.3, 18.9), (79.3, 19.6), (78.2, 19.4), (77.6, 18.6), (77.3, 17.5), (76.1, 16.0),
+        (74.4, 15.7), (73.5, 15.9), (73.0, 17.5), (72.8, 19.0),
+    ],
+    # River Basins
+    "Gangetic Plains": [
+        (77.0, 30.3), (79.0, 29.2), (81.0, 28.6), (84.0, 27.4), (88.1, 26.4), (88.9, 25.2), (88.4, 22.6),
+        (86.5, 23.8), (84.0, 24.5), (81.0, 25.0), (78.5, 26.5), (77.2, 28.0),
+    ],
+    "Brahmaputra Valley": (89.8, 25.8, 95.8, 27.8),
+    "Narmada Basin": (72.8, 21.2, 81.7, 23.6),
+    "Godavari Basin": [
+        (73.5, 20.0), (76.0, 21.0), (79.0, 21.5), (81.5, 21.5), (82.5, 19.5), (82.0, 17.0), (81.0, 16.5),
+        (79.5, 17.5), (77.5, 18.5), (74.5, 19.0),
+    ],
+}
+
+# Region groups shown as the Regional Impact tab's region types; a group's mask is the union of its members
+REGION_GROUPS = {
+    "Coastal": ["Mumbai", "Chennai", "Kolkata", "Kerala"],
+    "Himalayan": ["Shimla", "Darjeeling", "Srinagar", "Gangtok"],
+    "Semi-Arid": ["Rajasthan", "Gujarat", "Telangana", "Maharashtra"],
+    "River Basins": ["Gangetic Plains", "Brahmaputra Valley", "Narmada Basin", "Godavari Basin"],
+}
+
+REGION_NAMES = list(REGION_SHAPES) + list(REGION_GROUPS)
+
+
+def polygon(shape):
+    if len(shape) == 4 and not isinstance(shape[0], tuple):
+        lon_min, lat_min, lon_max, lat_max = shape
+        return [(lon_min, lat_min), (lon_max, lat_min), (lon_max, lat_max), (lon_min, lat_max)]
+    return shape
+
+
+def centroid(shape):
+    vertices = np.asarray(polygon(shape))
+    return float(vertices[:, 0].mean()), float(vertices[:, 1].mean())
+
+
+def points_in_polygon(lon, lat, vertices):
+    # Even-odd ray casting, vectorised over the points
+    inside = np.zeros(lon.shape, dtype=bool)
+    x0, y0 = vertices[-1]
+    for x1, y1 in vertices:
+        crosses = (y1 > lat) != (y0 > lat)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (lat - y1) * (x0 - x1) / (y0 - y1)
+        inside ^= crosses & (lon < x_cross)
+        x0, y0 = x1, y1
+    return inside
+
+
+class GridIndex:
+    # Spatial index over a regular lat/lon grid: coordinate windows by binary search
+    def __init__(self, lat, lon):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat_descending = len(self.lat) > 1 and self.lat[0] > self.lat[-1]
+        self._lat_sorted = self.lat[::-1] if self.lat_descending else self.lat
+
+    def _lat_slice(self, lat_min, lat_max):
+        start = np.searchsorted(self._lat_sorted, lat_min, side="left")
+        stop = np.searchsorted(self._lat_sorted, lat_max, side="right")
+        if self.lat_descending:
+            start, stop = len(self.lat) - stop, len(self.lat) - start
+        return slice(int(start), int(stop))
+
+    def window(self, lon_min, lat_min, lon_max, lat_max):
+        lon_start = np.searchsorted(self.lon, lon_min, side="left")
+        lon_stop = np.searchsorted(self.lon, lon_max, side="right")
+        return self._lat_slice(lat_min, lat_max), slice(int(lon_start), int(lon_stop))
+
+    def nearest(self, lon, lat):
+        return int(np.abs(self.lat - lat).argmin()), int(np.abs(self.lon - lon).argmin())
+
+
+class RegionMask:
+    def __init__(self, lat_slice, lon_slice, weights):
+        self.lat_slice = lat_slice
+        self.lon_slice = lon_slice
+        self.weights = weights       # cos(latitude) of the cells inside the region, 0 elsewhere
+
+    def cells(self):
+        return int(np.count_nonzero(self.weights))
+
+    def reduce(self, block):
+        # Area-weighted mean over the region for every time step of a (time, lat, lon) block
+        window = block[:, self.lat_slice, self.lon_slice]
+        valid = ~np.isnan(window)
+        total = np.einsum("tyx,yx->t", np.where(valid, window, 0.0), self.weights)
+        norm = np.einsum("tyx,yx->t", valid.astype(np.float64), self.weights)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / norm
+
+
+def _shape_mask(index, shape):
+    vertices = polygon(shape)
+    lons, lats = zip(*vertices)
+    lat_slice, lon_slice = index.window(min(lons), min(lats), max(lons), max(lats))
+    lat2d, lon2d = np.meshgrid(index.lat[lat_slice], index.lon[lon_slice], indexing="ij")
+    inside = points_in_polygon(lon2d, lat2d, vertices)
+    if not inside.any():
+        # Region smaller than a grid cell (e.g. a city on a coarse model grid): use the nearest cell
+        i, j = index.nearest(*centroid(shape))
+        lat_slice, lon_slice = slice(i, i + 1), slice(j, j + 1)
+        lat2d = index.lat[lat_slice][:, None]
+        inside = np.ones((1, 1), dtype=bool)
+    return RegionMask(lat_slice, lon_slice, np.where(inside, np.cos(np.deg2rad(lat2d)), 0.0))
+
+
+def _union(masks):
+    lat_start = min(m.lat_slice.start for m in masks)
+    lat_stop = max(m.lat_slice.stop for m in masks)
+    lon_start = min(m.lon_slice.start for m in masks)
+    lon_stop = max(m.lon_slice.stop for m in masks)
+    weights = np.zeros((lat_stop - lat_start, lon_stop - lon_start))
+    for m in masks:
+        rows = slice(m.lat_slice.start - lat_start, m.lat_slice.stop - lat_start)
+        cols = slice(m.lon_slice.start - lon_start, m.lon_slice.stop - lon_start)
+        weights[rows, cols] = np.maximum(weights[rows, cols], m.weights)
+    return RegionMask(slice(lat_start, lat_stop), slice(lon_start, lon_stop), weights)
+
+
+_masks_by_grid = {}
+
+
+def grid_masks(lat, lon):
+    # {region name: RegionMask} for the grid, computed once per distinct grid
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    key = hashlib.sha256(lat.tobytes() + b"|" + lon.tobytes()).hexdigest()
+    masks = _masks_by_grid.get(key)
+    if masks is None:
+        index = GridIndex(lat, lon)
+        masks = {name: _shape_mask(index, shape) for name, shape in REGION_SHAPES.items()}
+        for group, members in REGION_GROUPS.items():
+            masks[group] = _union([masks[name] for name in members])
+        _masks_by_grid[key] = masks
+    return masks
+
+
+def match_region(text):
+    # Region named in a question ("How will Rajasthan change?"); the most specific match wins
+    for name in sorted(REGION_NAMES, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(name)}\b", text, re.IGNORECASE):
+            return name
+    return None
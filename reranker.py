@@ -0,0 +1,164 @@
+"""
+Process-wide cross-encoder reranking service for the llama_index query engines.
+
+SentenceTransformerRerank loads BAAI/bge-reranker-base again for every engine
+that is built. Here the cross-encoder is loaded once per process and model, and
+(query, passage) pairs from concurrent queries are collected for a few
+milliseconds and scored together in one batched predict call. Scores of
+repeated pairs come from an LRU cache.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode
+from sentence_transformers import CrossEncoder
+
+from metrics import metrics
+
+RERANK_MODEL = "BAAI/bge-reranker-base"
+RERANK_BATCH_SIZE = 32
+MAX_BATCH_WAIT = 0.005      # seconds to wait for pairs from other queries
+SCORE_CACHE_SIZE = 20000
+
+
+def _pair_key(query, passage):
+    return hashlib.sha256(f"{query}\x00{passage}".encode("utf-8")).hexdigest()
+
+
+class RerankService:
+    def __init__(self, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, max_wait=MAX_BATCH_WAIT, device=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.model = CrossEncoder(model_name, max_length=512, device=device)
+
+        self._scores = OrderedDict()
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.requests = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.batches = 0
+
+        self._worker = threading.Thread(target=self._run, name=f"rerank-{model_name}", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give other queries a moment to add their pairs to this batch
+                deadline = time.monotonic() + self.max_wait
+                while (remaining := deadline - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                requests, self._pending = self._pending, []
+
+            pairs = [pair for request in requests for pair in request["pairs"]]
+            try:
+                scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+                offset = 0
+                for request in requests:
+                    request["scores"] = scores[offset:offset + len(request["pairs"])]
+                    offset += len(request["pairs"])
+            except Exception as e:
+                for request in requests:
+                    request["error"] = e
+            with self._stats_lock:
+                self.batches += 1
+                self.pairs_scored += len(pairs)
+            for request in requests:
+                request["done"].set()
+
+    def score(self, query, passages):
+        start = time.perf_counter()
+        keys = [_pair_key(query, passage) for passage in passages]
+        scores = [None] * len(passages)
+
+        with self._stats_lock:
+            for i, key in enumerate(keys):
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[i] = self._scores[key]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        if missing:
+            request = {"pairs": [(query, passages[i]) for i in missing], "done": threading.Event()}
+            with self._cond:
+                self._pending.append(request)
+                self._cond.notify()
+            request["done"].wait()
+            if "error" in request:
+                raise request["error"]
+            with self._stats_lock:
+                for i, score in zip(missing, request["scores"]):
+                    scores[i] = float(score)
+                    self._scores[keys[i]] = scores[i]
+                while len(self._scores) > SCORE_CACHE_SIZE:
+                    self._scores.popitem(last=False)
+
+        elapsed = time.perf_counter() - start
+        metrics.observe("rerank", elapsed)
+        with self._stats_lock:
+            self.requests += 1
+            self.cache_hits += len(passages) - len(missing)
+            self._latencies.append(elapsed)
+        return scores
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = list(self._latencies)
+            return {
+                "model": self.model_name,
+                "requests": self.requests,
+                "batches": self.batches,
+                "pairs_scored": self.pairs_scored,
+                "cache_hits": self.cache_hits,
+                "p50_ms": 1000 * float(np.percentile(latencies, 50)) if latencies else 0.0,
+                "p95_ms": 1000 * float(np.percentile(latencies, 95)) if latencies else 0.0,
+            }
+
+
+# One service (and one copy of the model weights) per model name and process
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_rerank_service(model_name=RERANK_MODEL):
+    service = _services.get(model_name)
+    if service is None:
+        with _services_lock:
+            service = _services.get(model_name)
+            if service is None:
+                service = _services[model_name] = RerankService(model_name)
+    return service
+
+
+class SharedRerank(BaseNodePostprocessor):
+    # Same behaviour as SentenceTransformerRerank, backed by the shared service
+    model: str = Field(default=RERANK_MODEL, description="Cross-encoder model name.")
+    top_n: int = Field(default=2, description="Number of nodes to return.")
+
+    @classmethod
+    def class_name(cls):
+        return "SharedRerank"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if not nodes:
+            return []
+
+        passages = [node.node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        scores = get_rerank_service(self.model).score(query_bundle.query_str, passages)
+        for node, score in zip(nodes, scores):
+            node.score = score
+        return sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)[:self.top_n]
@@ -0,0 +1,68 @@
+"""
+Per-query retrieval depth and response detail levels.
+
+A fixed k pads simple factual questions with loosely related chunks, and
+llama3 still pays prefill for them. Instead, the depth is chosen from the
+dense (cosine) similarity scores of the ranked results (hybrid order within a
+shard, scored by the dense similarity at the same rank; see sharded_index.py).
+Taking results stops at the first one that is below MIN_SIMILARITY, or more
+than MAX_SPREAD below the best score, or more than CLIFF_DROP below the
+previous result (a relevance cliff). The depth always stays between MIN_K and
+the detail level's max_k.
+
+The Response Detail Level slider (1-5) picks the row of DETAIL_LEVELS. Each
+row sets the most chunks retrieved, the context token budget, the answer's
+num_predict and the length instruction in the prompt. Level 3 keeps the
+original prompt, k and context budget as its limits.
+"""
+
+MIN_K = 2
+MIN_SIMILARITY = 0.5    # cosine; mxbai-embed-large matches below this are off-topic
+MAX_SPREAD = 0.15       # results this far below the best match add little
+CLIFF_DROP = 0.06       # a gap this large between neighbours ends the relevant results
+
+DEFAULT_DETAIL = 3
+DETAIL_LEVELS = {
+    1: {"max_k": 3, "context_tokens": 400, "num_predict": 160,
+        "instruction": "**Keep responses very short**—two or three sentences with the key fact or number."},
+    2: {"max_k": 6, "context_tokens": 650, "num_predict": 300,
+        "instruction": "**Keep responses short**—one compact paragraph."},
+    3: {"max_k": 10, "context_tokens": 1000, "num_predict": 512,
+        "instruction": "**Keep responses at a medium length**—detailed enough to be useful but not overly technical."},
+    4: {"max_k": 12, "context_tokens": 1400, "num_predict": 768,
+        "instruction": "**Give a detailed response**—cover the main figures, regions and scenarios in the context."},
+    5: {"max_k": 15, "context_tokens": 2000, "num_predict": 1024,
+        "instruction": "**Give a thorough response**—cover every relevant figure, region, scenario and caveat in the context."},
+}
+
+
+def detail_level(value):
+    # Slider / request value -> a valid level
+    if value is None:
+        return DEFAULT_DETAIL
+    return min(max(int(value), min(DETAIL_LEVELS)), max(DETAIL_LEVELS))
+
+
+def detail_variant(level):
+    # Answer cache variant: answers at different detail levels are cached separately
+    return "" if level == DEFAULT_DETAIL else f"detail-{level}"
+
+
+def l2_to_cosine(distance):
+    # FAISS indexes here use squared L2; for unit-length embeddings |a - b|^2 = 2 - 2 cos(a, b)
+    return 1.0 - float(distance) / 2.0
+
+
+def choose_k(similarities, max_k, min_k=MIN_K):
+    # Number of results worth using, from the dense similarities of the results in the order they will be cut
+    ranked = list(similarities)[:max_k]
+    if not ranked:
+        return max_k
+    k = 1
+    while k < len(ranked):
+        score = ranked[k]
+        if k >= min_k and (score < MIN_SIMILARITY or score < ranked[0] - MAX_SPREAD
+                           or ranked[k - 1] - score > CLIFF_DROP):
+            break
+        k += 1
+    return min(max(k, min_k), max_k)
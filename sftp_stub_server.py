@@ -0,0 +1,272 @@
+"""
+In-process SSH/SFTP server for testing file_transfer.py without a real sshd.
+
+Serves a local directory over SFTP with password authentication. Each client
+connection gets its own thread, so the transfer engine's parallel connections
+work as they would against the lab server. With allow_exec, commands
+(sha256sum, the delta_sync helper, scp -t) run in a shell in the root
+directory, so use relative remote paths; without it the engine falls back to
+SFTP-only transfers. bytes_received / bytes_sent count the encrypted traffic
+on the wire, for benchmarks.
+
+    python sftp_stub_server.py /tmp/remote --port 2222 --user test --password test
+"""
+
+import argparse
+import errno
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface
+from paramiko.sftp import SFTP_FAILURE, SFTP_OK
+
+
+def _error(e):
+    return SFTPServer.convert_errno(e.errno if e.errno is not None else errno.EIO)
+
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return _error(e)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _LocalSFTP(SFTPServerInterface):
+    # SFTP operations mapped onto a local root directory
+    def __init__(self, server, *args, root, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        return os.path.join(self.root, self.canonicalize(path).lstrip("/"))
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            entries = []
+            for name in os.listdir(local):
+                attr = SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return _error(e)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return _error(e)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        local = self._local(path)
+        try:
+            fd = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o644)
+        except OSError as e:
+            return _error(e)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        try:
+            f = os.fdopen(fd, mode)
+        except OSError as e:
+            return _error(e)
+        handle = _Handle(flags)
+        handle.filename = local
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return _error(e)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if os.path.exists(self._local(newpath)):
+            return SFTP_FAILURE
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return _error(e)
+        return SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._local(path))
+        except OSError as e:
+            return _error(e)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self._local(path))
+        except OSError as e:
+            return _error(e)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        return SFTP_OK
+
+
+def _run_command(channel, command, cwd):
+    # Unbuffered pipes: interactive protocols such as scp wait for each reply
+    process = subprocess.Popen(command, shell=True, cwd=cwd, bufsize=0,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def pump_stdin():
+        try:
+            for data in iter(lambda: channel.recv(1 << 16), b""):
+                process.stdin.write(data)
+            process.stdin.close()
+        except (OSError, EOFError):
+            pass
+
+    def pump_stderr():
+        for data in iter(lambda: process.stderr.read(1 << 16), b""):
+            channel.sendall_stderr(data)
+
+    threads = [threading.Thread(target=pump_stdin, daemon=True), threading.Thread(target=pump_stderr, daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        for data in iter(lambda: process.stdout.read(1 << 16), b""):
+            channel.sendall(data)
+        threads[1].join()
+        channel.send_exit_status(process.wait())
+    except OSError:
+        process.kill()
+    channel.close()
+
+
+class _CountingSocket:
+    # Socket wrapper counting the bytes that cross the wire
+    def __init__(self, sock, server):
+        self._sock = sock
+        self._server = server
+
+    def recv(self, n):
+        data = self._sock.recv(n)
+        self._server.bytes_received += len(data)
+        return data
+
+    def send(self, data):
+        n = self._sock.send(data)
+        self._server.bytes_sent += n
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class _PasswordServer(paramiko.ServerInterface):
+    def __init__(self, username, password, root=None):
+        self.username = username
+        self.password = password
+        self.root = root    # commands are refused when None
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        if self.root is None:
+            return False
+        threading.Thread(target=_run_command, args=(channel, command.decode(), self.root), daemon=True).start()
+        return True
+
+
+class StubSFTPServer:
+    def __init__(self, root, host="127.0.0.1", port=0, username="test", password="test", allow_exec=False):
+        self.root = os.path.abspath(root)
+        self.username = username
+        self.password = password
+        self.allow_exec = allow_exec
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(32)
+        self.host, self.port = self.sock.getsockname()
+        self.transports = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._thread = threading.Thread(target=self._accept, name="sftp-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(_CountingSocket(client, self))
+            transport.add_server_key(self.host_key)
+            transport.use_compression(True)     # offered; used only by clients that ask for it
+            transport.set_subsystem_handler("sftp", SFTPServer, _LocalSFTP, root=self.root)
+            server = _PasswordServer(self.username, self.password, self.root if self.allow_exec else None)
+            transport.start_server(server=server)
+            self.transports.append(transport)
+
+    def drop_connections(self):
+        # Simulates a dropped network link: every client transport is closed mid-transfer
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def stop(self):
+        self._stopped.set()
+        self.sock.close()
+        self.drop_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local directory over SFTP for testing file_transfer.py.")
+    parser.add_argument("root")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--user", default="test")
+    parser.add_argument("--password", default="test")
+    parser.add_argument("--allow-exec", action="store_true", help="run exec requests in a shell in the root")
+    args = parser.parse_args()
+    server = StubSFTPServer(args.root, port=args.port, username=args.user, password=args.password,
+                            allow_exec=args.allow_exec).start()
+    print(f"Serving {server.root} over SFTP on {server.host}:{server.port} (user '{args.user}'). Ctrl+C to stop.")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-source index shards.
+
+Each source report gets its own index directory under <index_dir>/shards/
+(index.faiss, docstore.sqlite3, bm25.json and a manifest covering only that
+file), so adding or re-issuing one report rebuilds only its shard. Chunks keep
+their source, page and section metadata in the shard's docstore.
+
+Queries pick shards before any vector search: `sources` restricts the search to
+the named shards and `weights` scales each shard's fused scores (e.g. to prefer
+the APU report over the IPCC FAQs). Each shard ranks its chunks by hybrid
+(reciprocal rank fusion) order and scores them with the dense similarity at the
+same rank, so a shard whose best match is poor ranks below one with a close
+match. Results are merged by weighted score, and how many are kept is chosen
+from that merged order (retrieval_depth.choose_k).
+"""
+
+import hashlib
+import os
+import re
+
+from langchain.schema import BaseRetriever
+
+from hybrid_retrieval import FETCH_K
+from retrieval_depth import choose_k
+
+SHARDS_DIR = "shards"
+
+
+def shard_name(path, root=None):
+    # "Climate report draft Oct 2024.pdf" -> "climate-report-draft-oct-2024". With the corpus root, files in
+    # subfolders get the folder and a short hash of the relative path ("2023/report.pdf" -> "2023-report-3f1c2a"),
+    # so equal file names never share a shard. A shard name passed back in (without a root) is returned unchanged.
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    name = re.sub(r"[^a-z0-9]+", "-", os.path.splitext(relative)[0].lower()).strip("-") or "source"
+    if os.path.dirname(relative):
+        name += "-" + hashlib.sha256(relative.replace(os.sep, "/").encode("utf-8")).hexdigest()[:6]
+    return name
+
+
+def shard_dir(index_dir, path, root=None):
+    return os.path.join(index_dir, SHARDS_DIR, shard_name(path, root))
+
+
+class ShardedRetriever(BaseRetriever):
+    shards: dict            # shard name -> HybridRetriever
+    k: int = 5              # most results per query
+    fetch_k: int = FETCH_K
+    default_weights: dict = {}
+    adaptive: bool = True   # fewer than k results when the similarity scores fall off
+
+    def search(self, query, query_embedding=None, sources=None, weights=None, max_k=None, stats=None):
+        # stats (optional dict) gets the chosen k and the best dense similarity
+        max_k = max_k or self.k
+        stats = {} if stats is None else stats
+        names = [name for name in self.shards if sources is None or name in sources]
+        if sources is not None and not names:
+            raise ValueError(f"Unknown sources {sorted(sources)}. Available: {', '.join(sorted(self.shards))}.")
+        weights = {**self.default_weights, **(weights or {})}
+
+        if query_embedding is None:
+            query_embedding = next(iter(self.shards.values())).vector_db.embedding_function.embed_query(query)
+        scored = []
+        for name in names:
+            weight = weights.get(name, 1.0)
+            if weight <= 0:
+                continue
+            for doc, similarity in self.shards[name].search_with_scores(query, query_embedding, k=max_k):
+                scored.append((similarity * weight, similarity, doc))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        scored = scored[:max_k]
+        similarities = [similarity for _, similarity, _ in scored]
+        k = choose_k(similarities, max_k) if self.adaptive else max_k
+        stats.update(k=min(k, len(scored)), max_k=max_k, top_similarity=max(similarities, default=None))
+        return [doc for _, _, doc in scored[:k]]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search(query)
@@ -0,0 +1,97 @@
+"""Similarity threshold, TTL, variants and eviction of the semantic answer cache (answer_cache.py)."""
+
+import math
+import types
+
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache
+
+QUESTION = [1.0, 0.0, 0.0]
+
+
+def at_similarity(cosine):
+    # A unit vector with the given cosine similarity to QUESTION
+    return [cosine, math.sqrt(1 - cosine ** 2), 0.0]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1_000_000.0)
+    clock.time = lambda: clock.now
+    monkeypatch.setattr(answer_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    cache = AnswerCache(None, path=":memory:", threshold=0.92, max_entries=3, ttl_seconds=3600)
+    cache.store("How hot will India get by 2050?", "About 2 degrees warmer.", ["report.pdf"], 4.0,
+                embedding=QUESTION)
+    return cache
+
+
+def test_hit_above_the_threshold(cache):
+    entry, _ = cache.lookup("How will temperature change in India by 2050?", embedding=at_similarity(0.95))
+    assert entry["answer"] == "About 2 degrees warmer."
+    assert entry["similarity"] == pytest.approx(0.95, abs=1e-5)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["saved_seconds"] == 4.0
+
+
+def test_miss_below_the_threshold(cache):
+    entry, embedding = cache.lookup("Which regions will flood?", embedding=at_similarity(0.85))
+    assert entry is None
+    assert embedding == at_similarity(0.85)
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_answer_is_a_miss(cache, clock):
+    clock.now += 3599
+    assert cache.lookup("again", embedding=QUESTION)[0] is not None
+    clock.now += 2
+    assert cache.lookup("again", embedding=QUESTION)[0] is None
+    assert not cache.contains(QUESTION)
+
+
+def test_expired_answers_are_dropped_on_store(cache, clock):
+    clock.now += 3601
+    cache.store("Monsoon changes?", "Rain becomes erratic.", [], 3.0, embedding=[0.0, 0.0, 1.0])
+    assert cache.stats()["entries"] == 1
+
+
+def test_variants_do_not_match_each_other(cache):
+    assert cache.lookup("same question", embedding=QUESTION, variant="detail=brief")[0] is None
+    cache.store("same question", "Short answer.", [], 1.0, embedding=QUESTION, variant="detail=brief")
+    assert cache.lookup("same question", embedding=QUESTION, variant="detail=brief")[0]["answer"] == "Short answer."
+    assert cache.lookup("same question", embedding=QUESTION)[0]["answer"] == "About 2 degrees warmer."
+
+
+def test_least_recently_used_answer_is_evicted(cache, clock):
+    others = [[0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    for i, embedding in enumerate(others):
+        clock.now += 1
+        cache.store(f"question {i}", f"answer {i}", [], 1.0, embedding=embedding)
+    # Using the first answer makes "question 0" the least recently used
+    clock.now += 1
+    cache.lookup("How hot will India get by 2050?", embedding=QUESTION)
+    clock.now += 1
+    cache.store("question 2", "answer 2", [], 1.0, embedding=[0.0, -1.0, 0.0])
+
+    assert cache.stats()["entries"] == 3
+    assert cache.contains(QUESTION)
+    assert not cache.contains(others[0])
+
+
+def test_new_fingerprint_empties_the_cache(cache):
+    cache.set_fingerprint("rebuilt index")
+    assert cache.stats()["entries"] == 0
+    assert cache.lookup("How hot will India get by 2050?", embedding=QUESTION)[0] is None
+
+
+def test_contains_leaves_the_counters_alone(cache):
+    assert cache.contains(at_similarity(0.95))
+    assert not cache.contains(at_similarity(0.85))
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
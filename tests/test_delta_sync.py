@@ -0,0 +1,119 @@
+"""Block delta of delta_sync.py: the operations on their own, and the round trip through StubSFTPServer."""
+
+import hashlib
+import os
+import random
+import struct
+import zlib
+
+import pytest
+
+from delta_sync import RemoteHelperError, block_size_for, delta_ops, parse_signature, send_delta
+from file_transfer import connect
+from sftp_stub_server import StubSFTPServer
+
+BLOCK = 2048
+
+
+def signature(data, block):
+    # The helper's "sig" output, computed locally
+    raw = struct.pack(">q", len(data))
+    for i in range(0, len(data), block):
+        piece = data[i:i + block]
+        raw += struct.pack(">I", zlib.adler32(piece)) + hashlib.blake2b(piece, digest_size=16).digest()
+    return raw
+
+
+def apply_ops(old, ops, block):
+    out = b""
+    for op in ops:
+        if op[0] == "copy":
+            out += old[op[1] * block:(op[1] + op[2]) * block]
+        else:
+            out += op[1]
+    return out
+
+
+def rebuild(old, new, path, block=BLOCK):
+    path.write_bytes(new)
+    _, blocks = parse_signature(signature(old, block), block)
+    with open(path, "rb") as f:
+        ops = list(delta_ops(f, blocks, block))
+    return apply_ops(old, ops, block), ops
+
+
+def random_bytes(n, seed=0):
+    return random.Random(seed).randbytes(n)
+
+
+OLD = random_bytes(200 * BLOCK + 123)
+EDITS = {
+    "unchanged": OLD,
+    "insert": OLD[:50_000] + b"inserted text" + OLD[50_000:],
+    "delete": OLD[:70_000] + OLD[90_000:],
+    "append": OLD + random_bytes(5000, seed=1),
+    "truncate": OLD[:100_001],
+    "moved blocks": OLD[300_000:] + OLD[:300_000],
+    "rewritten": random_bytes(len(OLD), seed=2),
+    "empty": b"",
+}
+
+
+@pytest.mark.parametrize("name", EDITS)
+def test_delta_ops_rebuild_the_new_file(tmp_path, name):
+    rebuilt, _ = rebuild(OLD, EDITS[name], tmp_path / "new.bin")
+    assert rebuilt == EDITS[name]
+
+
+def test_small_edit_sends_little_literal_data(tmp_path):
+    _, ops = rebuild(OLD, EDITS["insert"], tmp_path / "new.bin")
+    literal = sum(len(op[1]) for op in ops if op[0] == "data")
+    assert literal < 2 * BLOCK + len(b"inserted text")
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = StubSFTPServer(tmp_path / "remote", allow_exec=True).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def ssh(server):
+    client = connect(server.host, server.port, server.username, server.password)
+    yield client
+    client.close()
+
+
+def test_send_delta_round_trip(server, ssh, tmp_path):
+    old = random_bytes(3_000_000, seed=3)
+    new = old[:1_000_000] + b"changed" + old[1_000_100:] + b"tail"
+    # Remote paths are relative: the stub runs commands in its root
+    (tmp_path / "remote" / "data.bin").write_bytes(old)
+    local = tmp_path / "data.bin"
+    local.write_bytes(new)
+
+    result = send_delta(ssh, str(local), "data.bin", hashlib.sha256(new).hexdigest())
+
+    assert (tmp_path / "remote" / "data.bin").read_bytes() == new
+    assert result["block_size"] == block_size_for(len(new))
+    assert result["bytes_sent"] < len(new) // 20
+    assert not os.path.exists(tmp_path / "remote" / "data.bin.part")
+
+
+def test_send_delta_without_a_remote_copy(server, ssh, tmp_path):
+    local = tmp_path / "new.bin"
+    local.write_bytes(b"x" * 10_000)
+    with pytest.raises(RemoteHelperError):
+        send_delta(ssh, str(local), "missing.bin", hashlib.sha256(b"x" * 10_000).hexdigest())
+
+
+def test_send_delta_rejects_a_wrong_checksum(server, ssh, tmp_path):
+    old = random_bytes(100_000, seed=4)
+    (tmp_path / "remote" / "data.bin").write_bytes(old)
+    local = tmp_path / "data.bin"
+    local.write_bytes(old + b"more")
+    with pytest.raises(RemoteHelperError):
+        send_delta(ssh, str(local), "data.bin", "0" * 64)
+    # The old copy is left in place
+    assert (tmp_path / "remote" / "data.bin").read_bytes() == old
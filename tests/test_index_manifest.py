@@ -0,0 +1,101 @@
+"""Incremental index updates driven by the manifest (index_manifest.py, rag_pipeline.load_or_build_index)."""
+
+import pytest
+from langchain.schema import Document
+
+import rag_pipeline
+from embedding_pipeline import HashEmbeddings, build_faiss_from_documents
+from index_manifest import chunk_ids, load_manifest, save_manifest, source_state
+from mmap_index_store import save_vector_store
+
+
+class CountingEmbeddings(HashEmbeddings):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def chunks(*texts, page=0):
+    return [Document(page_content=text, metadata={"source": "report.pdf", "page": page}) for text in texts]
+
+
+@pytest.fixture
+def saved_index(tmp_path):
+    # A saved index over three chunks, with its manifest, for a source file that exists
+    source = tmp_path / "report.pdf"
+    source.write_bytes(b"version 1")
+    path = str(tmp_path / "shard")
+    embed_model = CountingEmbeddings()
+    docs = chunks("Heat waves will grow longer.", "Monsoon rain becomes erratic.", "Sea levels rise along the coast.")
+    ids = chunk_ids(docs)
+    vector_db = build_faiss_from_documents(docs, embed_model, ids=ids)
+    save_vector_store(vector_db, path)
+    sources = source_state([str(source)])
+    save_manifest(path, rag_pipeline.index_params(), sources, ids)
+    embed_model.embedded.clear()
+    return {"path": path, "source": source, "embed_model": embed_model, "vector_db": vector_db, "ids": ids}
+
+
+def stored_ids(vector_db):
+    return set(vector_db.index_to_docstore_id.values())
+
+
+def test_update_embeds_only_new_chunks(saved_index):
+    path, vector_db = saved_index["path"], saved_index["vector_db"]
+    # One chunk removed, one added, the other two moved to page 3
+    docs = chunks("Heat waves will grow longer.", "Sea levels rise along the coast.", "Glaciers are retreating.", page=3)
+    ids = chunk_ids(docs)
+
+    rag_pipeline.update_index(vector_db, docs, ids, load_manifest(path), source_state([str(saved_index["source"])]), path)
+
+    assert saved_index["embed_model"].embedded == ["Glaciers are retreating."]
+    assert stored_ids(vector_db) == set(ids)
+    assert load_manifest(path)["chunks"] == ids
+    assert vector_db.docstore.search(ids[0]).metadata["page"] == 3
+
+
+def test_changed_source_is_updated_in_place(saved_index, monkeypatch):
+    saved_index["source"].write_bytes(b"version 2")
+    docs = chunks("Heat waves will grow longer.", "Monsoon rain becomes erratic.", "Glaciers are retreating.")
+    monkeypatch.setattr(rag_pipeline, "load_chunks", lambda paths: docs)
+    monkeypatch.setattr(rag_pipeline, "build_index", lambda *args, **kwargs: pytest.fail("index rebuilt"))
+
+    vector_db = rag_pipeline.load_or_build_index(saved_index["embed_model"], saved_index["path"], [str(saved_index["source"])])
+
+    assert saved_index["embed_model"].embedded == ["Glaciers are retreating."]
+    assert stored_ids(vector_db) == set(chunk_ids(docs))
+
+
+def test_unchanged_source_loads_without_parsing(saved_index, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "load_chunks", lambda paths: pytest.fail("source parsed"))
+    monkeypatch.setattr(rag_pipeline, "build_index", lambda *args, **kwargs: pytest.fail("index rebuilt"))
+
+    vector_db = rag_pipeline.load_or_build_index(saved_index["embed_model"], saved_index["path"], [str(saved_index["source"])])
+
+    assert stored_ids(vector_db) == set(saved_index["ids"])
+    assert saved_index["embed_model"].embedded == []
+
+
+def test_store_and_manifest_out_of_sync_rebuilds(saved_index, monkeypatch):
+    # As after a crash between saving the store and saving the manifest
+    path = saved_index["path"]
+    manifest = load_manifest(path)
+    save_manifest(path, manifest["params"], manifest["sources"], saved_index["ids"][:2] + ["missing-chunk"])
+    saved_index["source"].write_bytes(b"version 2")
+    monkeypatch.setattr(rag_pipeline, "load_chunks", lambda paths: chunks("Glaciers are retreating."))
+    rebuilt = object()
+    monkeypatch.setattr(rag_pipeline, "build_index", lambda *args, **kwargs: rebuilt)
+
+    assert rag_pipeline.load_or_build_index(saved_index["embed_model"], path, [str(saved_index["source"])]) is rebuilt
+
+
+def test_changed_splitter_params_rebuild(saved_index, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "chunk_size", rag_pipeline.chunk_size + 100)
+    rebuilt = object()
+    monkeypatch.setattr(rag_pipeline, "build_index", lambda *args, **kwargs: rebuilt)
+
+    assert rag_pipeline.load_or_build_index(saved_index["embed_model"], saved_index["path"], [str(saved_index["source"])]) is rebuilt
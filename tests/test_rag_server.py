@@ -0,0 +1,83 @@
+"""Admission control, deadlines and the answer cache of rag_server.py, on the offline fake pipeline."""
+
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from rag_server import create_app, make_fake_pipeline
+
+# The fake LLM streams its canned answer in about 15 tokens
+SLOW_TOKEN = 0.1
+
+
+def make_client(token_delay=0.0, **kwargs):
+    return TestClient(create_app(lambda: make_fake_pipeline(token_delay), warmup=False, **kwargs))
+
+
+def wait_for(client, predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = client.get("/stats").json()
+        if predicate(stats):
+            return stats
+        time.sleep(0.02)
+    raise AssertionError("condition not reached")
+
+
+def test_rejects_with_503_beyond_the_admission_limit():
+    with make_client(token_delay=SLOW_TOKEN, max_pending=1) as client:
+        first = {}
+        worker = threading.Thread(target=lambda: first.update(
+            response=client.post("/query", json={"query": "How hot will India get?", "stream": False})))
+        worker.start()
+        wait_for(client, lambda stats: stats["in_flight"] == 1)
+
+        response = client.post("/query", json={"query": "Which regions flood?", "stream": False})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        worker.join()
+        assert first["response"].status_code == 200
+        stats = client.get("/stats").json()
+        assert stats["rejected"] == 1
+        assert stats["in_flight"] == 0
+
+
+def test_deadline_returns_504_and_frees_the_slot():
+    with make_client(token_delay=SLOW_TOKEN) as client:
+        response = client.post("/query", json={"query": "Monsoon changes?", "stream": False, "timeout": 0.3})
+        assert response.status_code == 504
+        stats = wait_for(client, lambda stats: stats["in_flight"] == 0)
+        assert stats["timeouts"] == 1
+
+
+def test_deadline_ends_a_stream_with_an_error_event():
+    with make_client(token_delay=SLOW_TOKEN) as client:
+        response = client.post("/query", json={"query": "Glacier retreat?", "timeout": 0.3})
+        events = [json.loads(line) for line in response.iter_lines() if line]
+        assert events[-1] == {"error": "Deadline exceeded."}
+        assert not any(event.get("done") for event in events)
+        wait_for(client, lambda stats: stats["in_flight"] == 0)
+
+
+def test_repeated_question_is_answered_from_the_cache():
+    with make_client() as client:
+        query = {"query": "How will temperature change in India by 2050?", "stream": False}
+        first = client.post("/query", json=query).json()
+        second = client.post("/query", json=query).json()
+        assert not first["cached"]
+        assert second["cached"]
+        assert second["result"] == first["result"]
+        assert client.get("/stats").json()["cache_hits"] == 1
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_unknown_source_is_a_400_that_lists_the_sources(stream):
+    with make_client() as client:
+        response = client.post("/query", json={"query": "Heat waves?", "stream": stream, "sources": ["nope"]})
+        assert response.status_code == 400
+        assert response.json()["detail"]["available_sources"] == ["default"]
+        assert client.get("/stats").json()["in_flight"] == 0
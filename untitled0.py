@@ -1,38 +1,39 @@
 # %%
 from langchain_ollama import OllamaLLM, OllamaEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from embedding_cache import CachedEmbeddings
+from embedding_pipeline import build_faiss_from_documents, clear_checkpoints
+from ingest import iter_chunks, iter_pages
+from mmap_index_store import load_vector_store, save_vector_store
 # %%
 # %%
 
 # Load PDF
 pdf_path = "/home/ajai-krishna/Downloads/combinepdf-1.pdf"  # Update with your file path
-loader = PyPDFLoader(pdf_path)
-documents = loader.load()
+# Pages are extracted in parallel and split as they arrive (see ingest.py)
+pages = iter_pages([pdf_path])
 
 # %%
 # %%
 # Split into Chunks
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-docs = splitter.split_documents(documents)
+docs = list(iter_chunks(pages, chunk_size=500, chunk_overlap=100))
 
 # %%
 # %%
 try:
     import faiss  # Ensure FAISS is available
-    embed_model = OllamaEmbeddings(model="mxbai-embed-large")
+    embed_model = CachedEmbeddings(OllamaEmbeddings(model="mxbai-embed-large"), "mxbai-embed-large")
 
     # If FAISS index exists, load it instead of recomputing
     try:
-        vector_db = FAISS.load_local("faiss_index", embed_model)
+        vector_db = load_vector_store("faiss_index", embed_model)
         print("FAISS index loaded from storage.")
     except:
         print("FAISS index not found. Creating a new one...")
-        vector_db = FAISS.from_documents(docs, embed_model)
-        vector_db.save_local("faiss_index")  # Save for future use
+        vector_db = build_faiss_from_documents(docs, embed_model, checkpoint_dir="faiss_index.checkpoints")
+        save_vector_store(vector_db, "faiss_index")  # Save for future use
+        clear_checkpoints("faiss_index.checkpoints")
 
 except ImportError:
     raise ImportError("FAISS is not installed. Please install using `pip install faiss-cpu` or `faiss-gpu`.")
@@ -2,30 +2,31 @@ import os
 import numpy as np
 import nest_asyncio
 from dotenv import load_dotenv, find_dotenv
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
 from trulens_eval import Feedback, TruLlama
 from trulens_eval.feedback import GroundTruthAgreement
 
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding, resolve_embed_model
+from embedding_cache import get_embedding_cache
+from judge_models import get_judge
+from reranker import SharedRerank
+
 from llama_index.core import ServiceContext, VectorStoreIndex, StorageContext, load_index_from_storage
 from llama_index.core.node_parser import SentenceWindowNodeParser, HierarchicalNodeParser, get_leaf_nodes
-from llama_index.core.postprocessor import MetadataReplacementPostProcessor, SentenceTransformerRerank
+from llama_index.core.postprocessor import MetadataReplacementPostProcessor
 from llama_index.core.retrievers import AutoMergingRetriever
 from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.ingestion import IngestionPipeline
 
 nest_asyncio.apply()
 
-# Load local LLaMA model
-#model_path = r"/home/ajai-krishna/Documents/llama_model/model"  # Update this path
-model_path = r"/home/ajai-krishna/data/models"
-model_name = "meta-llama/Llama-3.3-70B-Instruct"
-
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(model_path)
-llama_pipeline = pipeline("text-generation", model=model, tokenizer=tokenizer)
-
+# Local judge model (LLaMA by default, see judge_models.py). Nothing is loaded until the
+# first feedback call; set JUDGE_BACKEND=ollama or stub to avoid the 70B weights.
 def local_model_generate(prompt):
-    response = llama_pipeline(prompt, max_length=512, temperature=0.7)
-    return response[0]['generated_text']
+    return get_judge().generate_batch([prompt])[0]
+
+def local_model_generate_batch(prompts):
+    return get_judge().generate_batch(prompts)
 
 # Feedback functions using local LLaMA model
 def local_relevance_feedback(query, response):
@@ -49,52 +50,96 @@ feedbacks = [qa_relevance, qs_relevance, groundedness]
 def get_trulens_recorder(query_engine, feedbacks, app_id):
     return TruLlama(query_engine, app_id=app_id, feedbacks=feedbacks)
 
+# Embedding model whose text (node) embeddings go through the shared on-disk embedding cache
+class CachedEmbedding(BaseEmbedding):
+    _inner: BaseEmbedding = PrivateAttr()
+
+    def __init__(self, inner, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+
+    def _get_query_embedding(self, query):
+        return self._inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query):
+        return await self._inner.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return get_embedding_cache().get_or_compute(self.model_name, texts, self._inner.get_text_embedding_batch).tolist()
+
+def cached_embed_model(embed_model):
+    if isinstance(embed_model, CachedEmbedding):
+        return embed_model
+    return CachedEmbedding(resolve_embed_model(embed_model))
+
+# Node parsing only happens when an index is built; it runs over the documents in a process pool
+PARSE_WORKERS = os.cpu_count() or 1
+
+def parse_nodes(documents, node_parser, num_workers=PARSE_WORKERS):
+    num_workers = min(num_workers, len(documents)) if len(documents) > 1 else None
+    return IngestionPipeline(transformations=[node_parser]).run(documents=documents, num_workers=num_workers)
+
+def load_persisted_index(save_dir, service_context):
+    # Opening a persisted index needs neither the source documents nor a node parser
+    return load_index_from_storage(StorageContext.from_defaults(persist_dir=save_dir), service_context=service_context)
+
 # Sentence Window Index
-def build_sentence_window_index(document, llm, embed_model="local:BAAI/bge-small-en-v1.5", save_dir="sentence_index"):
+def build_sentence_window_index(document=None, llm=None, embed_model="local:BAAI/bge-small-en-v1.5", save_dir="sentence_index"):
+    if os.path.exists(save_dir):
+        sentence_context = ServiceContext.from_defaults(llm=llm, embed_model=cached_embed_model(embed_model))
+        return load_persisted_index(save_dir, sentence_context)
+
+    if document is None:
+        raise ValueError(f"No sentence window index in '{save_dir}' and no document to build one from.")
+    documents = document if isinstance(document, list) else [document]
+
     node_parser = SentenceWindowNodeParser.from_defaults(
         window_size=3, window_metadata_key="window", original_text_metadata_key="original_text"
     )
-    sentence_context = ServiceContext.from_defaults(llm=llm, embed_model=embed_model, node_parser=node_parser)
-
-    if not os.path.exists(save_dir):
-        sentence_index = VectorStoreIndex.from_documents([document], service_context=sentence_context)
-        sentence_index.storage_context.persist(persist_dir=save_dir)
-    else:
-        sentence_index = load_index_from_storage(
-            StorageContext.from_defaults(persist_dir=save_dir), service_context=sentence_context
-        )
+    sentence_context = ServiceContext.from_defaults(llm=llm, embed_model=cached_embed_model(embed_model), node_parser=node_parser)
+    nodes = parse_nodes(documents, node_parser)
+    sentence_index = VectorStoreIndex(nodes, service_context=sentence_context)
+    sentence_index.storage_context.persist(persist_dir=save_dir)
 
     return sentence_index
 
 def get_sentence_window_query_engine(sentence_index, similarity_top_k=6, rerank_top_n=2):
     postproc = MetadataReplacementPostProcessor(target_metadata_key="window")
-    rerank = SentenceTransformerRerank(top_n=rerank_top_n, model="BAAI/bge-reranker-base")
+    # Cross-encoder weights are loaded once per process and shared by every engine
+    rerank = SharedRerank(top_n=rerank_top_n, model="BAAI/bge-reranker-base")
 
     return sentence_index.as_query_engine(similarity_top_k=similarity_top_k, node_postprocessors=[postproc, rerank])
 
 # Auto-Merging Index
-def build_automerging_index(documents, llm, embed_model="local:BAAI/bge-small-en-v1.5", save_dir="merging_index", chunk_sizes=None):
+def build_automerging_index(documents=None, llm=None, embed_model="local:BAAI/bge-small-en-v1.5", save_dir="merging_index", chunk_sizes=None):
+    merging_context = ServiceContext.from_defaults(llm=llm, embed_model=cached_embed_model(embed_model))
+
+    # The persisted docstore already holds the parent nodes AutoMergingRetriever looks up
+    if os.path.exists(save_dir):
+        return load_persisted_index(save_dir, merging_context)
+
+    if not documents:
+        raise ValueError(f"No auto-merging index in '{save_dir}' and no documents to build one from.")
+
     chunk_sizes = chunk_sizes or [2048, 512, 128]
     node_parser = HierarchicalNodeParser.from_defaults(chunk_sizes=chunk_sizes)
-    nodes = node_parser.get_nodes_from_documents(documents)
+    nodes = parse_nodes(documents, node_parser)
     leaf_nodes = get_leaf_nodes(nodes)
-    merging_context = ServiceContext.from_defaults(llm=llm, embed_model=embed_model)
     storage_context = StorageContext.from_defaults()
     storage_context.docstore.add_documents(nodes)
 
-    if not os.path.exists(save_dir):
-        automerging_index = VectorStoreIndex(leaf_nodes, storage_context=storage_context, service_context=merging_context)
-        automerging_index.storage_context.persist(persist_dir=save_dir)
-    else:
-        automerging_index = load_index_from_storage(
-            StorageContext.from_defaults(persist_dir=save_dir), service_context=merging_context
-        )
+    automerging_index = VectorStoreIndex(leaf_nodes, storage_context=storage_context, service_context=merging_context)
+    automerging_index.storage_context.persist(persist_dir=save_dir)
 
     return automerging_index
 
 def get_automerging_query_engine(automerging_index, similarity_top_k=12, rerank_top_n=2):
     base_retriever = automerging_index.as_retriever(similarity_top_k=similarity_top_k)
     retriever = AutoMergingRetriever(base_retriever, automerging_index.storage_context, verbose=True)
-    rerank = SentenceTransformerRerank(top_n=rerank_top_n, model="BAAI/bge-reranker-base")
+    # Cross-encoder weights are loaded once per process and shared by every engine
+    rerank = SharedRerank(top_n=rerank_top_n, model="BAAI/bge-reranker-base")
 
     return RetrieverQueryEngine.from_args(retriever, node_postprocessors=[rerank])
@@ -0,0 +1,119 @@
+"""
+Warm-up of the Ollama models and the most-clicked questions.
+
+The suggested-question buttons and the FAQ entries are where most sessions
+start. At service start, a background thread loads llama3 and
+mxbai-embed-large (kept loaded by the pipeline's keep_alive), embeds those
+questions in one batch and generates any answer missing from the answer
+cache, at each detail level in WARM_DETAIL_LEVELS (only the default level
+unless configured; answers are cached per level). A click on them at one of
+those levels is then a cache hit with a precomputed embedding, with no model
+load; at other levels the first click generates the answer. The thread then checks every REFRESH_INTERVAL seconds whether
+the saved index changed (e.g. after `python ingest.py`). If it did, the
+pipeline reloads the index, which drops the stale cached answers, and the
+questions are answered again. Answers evicted from the cache in the meantime
+are regenerated too.
+"""
+
+import os
+import threading
+import time
+
+from metrics import metrics
+from retrieval_depth import DEFAULT_DETAIL, detail_level, detail_variant
+
+SUGGESTED_QUESTIONS = [
+    "How will temperature change in India by 2050?",
+    "Which regions are most vulnerable to climate change?",
+    "What are adaptation strategies for agriculture?",
+]
+FAQ_QUESTIONS = [
+    "What are the main climate change threats facing India?",
+    "How will climate change affect agriculture in India?",
+    "What adaptation strategies are being implemented?",
+    "How will climate change affect India's water resources?",
+    "What can individuals do to help address climate change?",
+]
+WARM_QUESTIONS = SUGGESTED_QUESTIONS + FAQ_QUESTIONS
+# Detail levels answered ahead of time, e.g. WARM_DETAIL_LEVELS=1,3; each level is one more llama3 answer per question
+WARM_DETAIL_LEVELS = sorted(
+    {detail_level(level) for level in os.environ.get("WARM_DETAIL_LEVELS", str(DEFAULT_DETAIL)).split(",")}
+)
+
+REFRESH_INTERVAL = 300  # seconds between index-change checks
+
+
+def warm_models(rag):
+    # One embedding and one short generation make Ollama load both models
+    with metrics.timer("warmup_models"):
+        rag.query_embed_model.embed_query("warm-up")
+        rag.condenser.llm.invoke("Reply with OK.")
+
+
+def warm_answers(rag, questions=WARM_QUESTIONS, detail_levels=WARM_DETAIL_LEVELS):
+    # Precompute the questions' embeddings and the answers missing from the cache at each detail level;
+    # returns how many were generated
+    missing = [q for q in questions if q not in rag.query_embeddings]
+    if missing:
+        rag.query_embeddings.update(zip(missing, rag.embed_queries(missing)))
+    generated = 0
+    for level in detail_levels:
+        for question in questions:
+            embedding = rag.query_embeddings[question]
+            if rag.answer_cache.contains(embedding, detail_variant(level)):
+                continue
+            # One generation at a time, so warm-up never takes more than one llama3 slot from users
+            for _ in rag.generate_answer(question, embedding, {"detail": level}):
+                pass
+            generated += 1
+    return generated
+
+
+class Warmup:
+    def __init__(self, rag, questions=WARM_QUESTIONS, interval=REFRESH_INTERVAL, detail_levels=WARM_DETAIL_LEVELS):
+        self.rag = rag
+        self.questions = list(questions)
+        self.detail_levels = list(detail_levels)
+        self.interval = interval
+        self.status = {"state": "pending", "answers_generated": 0, "index_reloads": 0, "last_run": None, "error": None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        if self.rag.index_changed():
+            print("Index changed on disk, reloading it.")
+            self.rag.reload_index()
+            self.status["index_reloads"] += 1
+        generated = warm_answers(self.rag, self.questions, self.detail_levels)
+        self.status["answers_generated"] += generated
+        self.status["last_run"] = time.time()
+        if generated:
+            print(f"Warm-up: generated {generated} of {len(self.questions) * len(self.detail_levels)} precomputed answers.")
+
+    def _run(self):
+        start = time.perf_counter()
+        self.status["state"] = "warming"
+        try:
+            warm_models(self.rag)
+            self.run_once()
+            self.status["state"] = "ready"
+            print(f"Warm-up finished in {time.perf_counter() - start:.1f}s.")
+        except Exception as e:
+            # The service works without it, just with a slower first request
+            self.status.update(state="failed", error=str(e))
+            print(f"Warm-up failed ({e}).")
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+                self.status.update(state="ready", error=None)
+            except Exception as e:
+                self.status["error"] = str(e)
+                print(f"Warm-up refresh failed ({e}).")